@@ -1,6 +1,7 @@
 # bright_project/celery.py
 import os
 from celery import Celery
+from celery.signals import task_postrun, task_prerun, worker_init, worker_process_init
 
 # Set the default Django settings module for the 'celery' program.
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'bright_project.settings')
@@ -19,4 +20,44 @@ app.autodiscover_tasks()
 
 @app.task(bind=True, ignore_result=True)
 def debug_task(self):
-    print(f'Request: {self.request!r}')
\ No newline at end of file
+    print(f'Request: {self.request!r}')
+
+
+@worker_init.connect
+@worker_process_init.connect
+def configure_worker_database(**kwargs):
+    """
+        applies the worker-specific connection settings before tasks touch the database: in the worker itself
+        (gevent/threads/solo pools) and again in each prefork child, dropping connections or a pool inherited
+        through fork.
+    """
+    from django.conf import settings
+    from django.db import connections
+
+    for connection in connections.all(initialized_only=True):
+        connection.close()
+        if hasattr(connection, 'close_pool'):
+            connection.close_pool()
+
+    database = connections['default'].settings_dict
+    if settings.CELERY_WORKER_DB_POOL:
+        database['OPTIONS']['pool'] = settings.CELERY_WORKER_DB_POOL
+        database['CONN_MAX_AGE'] = 0
+    else:
+        database['OPTIONS'].pop('pool', None)
+        database['CONN_MAX_AGE'] = settings.CELERY_WORKER_DB_CONN_MAX_AGE
+
+
+@task_prerun.connect
+def start_task_metrics(task_id=None, task=None, **kwargs):
+    from credit_service.metrics import start_task
+    start_task(task_id, task.name)
+
+
+@task_postrun.connect
+def finish_task_metrics(task_id=None, task=None, state=None, **kwargs):
+    """
+        records wall time and queries of every task (credit_service.metrics) and logs them as one JSON line.
+    """
+    from credit_service.metrics import finish_task
+    finish_task(task_id, task.name, state)
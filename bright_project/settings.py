@@ -10,6 +10,8 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
+from celery.schedules import crontab
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -41,6 +43,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'credit_service.middleware.RequestMetricsMiddleware', # first, so it times the whole stack
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -68,19 +71,182 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'bright_project.wsgi.application'
+ASGI_APPLICATION = 'bright_project.asgi.application'
+
+# Serve the read endpoints (get-statement) with their native async views. Opt-in, also under ASGI: with Django 5.2
+# the ORM and the stock middleware still hop to a single sync thread, and `benchmark asgi` shows lower throughput
+# than the sync view on threads. Only enable it after measuring your deployment; never under WSGI, where every
+# async view runs through its own event loop.
+ASYNC_READ_VIEWS = os.environ.get('ASYNC_READ_VIEWS', '0') == '1'
 
 
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# DB_ENGINE=postgresql switches to PostgreSQL (DB_NAME, DB_USER, DB_PASSWORD, DB_HOST, DB_PORT).
+# Connections are kept for DB_CONN_MAX_AGE seconds. With psycopg 3 installed, DB_POOL_MAX_SIZE > 0 uses
+# Django's connection pool instead (persistent connections and the pool are mutually exclusive).
+# SQLite (local runs) uses WAL and takes the write lock when a transaction starts, so concurrent writers wait
+# up to DB_SQLITE_TIMEOUT seconds instead of failing with "database is locked"; DB_SQLITE_TUNED=0 turns that off.
+
+DB_ENGINE = os.environ.get('DB_ENGINE', 'sqlite')
+DB_CONN_MAX_AGE = int(os.environ.get('DB_CONN_MAX_AGE', '60'))
+DB_POOL_MIN_SIZE = int(os.environ.get('DB_POOL_MIN_SIZE', '2'))
+DB_POOL_MAX_SIZE = int(os.environ.get('DB_POOL_MAX_SIZE', '0'))
+DB_POOL_TIMEOUT = int(os.environ.get('DB_POOL_TIMEOUT', '10'))
+
+
+def _database_pool_options(min_size, max_size):
+    if DB_ENGINE != 'postgresql' or max_size <= 0:
+        return None
+    try:
+        import psycopg_pool # noqa: F401 (psycopg 3 only, psycopg2 has no pool support in Django)
+    except ImportError:
+        return None
+    return {'min_size': min(min_size, max_size), 'max_size': max_size, 'timeout': DB_POOL_TIMEOUT}
+
+
+if DB_ENGINE == 'postgresql':
+    DB_POOL = _database_pool_options(DB_POOL_MIN_SIZE, DB_POOL_MAX_SIZE)
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('DB_NAME', 'loan_app'),
+            'USER': os.environ.get('DB_USER', 'postgres'),
+            'PASSWORD': os.environ.get('DB_PASSWORD', ''),
+            'HOST': os.environ.get('DB_HOST', 'localhost'),
+            'PORT': os.environ.get('DB_PORT', '5432'),
+            'CONN_MAX_AGE': 0 if DB_POOL else DB_CONN_MAX_AGE,
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {'pool': DB_POOL} if DB_POOL else {},
+        }
+    }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ.get('DB_NAME', BASE_DIR / 'db.sqlite3'),
+            'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+            'OPTIONS': {
+                'timeout': int(os.environ.get('DB_SQLITE_TIMEOUT', '20')),
+                'init_command': 'PRAGMA journal_mode=WAL; PRAGMA synchronous=NORMAL;',
+                'transaction_mode': 'IMMEDIATE',
+            } if os.environ.get('DB_SQLITE_TUNED', '1') == '1' else {},
+        }
     }
+
+# Celery workers size their own connections (see bright_project/celery.py): a prefork worker runs one task at
+# a time per process, so it needs far fewer pooled connections than a threaded web process.
+CELERY_WORKER_DB_CONN_MAX_AGE = int(os.environ.get('CELERY_WORKER_DB_CONN_MAX_AGE', str(DB_CONN_MAX_AGE)))
+CELERY_WORKER_DB_POOL = _database_pool_options(1, int(os.environ.get('CELERY_WORKER_DB_POOL_MAX_SIZE', '2')))
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# Statements are cached per loan in process memory (LRU + TTL) unless STATEMENT_CACHE_REDIS_URL is set.
+# Local memory is per process: with several web workers or billing running elsewhere, use Redis so that
+# payments and billing invalidate every copy instead of waiting for the TTL.
+
+STATEMENT_CACHE_ALIAS = 'statements'
+STATEMENT_CACHE_REDIS_URL = os.environ.get('STATEMENT_CACHE_REDIS_URL')
+
+# Recently used payment idempotency keys, so client retries are answered without locking the loan.
+# The unique index on Payment.idempotency_key stays the source of truth when an entry is missing.
+IDEMPOTENCY_CACHE_ALIAS = 'idempotency'
+IDEMPOTENCY_CACHE_REDIS_URL = os.environ.get('IDEMPOTENCY_CACHE_REDIS_URL')
+
+# Credit data lookups (credit_service.credit_data) are cached per AADHARID, AADHARIDs without transactions for a
+# shorter time. Local memory unless CREDIT_DATA_CACHE_REDIS_URL is set; CREDIT_DATA_CACHE_TTL=0 disables the cache.
+CREDIT_DATA_CACHE_ALIAS = 'credit_data'
+CREDIT_DATA_CACHE_REDIS_URL = os.environ.get('CREDIT_DATA_CACHE_REDIS_URL')
+CREDIT_DATA_CACHE_TTL = int(os.environ.get('CREDIT_DATA_CACHE_TTL', '3600'))
+CREDIT_DATA_NEGATIVE_CACHE_TTL = int(os.environ.get('CREDIT_DATA_NEGATIVE_CACHE_TTL', '300'))
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    STATEMENT_CACHE_ALIAS: {
+        'BACKEND': (
+            'django.core.cache.backends.redis.RedisCache' if STATEMENT_CACHE_REDIS_URL
+            else 'django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': STATEMENT_CACHE_REDIS_URL or 'statements',
+        'TIMEOUT': int(os.environ.get('STATEMENT_CACHE_TTL', '300')),
+        'OPTIONS': {} if STATEMENT_CACHE_REDIS_URL else {
+            'MAX_ENTRIES': int(os.environ.get('STATEMENT_CACHE_MAX_ENTRIES', '10000')),
+        },
+    },
+    IDEMPOTENCY_CACHE_ALIAS: {
+        'BACKEND': (
+            'django.core.cache.backends.redis.RedisCache' if IDEMPOTENCY_CACHE_REDIS_URL
+            else 'django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': IDEMPOTENCY_CACHE_REDIS_URL or 'idempotency',
+        'TIMEOUT': int(os.environ.get('IDEMPOTENCY_KEY_TTL', '600')),
+        'OPTIONS': {} if IDEMPOTENCY_CACHE_REDIS_URL else {
+            'MAX_ENTRIES': int(os.environ.get('IDEMPOTENCY_CACHE_MAX_ENTRIES', '10000')),
+        },
+    },
+    CREDIT_DATA_CACHE_ALIAS: {
+        'BACKEND': (
+            'django.core.cache.backends.redis.RedisCache' if CREDIT_DATA_CACHE_REDIS_URL
+            else 'django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': CREDIT_DATA_CACHE_REDIS_URL or 'credit_data',
+        'TIMEOUT': CREDIT_DATA_CACHE_TTL,
+        'OPTIONS': {} if CREDIT_DATA_CACHE_REDIS_URL else {
+            'MAX_ENTRIES': int(os.environ.get('CREDIT_DATA_CACHE_MAX_ENTRIES', '100000')),
+        },
+    },
 }
 
 
+# Credit score data source (credit_service.credit_data): 'table' reads the per-AADHARID totals table kept up to date
+# from transactions.csv, 'csv' scans the csv, 'http' asks a bureau-like service at CREDIT_DATA_HTTP_URL
+# (GET <url>/<aadhar_id>). HTTP lookups time out after CREDIT_DATA_TIMEOUT seconds, batches are fanned out over
+# CREDIT_DATA_WORKERS threads, and after CREDIT_DATA_BREAKER_FAILURES consecutive failures the service is not
+# called for CREDIT_DATA_BREAKER_RESET seconds, so a slow bureau cannot hold every Celery worker.
+CREDIT_DATA_SOURCE = os.environ.get('CREDIT_DATA_SOURCE', 'table')
+CREDIT_DATA_HTTP_URL = os.environ.get('CREDIT_DATA_HTTP_URL', '')
+CREDIT_DATA_HTTP_TOKEN = os.environ.get('CREDIT_DATA_HTTP_TOKEN')
+CREDIT_DATA_TIMEOUT = float(os.environ.get('CREDIT_DATA_TIMEOUT', '2'))
+CREDIT_DATA_BATCH_TIMEOUT = float(os.environ.get('CREDIT_DATA_BATCH_TIMEOUT', '60'))
+CREDIT_DATA_WORKERS = int(os.environ.get('CREDIT_DATA_WORKERS', '8'))
+CREDIT_DATA_BREAKER_FAILURES = int(os.environ.get('CREDIT_DATA_BREAKER_FAILURES', '5'))
+CREDIT_DATA_BREAKER_RESET = float(os.environ.get('CREDIT_DATA_BREAKER_RESET', '30'))
+
+
+# Loan quotes: price long offer lists for /api/quote-loans/ in a process pool (0 = in the request thread).
+LOAN_QUOTE_WORKERS = int(os.environ.get('LOAN_QUOTE_WORKERS', '0'))
+LOAN_QUOTE_POOL_MIN_OFFERS = int(os.environ.get('LOAN_QUOTE_POOL_MIN_OFFERS', '20'))
+
+
+# Metrics (credit_service.metrics): every request and Celery task is timed; a METRICS_SAMPLE_RATE share of the
+# requests and of the calls to the EMI/credit score functions is also measured in detail (queries, JSON log line).
+# Metrics are per process, served in Prometheus format at /api/metrics/ to scrapers sending
+# `Authorization: Bearer <METRICS_TOKEN>` or connecting from METRICS_ALLOWED_IPS; with neither set it answers 403.
+# Behind a reverse proxy every REMOTE_ADDR is the proxy's, so use the token there and leave the IP list empty.
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', '1') == '1'
+METRICS_SAMPLE_RATE = float(os.environ.get('METRICS_SAMPLE_RATE', '0.05'))
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+METRICS_ALLOWED_IPS = [ip for ip in os.environ.get('METRICS_ALLOWED_IPS', '').split(',') if ip]
+
+
+# Credit score CSV scans (credit_service.utils.calculate_credit_score): read transactions.csv through mmap
+# instead of buffered reads. Mostly helps when the file is already in the page cache.
+CREDIT_SCORE_CSV_MMAP = os.environ.get('CREDIT_SCORE_CSV_MMAP', '0') == '1'
+
+
+# Columnar snapshot of transactions.csv (manage.py build_transaction_snapshot, needs NumPy). Bulk scoring reads it
+# instead of the csv while the csv is unchanged since the snapshot was built.
+TRANSACTION_SNAPSHOT_PATH = os.environ.get('TRANSACTION_SNAPSHOT_PATH', os.path.join(BASE_DIR, 'data', 'transactions.snapshot'))
+
+
+# EMI schedule templates memoized per (amount, rate, term), see credit_service.utils.emi_schedule_cache_info().
+EMI_TEMPLATE_CACHE_SIZE = int(os.environ.get('EMI_TEMPLATE_CACHE_SIZE', '256'))
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -130,4 +296,33 @@ CELERY_RESULT_BACKEND = 'redis://localhost:6379/0'
 CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
-CELERY_TIMEZONE = 'Asia/Kolkata' 
\ No newline at end of file
+CELERY_TIMEZONE = 'Asia/Kolkata' 
+CELERY_BEAT_SCHEDULE = {
+    'sweep-overdue-bills': {
+        'task': 'credit_service.tasks.sweep_overdue_bills_task',
+        'schedule': crontab(hour=0, minute=30),
+    },
+    'relay-score-outbox': {
+        'task': 'credit_service.tasks.relay_score_outbox_task',
+        'schedule': float(os.environ.get('SCORE_OUTBOX_RELAY_INTERVAL', '30')),
+    },
+    'score-pending-users': {
+        'task': 'credit_service.tasks.bulk_update_credit_scores',
+        'schedule': float(os.environ.get('SCORE_PENDING_SWEEP_INTERVAL', '300')),
+        'kwargs': {'pending_only': True},
+    },
+}
+
+
+# Score task outbox (credit_service.score_outbox): registration queues the user in a table and returns without
+# calling the broker. Once the transaction commits, a background thread of the web process waits
+# SCORE_OUTBOX_COALESCE_SECONDS and sends the waiting users as bulk_update_credit_scores tasks,
+# SCORE_OUTBOX_BATCH_SIZE per task. Celery beat relays whatever is left (broker down, process restarted), and
+# every SCORE_PENDING_SWEEP_INTERVAL seconds scores the users still without a score (their task failed).
+SCORE_OUTBOX_BATCH_SIZE = int(os.environ.get('SCORE_OUTBOX_BATCH_SIZE', '500'))
+SCORE_OUTBOX_COALESCE_SECONDS = float(os.environ.get('SCORE_OUTBOX_COALESCE_SECONDS', '0.2'))
+SCORE_OUTBOX_RELAY_THREAD = os.environ.get('SCORE_OUTBOX_RELAY_THREAD', '1') == '1'
+
+
+# Overdue sweep: flat fee added to a bill's min due when it becomes overdue (0 = no late fees).
+LATE_FEE_AMOUNT = os.environ.get('LATE_FEE_AMOUNT', '0.00')
\ No newline at end of file
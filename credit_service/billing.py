@@ -0,0 +1,260 @@
+
+import logging
+from dataclasses import dataclass
+from datetime import timedelta
+from decimal import Decimal, ROUND_HALF_UP
+from django.db import transaction
+from django.db.models import F, Max
+from django.db.models.functions import Mod
+from .models import Loan, Bill, BILLING_CYCLE_DAYS
+from .loan_summaries import SUMMARY_FIELDS, refresh_unsummarized_loans
+from .statement_cache import invalidate_statements
+
+logger = logging.getLogger(__name__)
+
+TWOPLACES = Decimal('0.01')
+BILL_DUE_DAYS = 15
+PRINCIPAL_PERCENTAGE = Decimal('0.03')
+BILLING_CHUNK_SIZE = 500
+
+
+@dataclass
+class BillingResult:
+    billed: int = 0
+    skipped: int = 0
+    errors: int = 0
+
+    def __iadd__(self, other):
+        self.billed += other.billed
+        self.skipped += other.skipped
+        self.errors += other.errors
+        return self
+
+
+def calculate_bill_amounts(principal_balance: Decimal, interest_rate: Decimal):
+    """
+        returns (principal_component, interest_component, min_due) for one 30-day cycle:
+        3% of the principal plus 30 days of interest on it.
+    """
+    daily_rate = interest_rate / Decimal('36500')
+    interest_for_cycle = (principal_balance * daily_rate * BILLING_CYCLE_DAYS).quantize(TWOPLACES, rounding=ROUND_HALF_UP)
+
+    principal_component_raw = principal_balance * PRINCIPAL_PERCENTAGE
+    if principal_component_raw >= principal_balance:
+        principal_component = principal_balance
+    else:
+        principal_component = principal_component_raw.quantize(TWOPLACES, rounding=ROUND_HALF_UP)
+
+    min_due = (principal_component + interest_for_cycle).quantize(TWOPLACES, rounding=ROUND_HALF_UP)
+    return principal_component, interest_for_cycle, min_due
+
+
+def billable_loans():
+    # active and still has a balance
+    return Loan.objects.filter(
+        status=Loan.LOAN_STATUS_CHOICES[1][0],
+        principal_balance__gt=Decimal('0.00')
+    )
+
+
+def loans_due_on(billing_date):
+    """
+        active loans whose next 30-day cycle ends on `billing_date` (one cycle after the last bill, or after
+        disbursement if never billed), read from the loan's maintained next_billing_date.
+    """
+    return billable_loans().filter(next_billing_date=billing_date)
+
+
+def billed_loan_summary(loan_pk, billing_dates, min_due, outstanding_bill_count, outstanding_amount) -> Loan:
+    """
+        unsaved Loan carrying the summary fields after new bills on `billing_dates` (ascending), for bulk_update.
+    """
+    return Loan(
+        id=loan_pk,
+        last_billing_date=billing_dates[-1],
+        next_billing_date=billing_dates[-1] + timedelta(days=BILLING_CYCLE_DAYS),
+        outstanding_bill_count=outstanding_bill_count + len(billing_dates),
+        outstanding_amount=outstanding_amount + min_due * len(billing_dates),
+    )
+
+
+def shard_of(queryset, shard: int, shards: int):
+    """
+        restricts a loan queryset to one of `shards` disjoint partitions (loan pk modulo shards).
+    """
+    if shards <= 1:
+        return queryset
+    return queryset.annotate(billing_shard=Mod(F('id'), shards)).filter(billing_shard=shard)
+
+
+def bill_loans(loan_ids, billing_date) -> BillingResult:
+    """
+        creates the bills for one chunk of loans in a single transaction, re-reading the balances under a row lock.
+        loans that already have a bill for `billing_date` are skipped, so re-running a chunk never duplicates bills.
+    """
+    result = BillingResult()
+    due_date = billing_date + timedelta(days=BILL_DUE_DAYS)
+
+    with transaction.atomic():
+        locked_loans = Loan.objects.select_for_update().filter(
+            id__in=loan_ids, status=Loan.LOAN_STATUS_CHOICES[1][0]
+        ).values_list('id', 'loan_id', 'principal_balance', 'interest_rate', 'outstanding_bill_count', 'outstanding_amount')
+        already_billed = set(Bill.objects.filter(
+            loan_id__in=loan_ids, billing_date=billing_date
+        ).values_list('loan_id', flat=True))
+
+        new_bills = []
+        billed_loan_ids = []
+        billed_loans = []
+        for loan_pk, loan_uuid, principal_balance, interest_rate, outstanding_bill_count, outstanding_amount in locked_loans:
+            if principal_balance <= Decimal('0.00') or loan_pk in already_billed:
+                continue # balance became zero or another run billed it first
+            billed_loan_ids.append(loan_uuid)
+
+            principal_component, interest_component, min_due = calculate_bill_amounts(principal_balance, interest_rate)
+            billed_loans.append(billed_loan_summary(loan_pk, [billing_date], min_due, outstanding_bill_count, outstanding_amount))
+            new_bills.append(Bill(
+                loan_id=loan_pk,
+                billing_date=billing_date,
+                due_date=due_date,
+                principal_component=principal_component,
+                interest_component=interest_component,
+                min_due_amount=min_due,
+                status=Bill.BILL_STATUS_CHOICES[0][0] # pending
+            ))
+
+        Bill.objects.bulk_create(new_bills)
+        Loan.objects.bulk_update(billed_loans, SUMMARY_FIELDS)
+        invalidate_statements(billed_loan_ids)
+        result.billed = len(new_bills)
+        result.skipped = len(loan_ids) - len(new_bills) # closed, paid off or billed since selection
+
+    return result
+
+
+def run_billing(billing_date, chunk_size: int = BILLING_CHUNK_SIZE, progress=None,
+                shard: int = 0, shards: int = 1) -> BillingResult:
+    """
+        bills every loan due on `billing_date` (optionally only one shard of them) in chunked transactions.
+        `progress(result, processed, total)` is called after each chunk.
+    """
+    refresh_unsummarized_loans() # loans without a next_billing_date would never be selected
+    due_loans = shard_of(loans_due_on(billing_date), shard, shards)
+    due_loan_ids = list(due_loans.order_by('id').values_list('id', flat=True))
+    result = BillingResult()
+
+    for i in range(0, len(due_loan_ids), chunk_size):
+        chunk = due_loan_ids[i:i + chunk_size]
+        try:
+            result += bill_loans(chunk, billing_date)
+        except Exception as e:
+            logger.error(f"Error billing loans {chunk[0]}..{chunk[-1]} for {billing_date}: {e}", exc_info=True)
+            result.errors += len(chunk)
+
+        if progress:
+            progress(result, i + len(chunk), len(due_loan_ids))
+
+    return result
+
+
+def run_billing_shard(billing_date, shard: int, shards: int, chunk_size: int = BILLING_CHUNK_SIZE) -> BillingResult:
+    """
+        entry point for one shard of a parallel run (process pool or celery worker).
+    """
+    def progress(result, processed, total):
+        logger.info(f"Billing shard {shard + 1}/{shards} for {billing_date}: {processed}/{total} due loans processed, {result.billed} billed.")
+
+    logger.info(f"Starting billing shard {shard + 1}/{shards} for {billing_date}.")
+    result = run_billing(billing_date, chunk_size=chunk_size, progress=progress, shard=shard, shards=shards)
+    logger.info(f"Finished billing shard {shard + 1}/{shards} for {billing_date}: {result}")
+    return result
+
+
+def missed_billing_dates(anchor_date, start_date, end_date):
+    """
+        successive 30-day cycle ends after `anchor_date` (last bill or disbursement) that fall in [start_date, end_date].
+    """
+    billing_date = anchor_date + timedelta(days=BILLING_CYCLE_DAYS)
+    while billing_date <= end_date:
+        if billing_date >= start_date:
+            yield billing_date
+        billing_date += timedelta(days=BILLING_CYCLE_DAYS)
+
+
+def backfill_loans(loan_ids, start_date, end_date, dry_run: bool = False) -> BillingResult:
+    """
+        creates every missed bill between start_date and end_date for one chunk of loans. all cycles of a loan are
+        derived in memory from its last bill, since billing itself never changes the principal balance.
+    """
+    result = BillingResult()
+
+    with transaction.atomic():
+        loans = Loan.objects.filter(id__in=loan_ids, status=Loan.LOAN_STATUS_CHOICES[1][0])
+        if not dry_run:
+            loans = loans.select_for_update()
+        loans = list(loans.values_list(
+            'id', 'loan_id', 'principal_balance', 'interest_rate', 'disbursement_date', 'outstanding_bill_count', 'outstanding_amount'
+        ))
+        last_billing_dates = dict(
+            Bill.objects.filter(loan_id__in=loan_ids).values('loan_id').annotate(
+                last_billing_date=Max('billing_date')
+            ).values_list('loan_id', 'last_billing_date')
+        )
+
+        new_bills = []
+        billed_loan_ids = []
+        billed_loans = []
+        for loan_pk, loan_uuid, principal_balance, interest_rate, disbursement_date, outstanding_bill_count, outstanding_amount in loans:
+            if principal_balance <= Decimal('0.00'):
+                continue
+            anchor_date = last_billing_dates.get(loan_pk) or disbursement_date
+            principal_component, interest_component, min_due = calculate_bill_amounts(principal_balance, interest_rate)
+            billing_dates = list(missed_billing_dates(anchor_date, start_date, end_date))
+            if billing_dates:
+                billed_loans.append(billed_loan_summary(loan_pk, billing_dates, min_due, outstanding_bill_count, outstanding_amount))
+            for billing_date in billing_dates:
+                billed_loan_ids.append(loan_uuid)
+                new_bills.append(Bill(
+                    loan_id=loan_pk,
+                    billing_date=billing_date,
+                    due_date=billing_date + timedelta(days=BILL_DUE_DAYS),
+                    principal_component=principal_component,
+                    interest_component=interest_component,
+                    min_due_amount=min_due,
+                    status=Bill.BILL_STATUS_CHOICES[0][0] # pending
+                ))
+
+        if not dry_run:
+            Bill.objects.bulk_create(new_bills)
+            Loan.objects.bulk_update(billed_loans, SUMMARY_FIELDS)
+            invalidate_statements(set(billed_loan_ids))
+        result.billed = len(new_bills)
+        result.skipped = len(loan_ids) - len({bill.loan_id for bill in new_bills})
+
+    return result
+
+
+def run_backfill(start_date, end_date, chunk_size: int = BILLING_CHUNK_SIZE, dry_run: bool = False,
+                 progress=None) -> BillingResult:
+    """
+        catch-up billing: bills every cycle that ended between start_date and end_date without a bill,
+        e.g. after the daily run was missed. with dry_run nothing is written and `billed` is the would-be count.
+    """
+    refresh_unsummarized_loans()
+    candidate_ids = list(billable_loans().filter(
+        next_billing_date__lte=end_date
+    ).order_by('id').values_list('id', flat=True))
+    result = BillingResult()
+
+    for i in range(0, len(candidate_ids), chunk_size):
+        chunk = candidate_ids[i:i + chunk_size]
+        try:
+            result += backfill_loans(chunk, start_date, end_date, dry_run=dry_run)
+        except Exception as e:
+            logger.error(f"Error backfilling loans {chunk[0]}..{chunk[-1]} for {start_date}..{end_date}: {e}", exc_info=True)
+            result.errors += len(chunk)
+
+        if progress:
+            progress(result, i + len(chunk), len(candidate_ids))
+
+    return result
@@ -0,0 +1,275 @@
+
+import abc
+import json
+import threading
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor, wait
+from decimal import Decimal, InvalidOperation
+from functools import lru_cache
+from urllib import error as urlerror, parse, request as urlrequest
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DatabaseError
+from .models import TransactionAggregate
+from .transaction_csv import read_transaction_totals, TransactionCSVError
+from .transaction_index import refresh_transaction_index, TransactionIndexError
+from .utils import CSV_FILE_PATH, credit_score_from_balance, MIN_CREDIT_SCORE
+
+logger = logging.getLogger(__name__)
+
+CREDIT_DATA_CACHE_ALIAS = getattr(settings, 'CREDIT_DATA_CACHE_ALIAS', 'credit_data')
+TABLE_LOOKUP_BATCH_SIZE = 1000
+NOT_FOUND = '-' # cached for AADHARIDs the source has no transactions for
+
+
+class CreditDataError(Exception):
+    pass
+
+
+class CreditDataUnavailable(CreditDataError):
+    """
+        the source could not answer (timeout, connection or server error, open circuit). nothing is cached.
+    """
+    pass
+
+
+class CreditDataSource(abc.ABC):
+    """
+        where the transaction history used for credit scores comes from. subclasses implement fetch_balances().
+    """
+    name = 'base'
+
+    @abc.abstractmethod
+    def fetch_balances(self, aadhar_ids: list) -> dict:
+        """
+            {aadhar_id: total credit - total debit} for the AADHARIDs the source has transactions for, missing
+            AADHARIDs are left out. raises CreditDataUnavailable when the source cannot answer.
+        """
+
+    def credit_scores(self, aadhar_ids) -> dict:
+        aadhar_ids = list(dict.fromkeys(aadhar_ids))
+        balances = self.fetch_balances(aadhar_ids) if aadhar_ids else {}
+        return {
+            aadhar_id: credit_score_from_balance(balances[aadhar_id]) if aadhar_id in balances else MIN_CREDIT_SCORE
+            for aadhar_id in aadhar_ids
+        }
+
+    def credit_score(self, aadhar_id: str) -> int:
+        return self.credit_scores([aadhar_id])[aadhar_id]
+
+
+class CSVCreditDataSource(CreditDataSource):
+    """
+        scans the transactions csv, once per call whatever the number of AADHARIDs.
+    """
+    name = 'csv'
+
+    def __init__(self, csv_path: str = CSV_FILE_PATH):
+        self.csv_path = csv_path
+
+    def fetch_balances(self, aadhar_ids: list) -> dict:
+        try:
+            totals, _ = read_transaction_totals(self.csv_path, aadhar_ids, use_mmap=settings.CREDIT_SCORE_CSV_MMAP)
+        except (OSError, TransactionCSVError) as e:
+            raise CreditDataUnavailable(f"Cannot read {self.csv_path}: {e}")
+        return {aadhar_id: credit - debit for aadhar_id, (credit, debit) in totals.items()}
+
+
+class TableCreditDataSource(CreditDataSource):
+    """
+        reads the per-AADHARID totals table (TransactionAggregate), refreshing it from the csv first unless
+        `csv_path` is None (the table is then fed by something else).
+    """
+    name = 'table'
+
+    def __init__(self, csv_path: str = CSV_FILE_PATH):
+        self.csv_path = csv_path
+
+    def fetch_balances(self, aadhar_ids: list) -> dict:
+        balances = {}
+        try:
+            if self.csv_path is not None:
+                refresh_transaction_index(self.csv_path)
+            for i in range(0, len(aadhar_ids), TABLE_LOOKUP_BATCH_SIZE):
+                rows = TransactionAggregate.objects.filter(aadhar_id__in=aadhar_ids[i:i + TABLE_LOOKUP_BATCH_SIZE])
+                for aadhar_id, credit, debit in rows.values_list('aadhar_id', 'total_credit', 'total_debit'):
+                    balances[aadhar_id] = credit - debit
+        except (OSError, TransactionIndexError, DatabaseError) as e:
+            raise CreditDataUnavailable(f"Transaction table unavailable: {e}")
+        return balances
+
+
+class CircuitBreaker:
+    """
+        opens after `failure_threshold` consecutive failures and then rejects calls for `reset_timeout` seconds,
+        so a down source fails fast instead of holding every worker for a full timeout. after that one call is let
+        through: success closes the circuit, failure opens it again.
+    """
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.opened_at = time.monotonic() # half open: this caller probes, the others keep failing fast
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.failures >= self.failure_threshold:
+                if self.opened_at is None:
+                    logger.warning(f"Credit data circuit opened after {self.failures} consecutive failures.")
+                self.opened_at = time.monotonic()
+
+
+class HTTPCreditDataSource(CreditDataSource):
+    """
+        bureau-like service answering GET <base_url>/<aadhar_id> with {"total_credit": "...", "total_debit": "..."},
+        404 when it has no transactions. batches are fanned out over a thread pool, each request has a timeout and
+        the whole batch a deadline.
+    """
+    name = 'http'
+
+    def __init__(self, base_url: str, timeout: float = 2.0, batch_timeout: float = 30.0, workers: int = 8,
+                 token: str = None, breaker: CircuitBreaker = None):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.batch_timeout = batch_timeout
+        self.workers = workers
+        self.token = token
+        self.breaker = breaker or CircuitBreaker(5, 30.0)
+
+    def _fetch(self, aadhar_id: str):
+        if not self.breaker.allow():
+            raise CreditDataUnavailable(f"Credit data service {self.base_url} is failing, circuit open.")
+
+        http_request = urlrequest.Request(f"{self.base_url}/{parse.quote(aadhar_id, safe='')}", headers={'Accept': 'application/json'})
+        if self.token:
+            http_request.add_header('Authorization', f"Bearer {self.token}")
+        try:
+            with urlrequest.urlopen(http_request, timeout=self.timeout) as response:
+                payload = json.loads(response.read())
+            balance = Decimal(str(payload['total_credit'])) - Decimal(str(payload['total_debit']))
+        except urlerror.HTTPError as e:
+            if e.code == 404:
+                self.breaker.record_success()
+                return None
+            self.breaker.record_failure()
+            raise CreditDataUnavailable(f"Credit data service returned {e.code} for {aadhar_id}.")
+        except (urlerror.URLError, OSError) as e: # includes timeouts
+            self.breaker.record_failure()
+            raise CreditDataUnavailable(f"Credit data service {self.base_url} unreachable: {e}")
+        except (ValueError, KeyError, TypeError, InvalidOperation) as e:
+            self.breaker.record_failure()
+            raise CreditDataUnavailable(f"Credit data service sent an invalid response for {aadhar_id}: {e}")
+
+        self.breaker.record_success()
+        return balance
+
+    def fetch_balances(self, aadhar_ids: list) -> dict:
+        if len(aadhar_ids) == 1:
+            balance = self._fetch(aadhar_ids[0])
+            return {} if balance is None else {aadhar_ids[0]: balance}
+
+        executor = ThreadPoolExecutor(max_workers=min(self.workers, len(aadhar_ids)))
+        try:
+            futures = {executor.submit(self._fetch, aadhar_id): aadhar_id for aadhar_id in aadhar_ids}
+            done, pending = wait(futures, timeout=self.batch_timeout)
+            if pending:
+                raise CreditDataUnavailable(f"Credit data service answered {len(done)} of {len(futures)} lookups within {self.batch_timeout}s.")
+            balances = {}
+            for future, aadhar_id in futures.items():
+                balance = future.result()
+                if balance is not None:
+                    balances[aadhar_id] = balance
+            return balances
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+class CachedCreditDataSource(CreditDataSource):
+    """
+        read-through cache in front of another source. balances are kept for `ttl` seconds, AADHARIDs the source
+        has no transactions for for `negative_ttl`. failures are not cached. when the cache itself fails, every
+        lookup goes to the source.
+    """
+    def __init__(self, source: CreditDataSource, ttl: int, negative_ttl: int, cache_alias: str = CREDIT_DATA_CACHE_ALIAS):
+        self.source = source
+        self.name = source.name
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.cache_alias = cache_alias
+
+    def _key(self, aadhar_id: str) -> str:
+        return f"credit-data:{self.source.name}:{aadhar_id}"
+
+    def fetch_balances(self, aadhar_ids: list) -> dict:
+        cache = caches[self.cache_alias]
+        try:
+            cached = cache.get_many([self._key(aadhar_id) for aadhar_id in aadhar_ids])
+        except Exception as e: # the cache backend is down: read through
+            logger.warning(f"Credit data cache unavailable, reading {len(aadhar_ids)} AADHARIDs from the {self.name} source: {e}")
+            cached = {}
+
+        balances = {}
+        missing = []
+        for aadhar_id in aadhar_ids:
+            value = cached.get(self._key(aadhar_id))
+            if value is None:
+                missing.append(aadhar_id)
+            elif value != NOT_FOUND:
+                balances[aadhar_id] = Decimal(value)
+        if not missing:
+            return balances
+
+        fetched = self.source.fetch_balances(missing)
+        balances.update(fetched)
+        try:
+            cache.set_many({self._key(aadhar_id): str(fetched[aadhar_id]) for aadhar_id in missing if aadhar_id in fetched}, self.ttl)
+            not_found = {self._key(aadhar_id): NOT_FOUND for aadhar_id in missing if aadhar_id not in fetched}
+            if not_found:
+                cache.set_many(not_found, self.negative_ttl)
+        except Exception as e:
+            logger.warning(f"Failed to cache the credit data of {len(missing)} AADHARIDs: {e}")
+        return balances
+
+
+@lru_cache(maxsize=None)
+def credit_data_source() -> CreditDataSource:
+    """
+        the source configured by CREDIT_DATA_SOURCE, behind the read-through cache. one instance per process so the
+        circuit breaker sees every call.
+    """
+    kind = settings.CREDIT_DATA_SOURCE
+    if kind == 'csv':
+        source = CSVCreditDataSource()
+    elif kind == 'table':
+        source = TableCreditDataSource()
+    elif kind == 'http':
+        if not settings.CREDIT_DATA_HTTP_URL:
+            raise CreditDataError("CREDIT_DATA_SOURCE is 'http' but CREDIT_DATA_HTTP_URL is not set.")
+        source = HTTPCreditDataSource(
+            settings.CREDIT_DATA_HTTP_URL, timeout=settings.CREDIT_DATA_TIMEOUT, batch_timeout=settings.CREDIT_DATA_BATCH_TIMEOUT,
+            workers=settings.CREDIT_DATA_WORKERS, token=settings.CREDIT_DATA_HTTP_TOKEN,
+            breaker=CircuitBreaker(settings.CREDIT_DATA_BREAKER_FAILURES, settings.CREDIT_DATA_BREAKER_RESET),
+        )
+    else:
+        raise CreditDataError(f"Unknown CREDIT_DATA_SOURCE {kind!r} (expected csv, table or http).")
+
+    if settings.CREDIT_DATA_CACHE_TTL <= 0:
+        return source
+    return CachedCreditDataSource(source, settings.CREDIT_DATA_CACHE_TTL, settings.CREDIT_DATA_NEGATIVE_CACHE_TTL)
@@ -0,0 +1,62 @@
+
+import logging
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from .models import Loan, Installment
+from .utils import build_emi_schedule, EMICalculationError
+
+logger = logging.getLogger(__name__)
+
+INSTALLMENT_CHUNK_SIZE = 200
+
+
+def installments_from_schedule(loan, schedule) -> list:
+    """
+        unsaved Installment rows for an EMI schedule (as returned by calculate_emi_schedule*), ready for bulk_create.
+    """
+    return [
+        Installment(
+            loan=loan,
+            installment_number=number,
+            due_date=item['due_date'],
+            amount_due=item['amount_due'],
+            principal_component=item['principal_component'],
+            interest_component=item['interest_component']
+        )
+        for number, item in enumerate(schedule, start=1)
+    ]
+
+
+def backfill_installments(chunk_size: int = INSTALLMENT_CHUNK_SIZE, progress=None):
+    """
+        writes the EMI schedule of every loan that has none yet, one transaction and bulk_create per chunk of loans.
+        returns (loans backfilled, installments created, loans whose terms no longer yield a schedule).
+    """
+    without_schedule = ~Exists(Installment.objects.filter(loan=OuterRef('pk')))
+    loan_ids = list(Loan.objects.filter(without_schedule).order_by('id').values_list('id', flat=True))
+    backfilled = created = rejected = 0
+
+    for i in range(0, len(loan_ids), chunk_size):
+        chunk = loan_ids[i:i + chunk_size]
+        with transaction.atomic():
+            # re-checked inside the transaction so concurrent runs don't write a schedule twice
+            loans = Loan.objects.select_for_update().filter(without_schedule, id__in=chunk).only(
+                'id', 'loan_amount', 'interest_rate', 'term_period', 'disbursement_date'
+            )
+            new_installments = []
+            for loan in loans:
+                try:
+                    schedule = build_emi_schedule(loan.loan_amount, loan.interest_rate, loan.term_period, loan.disbursement_date)
+                except EMICalculationError as e:
+                    logger.warning(f"No installment schedule for loan {loan.id}: {e}")
+                    rejected += 1
+                    continue
+                new_installments.extend(installments_from_schedule(loan, schedule))
+                backfilled += 1
+            Installment.objects.bulk_create(new_installments)
+            created += len(new_installments)
+
+        if progress:
+            progress(i + len(chunk), len(loan_ids))
+
+    return backfilled, created, rejected
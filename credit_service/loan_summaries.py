@@ -0,0 +1,107 @@
+
+import logging
+from datetime import timedelta
+from decimal import Decimal
+from django.db import transaction
+from django.db.models import Count, F, Max, Q, Sum
+from .models import Loan, Bill, BILLING_CYCLE_DAYS
+from .payments import OUTSTANDING_BILL_STATUSES
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_FIELDS = ['last_billing_date', 'next_billing_date', 'outstanding_bill_count', 'outstanding_amount']
+SUMMARY_CHUNK_SIZE = 1000
+
+
+def compute_loan_summaries(loans) -> dict:
+    """
+        recomputes the summary fields from the Bill rows for (pk, disbursement_date) pairs, with one grouped query.
+    """
+    loans = list(loans)
+    outstanding = Q(status__in=OUTSTANDING_BILL_STATUSES)
+    aggregates = {
+        row['loan_id']: row for row in Bill.objects.filter(loan_id__in=[pk for pk, _ in loans]).order_by().values('loan_id').annotate(
+            last_billing_date=Max('billing_date'),
+            outstanding_bill_count=Count('id', filter=outstanding),
+            outstanding_amount=Sum(F('min_due_amount') - F('amount_paid'), filter=outstanding),
+        )
+    }
+
+    summaries = {}
+    for pk, disbursement_date in loans:
+        row = aggregates.get(pk, {})
+        last_billing_date = row.get('last_billing_date')
+        summaries[pk] = {
+            'last_billing_date': last_billing_date,
+            'next_billing_date': (last_billing_date or disbursement_date) + timedelta(days=BILLING_CYCLE_DAYS),
+            'outstanding_bill_count': row.get('outstanding_bill_count') or 0,
+            'outstanding_amount': row.get('outstanding_amount') or Decimal('0.00'),
+        }
+    return summaries
+
+
+def refresh_loan_summaries(loan_ids):
+    """
+        rewrites the summary fields of the given loans from their bills, e.g. after bills were written outside
+        billing and payments.
+    """
+    loans = list(Loan.objects.filter(id__in=loan_ids).only('id', 'disbursement_date'))
+    summaries = compute_loan_summaries((loan.pk, loan.disbursement_date) for loan in loans)
+    for loan in loans:
+        for field, value in summaries[loan.pk].items():
+            setattr(loan, field, value)
+    Loan.objects.bulk_update(loans, SUMMARY_FIELDS)
+
+
+def refresh_unsummarized_loans() -> int:
+    """
+        fills in the summary of loans that were written without one (loaddata, bulk_create leave
+        next_billing_date NULL), from their bills. returns the number of loans refreshed.
+    """
+    loan_ids = list(Loan.objects.filter(next_billing_date__isnull=True).order_by().values_list('id', flat=True))
+    for i in range(0, len(loan_ids), SUMMARY_CHUNK_SIZE):
+        refresh_loan_summaries(loan_ids[i:i + SUMMARY_CHUNK_SIZE])
+    if loan_ids:
+        logger.warning(f"Filled in the bill summary of {len(loan_ids)} loans that had none.")
+    return len(loan_ids)
+
+
+def check_loan_summaries(chunk_size: int = SUMMARY_CHUNK_SIZE, fix: bool = False, progress=None):
+    """
+        compares the stored summary of every loan with one recomputed from its bills, chunk by chunk.
+        returns (loans checked, loans drifted, drift count per field); with fix the drifted loans are rewritten.
+    """
+    loan_ids = list(Loan.objects.order_by('id').values_list('id', flat=True))
+    drifted = 0
+    drift_by_field = dict.fromkeys(SUMMARY_FIELDS, 0)
+
+    for i in range(0, len(loan_ids), chunk_size):
+        chunk = loan_ids[i:i + chunk_size]
+        with transaction.atomic():
+            loans = Loan.objects.filter(id__in=chunk)
+            if fix:
+                loans = loans.select_for_update() # billing and payments change these fields under the same lock
+            loans = list(loans.only('id', 'loan_id', 'disbursement_date', *SUMMARY_FIELDS))
+            expected = compute_loan_summaries((loan.pk, loan.disbursement_date) for loan in loans)
+
+            stale_loans = []
+            for loan in loans:
+                stale_fields = [field for field in SUMMARY_FIELDS if getattr(loan, field) != expected[loan.pk][field]]
+                if not stale_fields:
+                    continue
+                logger.warning(f"Loan {loan.loan_id} summary drifted: " + ", ".join(
+                    f"{field} {getattr(loan, field)} != {expected[loan.pk][field]}" for field in stale_fields
+                ))
+                drifted += 1
+                for field in stale_fields:
+                    drift_by_field[field] += 1
+                    setattr(loan, field, expected[loan.pk][field])
+                stale_loans.append(loan)
+
+            if fix:
+                Loan.objects.bulk_update(stale_loans, SUMMARY_FIELDS)
+
+        if progress:
+            progress(i + len(chunk), len(loan_ids))
+
+    return len(loan_ids), drifted, drift_by_field
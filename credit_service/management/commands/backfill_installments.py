@@ -0,0 +1,29 @@
+
+from django.core.management.base import BaseCommand
+from credit_service.installments import backfill_installments, INSTALLMENT_CHUNK_SIZE
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Writes the EMI installment schedule of existing loans that do not have one yet.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=INSTALLMENT_CHUNK_SIZE, help='Loans processed per transaction.')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        self.stdout.write("Backfilling installment schedules...")
+
+        def progress(processed, total):
+            self.stdout.write(f"{processed}/{total} loans processed.")
+
+        backfilled, created, rejected = backfill_installments(chunk_size=options['chunk_size'], progress=progress)
+
+        if rejected:
+            self.stdout.write(self.style.WARNING(f"{rejected} loans have terms that no longer produce a schedule - Check logs."))
+        self.stdout.write(self.style.SUCCESS(
+            f"Backfill finished. Loans: {backfilled}, Installments: {created} ({time.perf_counter() - started:.2f}s)."
+        ))
@@ -0,0 +1,516 @@
+
+from concurrent.futures import ThreadPoolExecutor
+from asgiref.sync import sync_to_async
+from datetime import date, timedelta
+from decimal import Decimal, InvalidOperation
+from django.conf import settings
+from django.core.cache import caches
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.backends.signals import connection_created
+from django.test import AsyncClient, Client
+from django.test.client import RequestFactory
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import clear_url_caches, reverse
+import credit_service.urls
+import django
+from credit_service.billing import run_billing
+from credit_service.loan_summaries import refresh_loan_summaries
+from credit_service.models import User, Loan, Bill, BILLING_CYCLE_DAYS
+from credit_service.statement_cache import STATEMENT_CACHE_ALIAS
+from credit_service.synthetic import generate_synthetic_data, synthetic_aadhar_ids, write_transactions_csv
+from credit_service.transaction_csv import read_transaction_totals
+from credit_service.transaction_index import refresh_transaction_index, indexed_credit_score
+from credit_service.utils import (
+    calculate_credit_score, calculate_emi_schedule, calculate_emi_schedule_fast, emi_schedule_cache_info, _emi_schedule_template
+)
+from credit_service.views import GetStatementView, build_statement, statement_rows
+import asyncio
+import csv
+import importlib
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import tempfile
+import threading
+import time
+
+
+def latency_stats(samples: list, queries: int = None, operations: int = None) -> dict:
+    """
+        throughput and mean/p50/p99 (milliseconds) of a list of per-call durations (seconds), plus queries per
+        operation when counted. `operations` is the work done by all calls together (default: one per call).
+    """
+    ordered = sorted(samples)
+    operations = operations if operations is not None else len(ordered)
+    total = sum(ordered)
+    return {
+        'n': operations,
+        'seconds': round(total, 6),
+        'throughput_per_s': round(operations / total, 3) if total else None,
+        'mean_ms': round(statistics.fmean(ordered) * 1000, 3),
+        'p50_ms': round(statistics.median(ordered) * 1000, 3),
+        'p99_ms': round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))] * 1000, 3),
+        'queries_per_op': round(queries / operations, 3) if queries is not None and operations else None,
+    }
+
+
+def latency_summary(samples: list) -> str:
+    """
+        formats a list of per-call durations (seconds) as mean/p50/p99 in milliseconds.
+    """
+    stats = latency_stats(samples)
+    return f"n={len(samples)} mean={stats['mean_ms']:.3f}ms p50={stats['p50_ms']:.3f}ms p99={stats['p99_ms']:.3f}ms"
+
+
+def measure(operation, inputs, operations=None) -> dict:
+    """
+        calls `operation` once per input, timing each call and counting its queries.
+    """
+    samples, queries = [], 0
+    for item in inputs:
+        connection.queries_log.clear() # the log is capped, a full one would count nothing
+        with CaptureQueriesContext(connection) as captured:
+            started = time.perf_counter()
+            operation(item)
+            samples.append(time.perf_counter() - started)
+        queries += len(captured)
+    return latency_stats(samples, queries, operations)
+
+
+def dictreader_totals(csv_path: str, aadhar_id: str):
+    """
+        the csv.DictReader scan calculate_credit_score used before read_transaction_totals, kept as the baseline.
+    """
+    total_credit, total_debit, rows = Decimal('0.00'), Decimal('0.00'), 0
+    with open(csv_path, mode='r', encoding='utf-8') as csvfile:
+        for row in csv.DictReader(csvfile):
+            rows += 1
+            if row.get('AADHARID') == aadhar_id:
+                try:
+                    amount = Decimal(row.get('Amount', '0'))
+                except (InvalidOperation, ValueError, TypeError):
+                    continue
+                transaction_type = row.get('Transaction_type', '').upper()
+                if transaction_type == 'CREDIT':
+                    total_credit += amount
+                elif transaction_type == 'DEBIT':
+                    total_debit += amount
+    return total_credit, total_debit, rows
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR, capture_output=True,
+                              text=True, timeout=5, check=True).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = 'Runs performance benchmarks against synthetic data (database changes are rolled back).'
+
+    SUITES = ('credit_score', 'csv_reader', 'statement', 'emi', 'load', 'asgi', 'all')
+
+    def add_arguments(self, parser):
+        parser.add_argument('suite', choices=self.SUITES, help='Benchmark suite to run.')
+        parser.add_argument('--rows', type=int, default=1_000_000, help='Synthetic transaction rows (default: 1,000,000).')
+        parser.add_argument('--users', type=int, default=10_000, help='Distinct AADHARIDs in the synthetic data.')
+        parser.add_argument('--sample', type=int, default=5, help='Calls measured on the slow (baseline) path.')
+        parser.add_argument('--bills', type=int, default=360, help='Bills on the benchmark loan (statement suite).')
+        parser.add_argument('--requests', type=int, default=500, help='Requests per measurement (statement and load suites).')
+        parser.add_argument('--threads', type=int, default=8, help='Concurrent request threads (load suite).')
+        parser.add_argument('--loans', type=int, default=20, help='Loans the load and asgi suites spread their requests over.')
+        parser.add_argument('--concurrency', type=int, default=64, help='Requests in flight on the event loop (asgi suite).')
+        parser.add_argument('--csv', dest='csv_path', default=None, help='Existing transactions csv for the csv_reader suite (default: generate --rows rows).')
+        parser.add_argument('--json', dest='json_path', default=None, help='Write the results of the all suite to this file.')
+
+    def handle(self, *args, **options):
+        getattr(self, f"bench_{options['suite']}")(**options)
+
+    def bench_credit_score(self, rows, users, sample, **options):
+        aadhar_ids = synthetic_aadhar_ids(users)
+        probes = random.Random(1).sample(aadhar_ids, min(users, 1000))
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            csv_path = os.path.join(tmpdir, 'transactions.csv')
+            started = time.perf_counter()
+            write_transactions_csv(csv_path, rows, aadhar_ids)
+            self.stdout.write(f"Generated {rows} rows for {users} users in {time.perf_counter() - started:.1f}s "
+                              f"({os.path.getsize(csv_path) / 2**20:.0f} MiB).")
+
+            scan_samples = []
+            for aadhar_id in probes[:sample]:
+                started = time.perf_counter()
+                calculate_credit_score(aadhar_id, csv_path)
+                scan_samples.append(time.perf_counter() - started)
+            self.stdout.write(f"CSV scan per user:      {latency_summary(scan_samples)}")
+
+            with transaction.atomic():
+                started = time.perf_counter()
+                refresh_transaction_index(csv_path, force_rebuild=True)
+                self.stdout.write(f"Index build:            {time.perf_counter() - started:.2f}s")
+
+                lookup_samples = []
+                for aadhar_id in probes:
+                    started = time.perf_counter()
+                    refresh_transaction_index(csv_path)
+                    indexed_credit_score(aadhar_id)
+                    lookup_samples.append(time.perf_counter() - started)
+                self.stdout.write(f"Indexed lookup per user: {latency_summary(lookup_samples)}")
+
+                for aadhar_id in probes[:sample]:
+                    assert indexed_credit_score(aadhar_id) == calculate_credit_score(aadhar_id, csv_path)
+                transaction.set_rollback(True)
+
+    def bench_csv_reader(self, rows, users, sample, csv_path, **options):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            if csv_path is None:
+                csv_path = os.path.join(tmpdir, 'transactions.csv')
+                write_transactions_csv(csv_path, rows, synthetic_aadhar_ids(users))
+                probes = random.Random(1).sample(synthetic_aadhar_ids(users), min(users, sample))
+            else:
+                with open(csv_path, mode='rb') as csvfile:
+                    csvfile.readline()
+                    probes = [line.split(b',')[0].strip(b'"').decode() for line in (csvfile.readline() for _ in range(sample)) if line]
+            self.stdout.write(f"Scanning {csv_path} ({os.path.getsize(csv_path) / 2**20:.0f} MiB) for {len(probes)} AADHARIDs.")
+
+            paths = (
+                ('csv.DictReader (old)', lambda aadhar_id: dictreader_totals(csv_path, aadhar_id)[2]),
+                ('streaming reader', lambda aadhar_id: read_transaction_totals(csv_path, [aadhar_id])[1].rows),
+                ('streaming reader, mmap', lambda aadhar_id: read_transaction_totals(csv_path, [aadhar_id], use_mmap=True)[1].rows),
+            )
+            for label, scan in paths:
+                samples, scanned = [], 0
+                for aadhar_id in probes:
+                    started = time.perf_counter()
+                    scanned += scan(aadhar_id)
+                    samples.append(time.perf_counter() - started)
+                self.stdout.write(f"{label + ':':<26} {scanned / sum(samples):>12,.0f} rows/s  {latency_summary(samples)}")
+
+            for aadhar_id in probes:
+                credit, debit, _ = dictreader_totals(csv_path, aadhar_id)
+                totals, stats = read_transaction_totals(csv_path, [aadhar_id])
+                assert (credit, debit) == tuple(totals.get(aadhar_id, (Decimal('0.00'), Decimal('0.00'))))
+            self.stdout.write(f"Totals match; last scan skipped {stats.malformed} malformed rows.")
+
+    def bench_statement(self, bills, requests, **options):
+        view = GetStatementView.as_view()
+        factory = RequestFactory()
+        statement_cache = caches[STATEMENT_CACHE_ALIAS]
+
+        with transaction.atomic():
+            user = User.objects.create(aadhar_id='999999999999', name='Benchmark', email_id='benchmark@example.invalid',
+                                       annual_income=Decimal('1000000'), credit_score=900)
+            disbursement_date = date(2000, 1, 1)
+            loan = Loan.objects.create(user=user, loan_amount=Decimal('5000.00'), interest_rate=Decimal('18.00'),
+                                       term_period=bills + 24, disbursement_date=disbursement_date,
+                                       principal_balance=Decimal('4000.00'), status='Active')
+            Bill.objects.bulk_create(
+                Bill(loan=loan, billing_date=disbursement_date + timedelta(days=30 * (i + 1)),
+                     due_date=disbursement_date + timedelta(days=30 * (i + 1) + 15), principal_component=Decimal('120.00'),
+                     interest_component=Decimal('59.18'), min_due_amount=Decimal('179.18'), amount_paid=Decimal('179.18'),
+                     status='Paid')
+                for i in range(bills)
+            )
+            request = factory.get(f"/api/get-statement/{loan.loan_id}/")
+
+            for label, clear_cache in (('uncached', True), ('cached', False)):
+                samples = []
+                for _ in range(requests):
+                    if clear_cache:
+                        statement_cache.clear()
+                    with CaptureQueriesContext(connection) as queries:
+                        started = time.perf_counter()
+                        response = view(request, loan_id=loan.loan_id)
+                        samples.append(time.perf_counter() - started)
+                    assert response.status_code == 200
+                self.stdout.write(f"Statement ({bills} bills, {label}): {latency_summary(samples)} queries={len(queries)}")
+
+            transaction.set_rollback(True)
+
+    def bench_emi(self, requests, **options):
+        for term_months in (12, 60, 360):
+            args = (Decimal('5000.00'), Decimal('18.00'), term_months, Decimal('100000000'), date(2025, 1, 31))
+            assert calculate_emi_schedule(*args) == calculate_emi_schedule_fast(*args)
+            engines = (
+                ('reference', calculate_emi_schedule, False),
+                ('fast, cold template', calculate_emi_schedule_fast, True),
+                ('fast, memoized template', calculate_emi_schedule_fast, False),
+            )
+            for label, engine, cold in engines:
+                samples = []
+                for _ in range(requests):
+                    if cold:
+                        _emi_schedule_template.cache_clear()
+                    started = time.perf_counter()
+                    engine(*args)
+                    samples.append(time.perf_counter() - started)
+                self.stdout.write(f"EMI schedule ({term_months} months, {label}): {latency_summary(samples)}")
+        self.stdout.write(f"Template cache: {emi_schedule_cache_info()}")
+
+    def bench_load(self, requests, threads, loans, **options):
+        """
+            concurrent get-statement and make-payment requests through the WSGI handler on a fixed set of threads
+            (like a threaded app server), so connection reuse and write contention behave as in production.
+            the synthetic loans are committed for the run and deleted afterwards.
+        """
+        database = connection.settings_dict
+        self.stdout.write(f"Database: {database['ENGINE'].rsplit('.', 1)[-1]}, CONN_MAX_AGE={database['CONN_MAX_AGE']}, "
+                          f"OPTIONS={ {key: value for key, value in database['OPTIONS'].items() if key != 'init_command'} }")
+
+        user = User.objects.create(aadhar_id='999999999998', name='Load test', email_id='loadtest@example.invalid',
+                                   annual_income=Decimal('1000000'), credit_score=900)
+        try:
+            loan_ids = []
+            for _ in range(loans):
+                loan = Loan.objects.create(user=user, loan_amount=Decimal('5000.00'), interest_rate=Decimal('18.00'), term_period=36,
+                                           disbursement_date=date(2024, 1, 1), principal_balance=Decimal('4000.00'), status='Active')
+                run_backfill_for_load(loan)
+                loan_ids.append(str(loan.loan_id))
+            caches[STATEMENT_CACHE_ALIAS].clear()
+
+            handler = WSGIHandler()
+            factory = RequestFactory(HTTP_HOST='localhost')
+            opened = []
+            connection_created.connect(lambda **kwargs: opened.append(1), weak=False, dispatch_uid='benchmark_load')
+
+            def call(request):
+                statuses = []
+                started = time.perf_counter()
+                response = handler(request.environ, lambda status, headers: statuses.append(status))
+                b''.join(response)
+                response.close() # request_finished: this is where CONN_MAX_AGE closes or keeps the connection
+                return time.perf_counter() - started, statuses[0].startswith('200')
+
+            def statement_request(rng):
+                return factory.get(f"/api/get-statement/{rng.choice(loan_ids)}/")
+
+            def payment_request(rng):
+                return factory.post('/api/make-payment/', data=json.dumps({'loan_id': rng.choice(loan_ids), 'amount': '1.00'}),
+                                    content_type='application/json')
+
+            for label, build in (('get-statement', statement_request), ('make-payment', payment_request)):
+                opened.clear()
+                local = threading.local()
+
+                def worker(i):
+                    if not hasattr(local, 'rng'):
+                        local.rng = random.Random(threading.get_ident())
+                    return call(build(local.rng))
+
+                started = time.perf_counter()
+                with ThreadPoolExecutor(max_workers=threads) as pool:
+                    results = list(pool.map(worker, range(requests)))
+                    list(pool.map(lambda _: connection.close(), range(threads)))
+                elapsed = time.perf_counter() - started
+
+                failures = sum(1 for _, ok in results if not ok)
+                self.stdout.write(f"{label} ({threads} threads): {requests / elapsed:.0f} req/s, {latency_summary([d for d, _ in results])}, "
+                                  f"errors={failures}, connections opened={len(opened)}")
+            connection_created.disconnect(dispatch_uid='benchmark_load')
+        finally:
+            user.delete()
+
+    def bench_asgi(self, requests, threads, concurrency, loans, **options):
+        """
+            get-statement through the test clients: the sync view on a pool of threads with Client (WSGI) against the
+            async view on one event loop with AsyncClient (ASGI), with a warm statement cache and with none.
+        """
+        user = User.objects.create(aadhar_id='999999999997', name='ASGI test', email_id='asgitest@example.invalid',
+                                   annual_income=Decimal('1000000'), credit_score=900)
+        try:
+            loan_ids = []
+            for _ in range(loans):
+                loan = Loan.objects.create(user=user, loan_amount=Decimal('5000.00'), interest_rate=Decimal('18.00'), term_period=36,
+                                           disbursement_date=date(2024, 1, 1), principal_balance=Decimal('4000.00'), status='Active')
+                run_backfill_for_load(loan)
+                loan_ids.append(loan.loan_id)
+            urls = [reverse('get-statement', kwargs={'loan_id': loan_id}) for loan_id in random.Random(2).choices(loan_ids, k=requests)]
+
+            def run_wsgi():
+                local = threading.local()
+
+                def worker(url):
+                    if not hasattr(local, 'client'):
+                        local.client = Client()
+                    started = time.perf_counter()
+                    response = local.client.get(url)
+                    return time.perf_counter() - started, response.status_code == 200
+
+                with ThreadPoolExecutor(max_workers=threads) as pool:
+                    results = list(pool.map(worker, urls))
+                    list(pool.map(lambda _: connection.close(), range(threads)))
+                return results
+
+            async def run_asgi():
+                client = AsyncClient()
+                in_flight = asyncio.Semaphore(concurrency)
+
+                async def fetch(url):
+                    async with in_flight:
+                        started = time.perf_counter()
+                        response = await client.get(url)
+                        return time.perf_counter() - started, response.status_code == 200
+
+                results = await asyncio.gather(*(fetch(url) for url in urls))
+                await sync_to_async(lambda: connection.close())()
+                return results
+
+            no_statement_cache = {**settings.CACHES, STATEMENT_CACHE_ALIAS: {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}
+            for cache_label, caches_setting in (('warm cache', settings.CACHES), ('no cache', no_statement_cache)):
+                for label, async_views, run in (
+                    (f"WSGI, sync view, {threads} threads", False, run_wsgi),
+                    (f"ASGI, async view, {concurrency} in flight", True, lambda: asyncio.run(run_asgi())),
+                ):
+                    with override_settings(CACHES=caches_setting, ASYNC_READ_VIEWS=async_views, ALLOWED_HOSTS=['testserver']):
+                        importlib.reload(credit_service.urls) # urls pick the statement view at import
+                        clear_url_caches()
+                        run() # warm-up: connections, statement cache
+                        started = time.perf_counter()
+                        results = run()
+                        elapsed = time.perf_counter() - started
+
+                    failures = sum(1 for _, ok in results if not ok)
+                    self.stdout.write(f"get-statement ({cache_label}) {label}: {requests / elapsed:.0f} req/s, "
+                                      f"{latency_summary([d for d, _ in results])}, errors={failures}")
+        finally:
+            importlib.reload(credit_service.urls)
+            clear_url_caches()
+            user.delete()
+
+    def bench_all(self, rows, users, sample, requests, json_path, **options):
+        """
+            regression suite: micro-benchmarks of credit scoring, the EMI schedule and the statement simulation, then
+            register-user, apply-loan, make-payment and get-statement through the test client and run_billing, all on
+            generated data (`--users` users with a year of bills, `--rows` transactions). everything is rolled back.
+        """
+        report = {
+            'meta': {
+                'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+                'git_revision': git_revision(),
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'database': connection.vendor,
+                'scale': {'users': users, 'rows': rows, 'requests': requests, 'sample': sample},
+            },
+            'results': {},
+        }
+        results = report['results']
+
+        def record(name, stats):
+            results[name] = stats
+            self.stdout.write(f"{name:<28} {stats['throughput_per_s'] or 0:>10.1f}/s  p50={stats['p50_ms']:.3f}ms "
+                              f"p99={stats['p99_ms']:.3f}ms  queries/op={stats['queries_per_op']}")
+
+        as_of = date(2025, 1, 1)
+        rng = random.Random(3)
+        with tempfile.TemporaryDirectory() as tmpdir, transaction.atomic():
+            started = time.perf_counter()
+            data = generate_synthetic_data(users, bills_per_loan=12, as_of=as_of, aadhar_start=990000000000)
+            csv_path = os.path.join(tmpdir, 'transactions.csv')
+            aadhar_ids = synthetic_aadhar_ids(users, 990000000000)
+            write_transactions_csv(csv_path, rows, aadhar_ids)
+            self.stdout.write(f"Generated {users} users, {len(data.loan_ids)} loans, {data.bills} bills, {rows} transactions "
+                              f"in {time.perf_counter() - started:.1f}s.")
+
+            # micro
+            record('credit_score.csv_scan', measure(lambda aadhar_id: calculate_credit_score(aadhar_id, csv_path),
+                                                    rng.sample(aadhar_ids, min(sample, users))))
+            emi_args = (Decimal('50000.00'), Decimal('18.00'), 60, Decimal('1000000'), as_of)
+            record('emi_schedule.reference', measure(lambda _: calculate_emi_schedule(*emi_args), range(requests)))
+            record('emi_schedule.fast', measure(lambda _: calculate_emi_schedule_fast(*emi_args), range(requests)))
+            statement_inputs = [list(statement_rows(loan_id)) for loan_id in rng.sample(data.loan_ids, min(requests, len(data.loan_ids)))]
+            record('statement.simulation', measure(build_statement, statement_inputs))
+
+            # macro, through the full request stack
+            client = Client()
+            statement_cache = caches[STATEMENT_CACHE_ALIAS]
+
+            def post(url, payload):
+                response = client.post(url, data=json.dumps(payload), content_type='application/json')
+                assert response.status_code == 200, response.content
+
+            def get_statement(loan_id, clear_cache):
+                if clear_cache:
+                    statement_cache.clear()
+                response = client.get(reverse('get-statement', kwargs={'loan_id': loan_id}))
+                assert response.status_code == 200, response.content
+
+            with override_settings(ALLOWED_HOSTS=['testserver']): # score tasks are queued on commit, never here
+                new_aadhar_ids = synthetic_aadhar_ids(requests, 980000000000)
+                record('register-user', measure(lambda aadhar_id: post(reverse('register-user'), {
+                    'aadhar_id': aadhar_id, 'name': 'Benchmark', 'email_id': f"{aadhar_id}@benchmark.invalid", 'annual_income': '600000'
+                }), new_aadhar_ids))
+                record('apply-loan', measure(lambda user_id: post(reverse('apply-loan'), {
+                    'unique_user_id': str(user_id), 'loan_amount': '5000.00', 'interest_rate': '18.00', 'term_period': 12,
+                    'disbursement_date': as_of.isoformat()
+                }), rng.choices(data.user_ids, k=requests)))
+                record('make-payment', measure(lambda loan_id: post(reverse('make-payment'), {
+                    'loan_id': str(loan_id), 'amount': '1.00'
+                }), rng.choices(data.loan_ids, k=requests)))
+                statement_loans = rng.choices(data.loan_ids, k=requests)
+                record('get-statement.uncached', measure(lambda loan_id: get_statement(loan_id, True), statement_loans))
+                for loan_id in set(statement_loans):
+                    get_statement(loan_id, False) # warm the cache
+                record('get-statement.cached', measure(lambda loan_id: get_statement(loan_id, False), statement_loans))
+
+                # metrics overhead, on the cheapest request (a cached statement) where it weighs the most. the same
+                # requests go alternately through a client with and one without the middleware, so drift and noise
+                # hit both sides alike; the overhead is taken on the medians.
+                def cached_statement(statement_client, loan_id):
+                    response = statement_client.get(reverse('get-statement', kwargs={'loan_id': loan_id}))
+                    assert response.status_code == 200, response.content
+
+                metrics_client, bare_client = Client(), Client()
+                without_metrics = [name for name in settings.MIDDLEWARE if name != 'credit_service.middleware.RequestMetricsMiddleware']
+                with override_settings(MIDDLEWARE=without_metrics):
+                    cached_statement(bare_client, statement_loans[0]) # a client loads its middleware on its first request
+                samples = {'with_metrics': [], 'without_metrics': []}
+                sides = [('with_metrics', metrics_client), ('without_metrics', bare_client)]
+                for _ in range(3):
+                    for loan_id in statement_loans:
+                        sides.reverse() # neither side always gets the second, warmer, request for a loan
+                        for side, statement_client in sides:
+                            started = time.perf_counter()
+                            cached_statement(statement_client, loan_id)
+                            samples[side].append(time.perf_counter() - started)
+                overhead = {side: latency_stats(side_samples) for side, side_samples in samples.items()}
+                overhead['overhead_pct'] = round((overhead['with_metrics']['p50_ms'] / overhead['without_metrics']['p50_ms'] - 1) * 100, 2)
+                results['metrics.overhead'] = overhead
+                self.stdout.write(f"{'metrics.overhead':<28} {overhead['overhead_pct']:>+9.2f}%  p50={overhead['with_metrics']['p50_ms']:.3f}ms "
+                                  f"with, {overhead['without_metrics']['p50_ms']:.3f}ms without RequestMetricsMiddleware")
+
+            # billing: one run per day of the next cycle bills every active loan once. latencies are per daily run,
+            # throughput and queries per billed loan.
+            billed = []
+            billing_dates = [as_of + timedelta(days=day) for day in range(1, BILLING_CYCLE_DAYS + 1)]
+            stats = measure(lambda billing_date: billed.append(run_billing(billing_date).billed), billing_dates)
+            record('run_billing', {
+                **stats, 'n': sum(billed), 'throughput_per_s': round(sum(billed) / stats['seconds'], 3),
+                'queries_per_op': round(stats['queries_per_op'] * len(billing_dates) / max(sum(billed), 1), 3),
+            })
+
+            transaction.set_rollback(True)
+
+        if json_path:
+            with open(json_path, 'w', encoding='utf-8') as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Results written to {json_path}."))
+
+
+def run_backfill_for_load(loan):
+    # a year of bills, the first half paid
+    bills = [
+        Bill(loan=loan, billing_date=loan.disbursement_date + timedelta(days=30 * (i + 1)),
+             due_date=loan.disbursement_date + timedelta(days=30 * (i + 1) + 15), principal_component=Decimal('120.00'),
+             interest_component=Decimal('59.18'), min_due_amount=Decimal('179.18'),
+             amount_paid=Decimal('179.18') if i < 6 else Decimal('0.00'), status='Paid' if i < 6 else 'Pending')
+        for i in range(12)
+    ]
+    Bill.objects.bulk_create(bills)
+    refresh_loan_summaries([loan.id])
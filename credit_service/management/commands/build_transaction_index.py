@@ -0,0 +1,30 @@
+
+from django.core.management.base import BaseCommand, CommandError
+from credit_service.transaction_index import refresh_transaction_index, TransactionIndexError
+from credit_service.utils import CSV_FILE_PATH
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Builds or incrementally refreshes the per-AADHARID transaction aggregate index used for credit scoring.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--csv', default=CSV_FILE_PATH, help='Path of the transactions CSV (default: data/transactions.csv).')
+        parser.add_argument('--rebuild', action='store_true', help='Discard the existing index and rebuild it from scratch.')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        self.stdout.write(f"Indexing {options['csv']}{' (full rebuild)' if options['rebuild'] else ''}...")
+
+        try:
+            state = refresh_transaction_index(options['csv'], force_rebuild=options['rebuild'])
+        except (OSError, TransactionIndexError) as e:
+            raise CommandError(f"Failed to index transactions: {e}")
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Transaction index ready: {state.row_count} rows up to byte {state.indexed_offset} ({elapsed:.2f}s)."
+        ))
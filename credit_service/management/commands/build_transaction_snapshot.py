@@ -0,0 +1,41 @@
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from credit_service.transaction_csv import TransactionCSVError
+from credit_service.transaction_snapshot import build_transaction_snapshot, TransactionSnapshot, TransactionSnapshotError
+from credit_service.utils import CSV_FILE_PATH
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Converts the transactions CSV into a columnar, memory-mappable snapshot used for bulk credit scoring.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--csv', default=CSV_FILE_PATH, help='Path of the transactions CSV (default: data/transactions.csv).')
+        parser.add_argument('--output', default=None, help='Snapshot path (default: TRANSACTION_SNAPSHOT_PATH).')
+        parser.add_argument('--score-all', action='store_true', help='Afterwards, time scoring every AADHARID in the snapshot.')
+
+    def handle(self, *args, **options):
+        output = options['output'] or settings.TRANSACTION_SNAPSHOT_PATH
+        started = time.perf_counter()
+        self.stdout.write(f"Converting {options['csv']} into {output}...")
+
+        try:
+            result = build_transaction_snapshot(options['csv'], output)
+        except (OSError, TransactionCSVError, TransactionSnapshotError) as e:
+            raise CommandError(f"Failed to build the transaction snapshot: {e}")
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Snapshot ready: {result.rows} rows, {result.aadhar_ids} AADHARIDs, {result.malformed} malformed rows skipped, "
+            f"{os.path.getsize(output) / 2**20:.1f} MiB ({elapsed:.2f}s)."
+        ))
+
+        if options['score_all']:
+            started = time.perf_counter()
+            scores = TransactionSnapshot(output).credit_scores()
+            self.stdout.write(f"Scored {len(scores)} AADHARIDs in {time.perf_counter() - started:.3f}s.")
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand, CommandError
+from credit_service.loan_summaries import check_loan_summaries, SUMMARY_CHUNK_SIZE
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = "Recomputes every loan's bill summary (last/next billing date, outstanding bills and amount) and reports drift."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=SUMMARY_CHUNK_SIZE, help='Loans checked per query.')
+        parser.add_argument('--fix', action='store_true', help='Rewrite the drifted summaries instead of only reporting them.')
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] < 1:
+            raise CommandError("--chunk-size must be at least 1.")
+
+        started = time.perf_counter()
+        self.stdout.write(f"Checking loan summaries{' (fixing drift)' if options['fix'] else ''}...")
+
+        def progress(processed, total):
+            logger.info(f"Loan summary check: {processed}/{total} loans checked.")
+
+        checked, drifted, drift_by_field = check_loan_summaries(chunk_size=options['chunk_size'], fix=options['fix'], progress=progress)
+
+        for field, count in drift_by_field.items():
+            if count:
+                self.stdout.write(self.style.WARNING(f"  {field}: {count} loans"))
+        message = f"Checked: {checked}, Drifted: {drifted} ({time.perf_counter() - started:.2f}s)."
+        if drifted and not options['fix']:
+            self.stdout.write(self.style.ERROR(f"{message} Re-run with --fix to repair them."))
+        else:
+            self.stdout.write(self.style.SUCCESS(message))
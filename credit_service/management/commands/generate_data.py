@@ -0,0 +1,58 @@
+
+from datetime import date
+from django.core.management.base import BaseCommand, CommandError
+from credit_service.models import User
+from credit_service.synthetic import (
+    generate_synthetic_data, synthetic_aadhar_ids, write_transactions_csv, SYNTHETIC_AADHAR_START, SYNTHETIC_BATCH_SIZE
+)
+from credit_service.utils import CSV_FILE_PATH
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Generates synthetic users, loans, bills, payments and a transactions CSV at a configurable scale.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000, help='Users to create (default: 1000).')
+        parser.add_argument('--loans-per-user', type=int, default=1, help='Active loans per user.')
+        parser.add_argument('--bills-per-loan', type=int, default=12, help='Billed cycles per loan; all but the last are paid.')
+        parser.add_argument('--payments-per-loan', type=int, default=3, help='Payments recorded per loan with paid bills.')
+        parser.add_argument('--transactions', type=int, default=0, help='Rows written to the transactions CSV (default: none).')
+        parser.add_argument('--csv', default=CSV_FILE_PATH, help='Transactions CSV path (overwritten).')
+        parser.add_argument('--as-of', type=date.fromisoformat, default=None, help='Date the bill history ends at (default: today).')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed; the same seed gives the same data.')
+        parser.add_argument('--aadhar-start', type=int, default=SYNTHETIC_AADHAR_START, help='First synthetic AADHARID.')
+        parser.add_argument('--chunk-size', type=int, default=SYNTHETIC_BATCH_SIZE, help='Users per transaction.')
+
+    def handle(self, *args, **options):
+        for name in ('users', 'loans_per_user', 'bills_per_loan', 'payments_per_loan', 'chunk_size'):
+            if options[name] < 1:
+                raise CommandError(f"--{name.replace('_', '-')} must be at least 1.")
+
+        aadhar_ids = synthetic_aadhar_ids(options['users'], options['aadhar_start'])
+        if User.objects.filter(aadhar_id__gte=aadhar_ids[0], aadhar_id__lte=aadhar_ids[-1]).exists():
+            raise CommandError(f"AADHARIDs {aadhar_ids[0]}..{aadhar_ids[-1]} overlap existing users; pass another --aadhar-start.")
+
+        def progress(processed, total):
+            logger.info(f"Synthetic data: {processed}/{total} users created.")
+
+        started = time.perf_counter()
+        data = generate_synthetic_data(
+            options['users'], loans_per_user=options['loans_per_user'], bills_per_loan=options['bills_per_loan'],
+            payments_per_loan=options['payments_per_loan'], as_of=options['as_of'], seed=options['seed'],
+            aadhar_start=options['aadhar_start'], batch_size=options['chunk_size'], progress=progress
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {len(data.user_ids)} users, {len(data.loan_ids)} loans, {data.bills} bills and {data.payments} payments "
+            f"({time.perf_counter() - started:.2f}s)."
+        ))
+
+        if options['transactions']:
+            started = time.perf_counter()
+            write_transactions_csv(options['csv'], options['transactions'], aadhar_ids, seed=options['seed'])
+            self.stdout.write(self.style.SUCCESS(
+                f"Wrote {options['transactions']} transactions to {options['csv']} ({time.perf_counter() - started:.2f}s)."
+            ))
@@ -0,0 +1,121 @@
+
+from django.core.management.base import BaseCommand, CommandError
+from credit_service.payments import apply_payment_batch, PAYMENT_CHUNK_SIZE
+from credit_service.serializers import MakePaymentSerializer
+import csv
+import json
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+
+def read_payment_rows(paymentfile, file_format: str, start_offset: int = 0):
+    """
+        streams (offset, end_offset, row) from a binary CSV (with a loan_id,amount header) or JSONL file, starting
+        at `start_offset`. offsets are byte positions, so an import can be resumed from the end of the last chunk.
+        rows that cannot be parsed are yielded as None.
+    """
+    header = None
+    if file_format == 'csv':
+        header_line = paymentfile.readline()
+        header = next(csv.reader([header_line.decode('utf-8-sig')]), [])
+        start_offset = max(start_offset, len(header_line))
+    paymentfile.seek(start_offset)
+
+    offset = start_offset
+    for line in iter(paymentfile.readline, b''):
+        end_offset = offset + len(line)
+        text = line.decode('utf-8', errors='replace').strip()
+        if text:
+            try:
+                if file_format == 'csv':
+                    row = dict(zip(header, next(csv.reader([text]))))
+                else:
+                    row = json.loads(text)
+                    if not isinstance(row, dict):
+                        row = None
+            except (ValueError, csv.Error):
+                row = None
+            yield offset, end_offset, row
+        offset = end_offset
+
+
+class Command(BaseCommand):
+    help = 'Imports a settlement file of payments (CSV with loan_id,amount columns, or JSONL) in chunked transactions.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('file', help='Path of the settlement file.')
+        parser.add_argument('--format', choices=('csv', 'jsonl'), default=None, help='File format (default: from the extension).')
+        parser.add_argument('--chunk-size', type=int, default=PAYMENT_CHUNK_SIZE, help='Rows applied per transaction.')
+        parser.add_argument('--offset', type=int, default=0, help='Resume from this byte offset (printed after every committed chunk).')
+        parser.add_argument('--results', default=None, help='Append a CSV of per-row results (offset, loan_id, amount, error) to this path.')
+
+    def handle(self, *args, **options):
+        path = options['file']
+        file_format = options['format'] or ('jsonl' if path.endswith(('.jsonl', '.json')) else 'csv')
+        if options['chunk_size'] < 1:
+            raise CommandError("--chunk-size must be at least 1.")
+        if not os.path.exists(path):
+            raise CommandError(f"File not found: {path}")
+
+        started = time.perf_counter()
+        self.stdout.write(f"Importing payments from {path} ({file_format}) starting at offset {options['offset']}...")
+        self.applied = self.rejected = 0
+
+        resultsfile = open(options['results'], mode='a', encoding='utf-8', newline='') if options['results'] else None
+        try:
+            self.results_writer = csv.writer(resultsfile) if resultsfile else None
+            with open(path, mode='rb') as paymentfile:
+                chunk = []
+                for entry in read_payment_rows(paymentfile, file_format, options['offset']):
+                    chunk.append(entry)
+                    if len(chunk) >= options['chunk_size']:
+                        self.import_chunk(chunk)
+                        chunk = []
+                if chunk:
+                    self.import_chunk(chunk)
+        finally:
+            if resultsfile:
+                resultsfile.close()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Import finished. Applied: {self.applied}, Rejected: {self.rejected} ({time.perf_counter() - started:.2f}s)."
+        ))
+
+    def import_chunk(self, chunk):
+        errors = []
+        payments = []
+        for offset, end_offset, row in chunk:
+            serializer = MakePaymentSerializer(data=row) if row is not None else None
+            if serializer is None:
+                errors.append("Validation Failed: row could not be parsed.")
+            elif not serializer.is_valid():
+                error_string = "; ".join([f"{field}: {' '.join(errs)}" for field, errs in serializer.errors.items()])
+                errors.append(f"Validation Failed: {error_string}")
+            else:
+                errors.append(None)
+                payments.append((len(errors) - 1, serializer.validated_data))
+
+        try:
+            batch_errors = apply_payment_batch([
+                (payment['loan_id'], payment['amount'], payment.get('idempotency_key')) for _, payment in payments
+            ])
+        except Exception as e:
+            # the chunk was rolled back as a whole, so it is safe to resume from its first row
+            logger.error(f"Error importing payments at offset {chunk[0][0]}: {e}", exc_info=True)
+            raise CommandError(f"Chunk starting at offset {chunk[0][0]} failed ({e}), resume with --offset {chunk[0][0]}.")
+        for (i, _), error in zip(payments, batch_errors):
+            errors[i] = error
+
+        for (offset, _, row), error in zip(chunk, errors):
+            if error:
+                self.rejected += 1
+            else:
+                self.applied += 1
+            if self.results_writer:
+                row = row or {}
+                self.results_writer.writerow([offset, row.get('loan_id', ''), row.get('amount', ''), error or ''])
+
+        self.stdout.write(f"Committed through offset {chunk[-1][1]}. Applied: {self.applied}, Rejected: {self.rejected}")
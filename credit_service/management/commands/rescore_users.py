@@ -0,0 +1,30 @@
+
+from django.core.management.base import BaseCommand
+from credit_service.models import User
+from credit_service.tasks import bulk_update_credit_scores
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Recalculates credit scores for many users with a single pass over the transactions CSV.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='Rescore every user instead of only those without a score.')
+        parser.add_argument('--async', action='store_true', dest='run_async', help='Enqueue the work as a Celery task instead of running it here.')
+
+    def handle(self, *args, **options):
+        pending_only = not options['all']
+        users = User.objects.filter(credit_score__isnull=True) if pending_only else User.objects.all()
+        self.stdout.write(f"Rescoring {users.count()} {'pending users' if pending_only else 'users'}...")
+
+        if options['run_async']:
+            result = bulk_update_credit_scores.delay(pending_only=pending_only)
+            self.stdout.write(self.style.SUCCESS(f"Enqueued bulk scoring task {result.id}."))
+            return
+
+        started = time.perf_counter()
+        message = bulk_update_credit_scores(pending_only=pending_only)
+        self.stdout.write(self.style.SUCCESS(f"{message} ({time.perf_counter() - started:.2f}s)"))
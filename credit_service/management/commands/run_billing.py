@@ -1,93 +1,152 @@
 
-from django.core.management.base import BaseCommand
+from celery import group
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import date
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
 from django.utils import timezone
-from django.db import transaction
-from credit_service.models import Loan, Bill 
-from decimal import Decimal, ROUND_HALF_UP
-from dateutil.relativedelta import relativedelta
+from credit_service.billing import (
+    run_billing, run_billing_shard, run_backfill, billable_loans, BillingResult, BILLING_CHUNK_SIZE
+)
+from credit_service.metrics import instrumented
+from credit_service.tasks import run_billing_shard_task
+import django
 import logging
 
 logger = logging.getLogger(__name__)
 
 
-TWOPLACES = Decimal('0.01')
+def _init_billing_worker():
+    # forked workers must not reuse the parent's database connections
+    django.setup()
+    connections.close_all()
+
 
 class Command(BaseCommand):
     help = 'Runs the daily billing process for active loans.'
 
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=BILLING_CHUNK_SIZE, help='Loans billed per transaction.')
+        parser.add_argument('--shards', type=int, default=None, help='Split due loans into N partitions by loan id.')
+        parser.add_argument('--workers', type=int, default=None, help='Bill the shards in a local pool of N processes.')
+        parser.add_argument('--celery', action='store_true', help='Dispatch each shard as a Celery task and wait for all of them.')
+        parser.add_argument('--from', dest='from_date', type=date.fromisoformat, default=None,
+                            help='Backfill mode: create all missed bills with a billing date from YYYY-MM-DD...')
+        parser.add_argument('--to', dest='to_date', type=date.fromisoformat, default=None,
+                            help='...up to YYYY-MM-DD (default: today).')
+        parser.add_argument('--dry-run', action='store_true', help='Backfill mode: only report how many bills would be created.')
+
     def handle(self, *args, **options):
         today = timezone.now().date()
+        if options['from_date'] or options['to_date'] or options['dry_run']:
+            return self.handle_backfill(today, **options)
+
         self.stdout.write(f"Starting billing run for: {today.strftime('%Y-%m-%d')}")
         logger.info(f"Starting billing run for {today}...")
 
-        billed_count = 0
-        skipped_count = 0
-
-        # active and still has a balance
-        active_loans = Loan.objects.filter(
-            status=Loan.LOAN_STATUS_CHOICES[1][0], 
-            principal_balance__gt=Decimal('0.00')
-        )
-
-        self.stdout.write(f"Found {active_loans.count()} active loans with balance > 0.")
-
-        for loan in active_loans:
-            try:
-                last_bill = loan.bills.order_by('-billing_date').first() # expected billing date
-
-                if last_bill:
-                    next_billing_date = last_bill.billing_date + relativedelta(days=30)  # next bill
-                else:
-                    next_billing_date = loan.disbursement_date + relativedelta(days=30)
-
-                # today's bill
-                if today == next_billing_date:
-                    logger.info(f"Billing due for Loan ID: {loan.loan_id} (User: {loan.user_id})")
-
-                    
-                    with transaction.atomic():
-                        loan_for_update = Loan.objects.select_for_update().get(id=loan.id)
-
-                        current_principal = loan_for_update.principal_balance
-                        if current_principal <= Decimal('0.00'):
-                            logger.warning(f"Skipping Loan ID {loan.loan_id} as balance became zero before billing.")
-                            skipped_count += 1
-                            continue  #  balance == 0
-
-                        daily_rate = loan_for_update.interest_rate / Decimal('36500')
-                        days_in_cycle = 30 
-
-                        # 30-day cycle
-                        interest_for_cycle = (current_principal * daily_rate * days_in_cycle).quantize(TWOPLACES, rounding=ROUND_HALF_UP)
-
-                        #principal component 
-                        principal_component_raw = current_principal * Decimal('0.03')
-
-                        if principal_component_raw >= current_principal:
-                            principal_component = current_principal
-                        else:
-                            principal_component = principal_component_raw.quantize(TWOPLACES, rounding=ROUND_HALF_UP)
-
-                        min_due = (principal_component + interest_for_cycle).quantize(TWOPLACES, rounding=ROUND_HALF_UP)
-                        due_date = today + relativedelta(days=15) 
-
-                        #bill record 
-                        new_bill = Bill.objects.create(
-                            loan=loan_for_update,
-                            billing_date=today,
-                            due_date=due_date,
-                            principal_component=principal_component,
-                            interest_component=interest_for_cycle,
-                            min_due_amount=min_due,
-                            status=Bill.BILL_STATUS_CHOICES[0][0] #'pending'
-                        )
-                        billed_count += 1
-                        logger.info(f"Created Bill ID: {new_bill.id} for Loan ID: {loan.loan_id}. Min Due: {min_due}, Due Date: {due_date}")
-                        self.stdout.write(self.style.SUCCESS(f"Successfully billed Loan ID: {loan.loan_id}"))
-
-            except Exception as e:
-                logger.error(f"Error processing billing for Loan ID {loan.loan_id}: {e}", exc_info=True)
-                self.stdout.write(self.style.ERROR(f"Error billing Loan ID: {loan.loan_id} - Check logs."))
-
-        self.stdout.write(f"Billing run finished. Billed: {billed_count}, Skipped/Error: {skipped_count + (active_loans.count() - billed_count - skipped_count)}")
-        logger.info(f"Billing run finished. Billed: {billed_count}")
\ No newline at end of file
+        self.stdout.write(f"Found {billable_loans().count()} active loans with balance > 0.")
+
+        workers = options['workers'] or 1
+        shards = options['shards'] or workers
+        if shards < 1 or workers < 1:
+            raise CommandError("--shards and --workers must be at least 1.")
+
+        self.failed_shards = []
+        # wall time and queries of this process (shards in other processes log their own) plus the outcome
+        with instrumented('command', 'run_billing', billing_date=today, shards=shards) as run:
+            if options['celery']:
+                result = self.run_celery_shards(today, shards, options['chunk_size'])
+            elif shards > 1 or workers > 1:
+                result = self.run_local_shards(today, shards, workers, options['chunk_size'])
+            else:
+                def progress(result, processed, total):
+                    logger.info(f"Billing progress for {today}: {processed}/{total} due loans processed, {result.billed} billed.")
+
+                result = run_billing(today, chunk_size=options['chunk_size'], progress=progress)
+            run.fields.update(billed=result.billed, skipped=result.skipped, errors=result.errors)
+
+        if result.errors:
+            self.stdout.write(self.style.ERROR(f"{result.errors} loans could not be billed - Check logs."))
+        self.stdout.write(f"Billing run finished. Billed: {result.billed}, Skipped: {result.skipped}, Errors: {result.errors}")
+        logger.info(f"Billing run finished. Billed: {result.billed}")
+
+        if self.failed_shards:
+            # re-running is safe: loans that already have today's bill are skipped
+            raise CommandError(f"Shards {', '.join(str(shard + 1) for shard in self.failed_shards)} failed, re-run the command to retry them.")
+
+    def handle_backfill(self, today, from_date, to_date, dry_run, chunk_size, **options):
+        to_date = to_date or today
+        if from_date is None:
+            raise CommandError("Backfill mode needs --from.")
+        if from_date > to_date:
+            raise CommandError("--from must not be after --to.")
+        if to_date > today:
+            raise CommandError("Cannot bill future dates.")
+        if options['shards'] or options['workers'] or options['celery']:
+            raise CommandError("Backfill runs in a single process, drop --shards/--workers/--celery.")
+
+        self.stdout.write(f"Starting backfill billing{' (dry run)' if dry_run else ''} for: {from_date} to {to_date}")
+        logger.info(f"Starting backfill billing for {from_date}..{to_date} (dry run: {dry_run})...")
+
+        def progress(result, processed, total):
+            logger.info(f"Backfill progress: {processed}/{total} candidate loans processed, {result.billed} bills.")
+
+        with instrumented('command', 'backfill_billing', from_date=from_date, to_date=to_date, dry_run=dry_run) as run:
+            result = run_backfill(from_date, to_date, chunk_size=chunk_size, dry_run=dry_run, progress=progress)
+            run.fields.update(billed=result.billed, errors=result.errors)
+
+        if result.errors:
+            self.stdout.write(self.style.ERROR(f"{result.errors} loans could not be backfilled - Check logs."))
+        if dry_run:
+            self.stdout.write(f"Dry run finished. Bills that would be created: {result.billed}")
+        else:
+            self.stdout.write(f"Backfill finished. Billed: {result.billed}, Errors: {result.errors}")
+        logger.info(f"Backfill finished. Bills: {result.billed} (dry run: {dry_run})")
+
+    def report_shard(self, shard, shards, shard_result):
+        self.stdout.write(self.style.SUCCESS(
+            f"Shard {shard + 1}/{shards} done. Billed: {shard_result.billed}, "
+            f"Skipped: {shard_result.skipped}, Errors: {shard_result.errors}"
+        ))
+
+    def run_local_shards(self, billing_date, shards, workers, chunk_size):
+        self.stdout.write(f"Billing {shards} shards with {workers} worker processes...")
+        result = BillingResult()
+
+        connections.close_all()
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_billing_worker) as pool:
+            futures = {
+                pool.submit(run_billing_shard, billing_date, shard, shards, chunk_size): shard
+                for shard in range(shards)
+            }
+            for future in as_completed(futures):
+                shard = futures[future]
+                try:
+                    shard_result = future.result()
+                except Exception as e:
+                    logger.error(f"Billing shard {shard + 1}/{shards} failed: {e}", exc_info=True)
+                    self.failed_shards.append(shard)
+                    continue
+                self.report_shard(shard, shards, shard_result)
+                result += shard_result
+
+        return result
+
+    def run_celery_shards(self, billing_date, shards, chunk_size):
+        self.stdout.write(f"Dispatching {shards} billing shards to Celery...")
+        async_result = group(
+            run_billing_shard_task.s(billing_date.isoformat(), shard, shards, chunk_size)
+            for shard in range(shards)
+        ).apply_async()
+
+        result = BillingResult()
+        for shard, shard_counts in enumerate(async_result.get(propagate=False)):
+            if isinstance(shard_counts, Exception):
+                logger.error(f"Billing shard {shard + 1}/{shards} failed: {shard_counts}")
+                self.failed_shards.append(shard)
+                continue
+            shard_result = BillingResult(**shard_counts)
+            self.report_shard(shard, shards, shard_result)
+            result += shard_result
+
+        return result
@@ -0,0 +1,33 @@
+from datetime import date
+from decimal import Decimal
+from django.core.management.base import BaseCommand, CommandError
+from credit_service.overdue import sweep_overdue_bills, LATE_FEE_AMOUNT, OVERDUE_CHUNK_SIZE
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Marks every unpaid bill past its due date as Overdue, optionally charging a late fee.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', dest='as_of', type=date.fromisoformat, default=None,
+                            help='Mark bills due before YYYY-MM-DD (default: today).')
+        parser.add_argument('--late-fee', type=Decimal, default=LATE_FEE_AMOUNT,
+                            help='Fee added to each newly overdue bill (default: LATE_FEE_AMOUNT setting).')
+        parser.add_argument('--chunk-size', type=int, default=OVERDUE_CHUNK_SIZE, help='Bill ids per UPDATE.')
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] < 1:
+            raise CommandError("--chunk-size must be at least 1.")
+        if options['late_fee'] < Decimal('0.00'):
+            raise CommandError("--late-fee cannot be negative.")
+
+        def progress(result, processed_id, last_id):
+            logger.info(f"Overdue sweep: bill ids up to {processed_id}/{last_id} done, {result.marked} marked.")
+
+        result = sweep_overdue_bills(options['as_of'], late_fee=options['late_fee'], chunk_size=options['chunk_size'], progress=progress)
+        self.stdout.write(self.style.SUCCESS(
+            f"Overdue sweep finished. Marked: {result.marked}, Late fees: {result.late_fees}, "
+            f"Chunks: {result.chunks} ({result.seconds:.2f}s)."
+        ))
@@ -0,0 +1,234 @@
+
+import bisect
+import functools
+import json
+import logging
+import random
+import threading
+import time
+from django.conf import settings
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+METRICS_ENABLED = getattr(settings, 'METRICS_ENABLED', True)
+METRICS_SAMPLE_RATE = float(getattr(settings, 'METRICS_SAMPLE_RATE', 0.05))
+
+DURATION_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 100, 250, 1000)
+OUTCOME_LABELS = ('method', 'status', 'state') # low-cardinality fields that also label the *_total counters
+
+_lock = threading.Lock()
+_counters = {} # (name, labels) -> value
+_histograms = {} # (name, labels) -> [bucket counts..., +Inf count, sum]
+_buckets = {} # histogram name -> bucket bounds
+_help = {}
+
+
+def _labels(labels: dict) -> tuple:
+    return tuple(sorted(labels.items()))
+
+
+def _inc(key, amount):
+    # callers hold _lock
+    _counters[key] = _counters.get(key, 0) + amount
+
+
+def _observe(key, value, buckets):
+    # callers hold _lock
+    histogram = _histograms.get(key)
+    if histogram is None:
+        histogram = _histograms[key] = [0] * (len(buckets) + 2)
+        _buckets.setdefault(key[0], buckets)
+    histogram[bisect.bisect_left(buckets, value)] += 1
+    histogram[-1] += value
+
+
+def inc(name: str, labels: dict, amount: float = 1, help_text: str = ''):
+    with _lock:
+        _help.setdefault(name, help_text)
+        _inc((name, _labels(labels)), amount)
+
+
+def observe(name: str, labels: dict, value: float, buckets=DURATION_BUCKETS, help_text: str = ''):
+    with _lock:
+        _help.setdefault(name, help_text)
+        _observe((name, _labels(labels)), value, buckets)
+
+
+def sampled() -> bool:
+    return METRICS_ENABLED and random.random() < METRICS_SAMPLE_RATE
+
+
+def reset_metrics():
+    with _lock:
+        _counters.clear()
+        _histograms.clear()
+
+
+def _format_labels(labels) -> str:
+    if not labels:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in labels)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(labels, escaped)) + '}'
+
+
+def render_prometheus() -> str:
+    """
+        every metric of this process in the Prometheus text exposition format.
+    """
+    with _lock:
+        counters = sorted(_counters.items())
+        histograms = sorted((key, list(values)) for key, values in _histograms.items())
+        buckets = dict(_buckets)
+        help_texts = dict(_help)
+
+    lines = []
+    declared = set()
+
+    def declare(name, kind):
+        if name not in declared:
+            declared.add(name)
+            lines.append(f"# HELP {name} {help_texts.get(name) or name}")
+            lines.append(f"# TYPE {name} {kind}")
+
+    for (name, labels), value in counters:
+        declare(name, 'counter')
+        lines.append(f"{name}{_format_labels(labels)} {value:g}")
+
+    for (name, labels), values in histograms:
+        declare(name, 'histogram')
+        cumulative = 0
+        for bound, count in zip(buckets[name], values):
+            cumulative += count
+            lines.append(f"{name}_bucket{_format_labels(labels + (('le', f'{bound:g}'),))} {cumulative}")
+        cumulative += values[-2]
+        lines.append(f"{name}_bucket{_format_labels(labels + (('le', '+Inf'),))} {cumulative}")
+        lines.append(f"{name}_sum{_format_labels(labels)} {values[-1]:.6f}")
+        lines.append(f"{name}_count{_format_labels(labels)} {cumulative}")
+
+    return '\n'.join(lines) + '\n'
+
+
+class QueryCounter:
+    """
+        execute wrapper counting the queries of one request or task and the time spent in them.
+    """
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.seconds += time.perf_counter() - started
+
+
+def log_event(event: str, **fields):
+    # one JSON object per line, for log pipelines
+    logger.info(json.dumps({'event': event, **fields}, default=str))
+
+
+_run_metrics = {}
+
+
+def _run_metric_names(kind: str) -> tuple:
+    names = _run_metrics.get(kind)
+    if names is None:
+        names = _run_metrics[kind] = (
+            'view' if kind == 'request' else kind, f"credit_service_{kind}s_total", f"credit_service_{kind}_seconds",
+            f"credit_service_{kind}_queries", f"credit_service_{kind}_query_seconds",
+        )
+        with _lock:
+            _help.update({
+                names[1]: f"Finished {kind}s.", names[2]: f"Wall time per {kind}.",
+                names[3]: f"Database queries per sampled {kind}.", names[4]: f"Time spent in database queries per sampled {kind}.",
+            })
+    return names
+
+
+def record_run(kind: str, name: str, seconds: float, counter: QueryCounter = None, **fields):
+    """
+        records one finished request, task or command: wall time always, queries and a log line when they were counted.
+        runs on every request, so it takes the lock once and builds label tuples directly.
+    """
+    label, total_name, seconds_name, queries_name, query_seconds_name = _run_metric_names(kind)
+    name_labels = ((label, name),)
+    outcome_labels = tuple(sorted(name_labels + tuple((key, value) for key, value in fields.items() if key in OUTCOME_LABELS)))
+    with _lock:
+        _inc((total_name, outcome_labels), 1)
+        _observe((seconds_name, name_labels), seconds, DURATION_BUCKETS)
+        if counter is not None:
+            _observe((queries_name, name_labels), counter.count, QUERY_COUNT_BUCKETS)
+            _observe((query_seconds_name, name_labels), counter.seconds, DURATION_BUCKETS)
+    if counter is not None:
+        log_event(kind, name=name, duration_ms=round(seconds * 1000, 3), queries=counter.count,
+                  query_ms=round(counter.seconds * 1000, 3), **fields)
+
+
+class instrumented:
+    """
+        context manager timing a block (a billing run, a management command) and counting its queries on this
+        thread's connection. blocks are rare and long, so they are always measured.
+    """
+    def __init__(self, kind: str, name: str, **fields):
+        self.kind, self.name, self.fields = kind, name, fields
+
+    def __enter__(self):
+        self.counter = QueryCounter()
+        self.wrapper = connection.execute_wrapper(self.counter)
+        self.wrapper.__enter__()
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        seconds = time.perf_counter() - self.started
+        self.wrapper.__exit__(exc_type, exc, tb)
+        if METRICS_ENABLED:
+            record_run(self.kind, self.name, seconds, self.counter, state='failure' if exc_type else 'success', **self.fields)
+        return False
+
+
+def timed(name: str):
+    """
+        decorator recording the wall time of a sample of calls as credit_service_function_seconds{function=name}.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not sampled():
+                return func(*args, **kwargs)
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                observe('credit_service_function_seconds', {'function': name}, time.perf_counter() - started,
+                        help_text='Wall time of sampled calls to hot functions.')
+        return wrapper
+    return decorator
+
+
+# celery tasks, like instrumented() blocks, are long enough to always be measured. prerun and postrun run on the
+# task's thread, so the wrapper sits on the connection the task uses.
+_running_tasks = {}
+
+
+def start_task(task_id, task_name):
+    if not METRICS_ENABLED:
+        return
+    counter = QueryCounter()
+    connection.execute_wrappers.append(counter)
+    _running_tasks[task_id] = (time.perf_counter(), counter)
+
+
+def finish_task(task_id, task_name, state):
+    started, counter = _running_tasks.pop(task_id, (None, None))
+    if started is None:
+        return
+    seconds = time.perf_counter() - started
+    if counter in connection.execute_wrappers:
+        connection.execute_wrappers.remove(counter)
+    record_run('task', task_name, seconds, counter, state=state or 'unknown')
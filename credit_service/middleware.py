@@ -0,0 +1,54 @@
+
+import time
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+from .metrics import record_run, sampled, QueryCounter, METRICS_ENABLED
+
+
+def view_label(request) -> str:
+    # the url name keeps the label set small (loan ids are part of the path)
+    match = getattr(request, 'resolver_match', None)
+    return (match.view_name or match._func_path) if match else 'unresolved'
+
+
+class RequestMetricsMiddleware:
+    """
+        times every request per view. a METRICS_SAMPLE_RATE share of them also get their database queries counted
+        (count and time, through an execute wrapper) and a JSON log line.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not METRICS_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+
+        counter = QueryCounter() if sampled() else None
+        started = time.perf_counter()
+        if counter is None:
+            response = self.get_response(request)
+        else:
+            with connection.execute_wrapper(counter):
+                response = self.get_response(request)
+        self.record(request, response, time.perf_counter() - started, counter)
+        return response
+
+    async def __acall__(self, request):
+        # under ASGI the ORM runs on another thread, out of reach of a wrapper installed here: timing only
+        started = time.perf_counter()
+        response = await self.get_response(request)
+        self.record(request, response, time.perf_counter() - started, None)
+        return response
+
+    def record(self, request, response, seconds, counter):
+        record_run('request', view_label(request), seconds, counter, method=request.method, status=response.status_code,
+                   path=request.path)
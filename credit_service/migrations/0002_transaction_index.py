@@ -0,0 +1,45 @@
+# Generated by Django 5.2 on 2026-10-16 20:24
+
+from decimal import Decimal
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('credit_service', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TransactionAggregate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('aadhar_id', models.CharField(db_index=True, max_length=12, unique=True)),
+                ('total_credit', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=20)),
+                ('total_debit', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=20)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Transaction Aggregate',
+                'verbose_name_plural': 'Transaction Aggregates',
+            },
+        ),
+        migrations.CreateModel(
+            name='TransactionIndexState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source_path', models.CharField(max_length=500, unique=True)),
+                ('file_size', models.BigIntegerField(default=0)),
+                ('file_mtime_ns', models.BigIntegerField(default=0)),
+                ('indexed_offset', models.BigIntegerField(default=0)),
+                ('offset_digest', models.CharField(blank=True, default='', max_length=40)),
+                ('row_count', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Transaction Index State',
+                'verbose_name_plural': 'Transaction Index States',
+            },
+        ),
+    ]
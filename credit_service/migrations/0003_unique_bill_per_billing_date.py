@@ -0,0 +1,17 @@
+# Generated by Django 5.2 on 2026-10-16 20:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('credit_service', '0002_transaction_index'),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='bill',
+            constraint=models.UniqueConstraint(fields=('loan', 'billing_date'), name='unique_bill_per_loan_per_billing_date'),
+        ),
+    ]
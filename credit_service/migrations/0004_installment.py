@@ -0,0 +1,34 @@
+# Generated by Django 5.2 on 2026-10-16 20:33
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('credit_service', '0003_unique_bill_per_billing_date'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Installment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('installment_number', models.PositiveIntegerField()),
+                ('due_date', models.DateField()),
+                ('amount_due', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('principal_component', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('interest_component', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('loan', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='installments', to='credit_service.loan')),
+            ],
+            options={
+                'verbose_name': 'Installment',
+                'verbose_name_plural': 'Installments',
+                'ordering': ['due_date'],
+                'indexes': [models.Index(fields=['loan', 'due_date'], name='installment_loan_due_date_idx')],
+                'constraints': [models.UniqueConstraint(fields=('loan', 'installment_number'), name='unique_installment_number_per_loan')],
+            },
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2 on 2026-10-16 20:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('credit_service', '0005_payment_idempotency_key'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='bill',
+            index=models.Index(fields=['loan', 'status'], name='bill_loan_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bill',
+            index=models.Index(condition=models.Q(('status__in', ['Pending', 'Partially Paid', 'Overdue'])), fields=['loan', 'due_date'], name='bill_outstanding_due_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='loan',
+            index=models.Index(fields=['status', 'principal_balance'], name='loan_status_principal_idx'),
+        ),
+    ]
@@ -0,0 +1,43 @@
+from datetime import timedelta
+from decimal import Decimal
+from django.db import migrations
+from django.db.models import Count, F, Max, Q, Sum
+
+BILLING_CYCLE_DAYS = 30
+OUTSTANDING_BILL_STATUSES = ['Pending', 'Partially Paid', 'Overdue']
+CHUNK_SIZE = 1000
+
+
+def populate_loan_summaries(apps, schema_editor):
+    Loan = apps.get_model('credit_service', 'Loan')
+    Bill = apps.get_model('credit_service', 'Bill')
+    outstanding = Q(status__in=OUTSTANDING_BILL_STATUSES)
+
+    loan_ids = list(Loan.objects.order_by('id').values_list('id', flat=True))
+    for i in range(0, len(loan_ids), CHUNK_SIZE):
+        loans = list(Loan.objects.filter(id__in=loan_ids[i:i + CHUNK_SIZE]).only('id', 'disbursement_date'))
+        aggregates = {
+            row['loan_id']: row for row in Bill.objects.filter(loan_id__in=[loan.id for loan in loans]).order_by().values('loan_id').annotate(
+                last_billing_date=Max('billing_date'),
+                outstanding_bill_count=Count('id', filter=outstanding),
+                outstanding_amount=Sum(F('min_due_amount') - F('amount_paid'), filter=outstanding),
+            )
+        }
+        for loan in loans:
+            row = aggregates.get(loan.id, {})
+            loan.last_billing_date = row.get('last_billing_date')
+            loan.next_billing_date = (loan.last_billing_date or loan.disbursement_date) + timedelta(days=BILLING_CYCLE_DAYS)
+            loan.outstanding_bill_count = row.get('outstanding_bill_count') or 0
+            loan.outstanding_amount = row.get('outstanding_amount') or Decimal('0.00')
+        Loan.objects.bulk_update(loans, ['last_billing_date', 'next_billing_date', 'outstanding_bill_count', 'outstanding_amount'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('credit_service', '0007_loan_summary_fields'),
+    ]
+
+    operations = [
+        migrations.RunPython(populate_loan_summaries, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2 on 2026-10-16 20:42
+
+from decimal import Decimal
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('credit_service', '0008_populate_loan_summaries'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bill',
+            name='late_fee',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=10),
+        ),
+    ]
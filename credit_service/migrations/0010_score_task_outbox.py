@@ -0,0 +1,26 @@
+# Generated by Django 5.2 on 2026-10-16 22:21
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('credit_service', '0009_bill_late_fee'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScoreTaskOutbox',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='credit_service.user')),
+            ],
+            options={
+                'verbose_name': 'Score Task Outbox Entry',
+                'verbose_name_plural': 'Score Task Outbox',
+            },
+        ),
+    ]
@@ -1,8 +1,11 @@
 
 from django.db import models
 import uuid
+from datetime import timedelta
 from decimal import Decimal
 
+BILLING_CYCLE_DAYS = 30
+
 #user model
 class User(models.Model):
     unique_user_id = models.UUIDField(default=uuid.uuid4, editable=False, unique=True, db_index=True)
@@ -44,16 +47,31 @@ class Loan(models.Model):
     disbursement_date = models.DateField()
     status = models.CharField(max_length=20, choices=LOAN_STATUS_CHOICES, default='Pending')
     principal_balance = models.DecimalField(max_digits=10, decimal_places=2, default=Decimal('0.00'))
+    # summary of the loan's bills, kept up to date by billing and payments (see credit_service.loan_summaries)
+    last_billing_date = models.DateField(null=True, blank=True)
+    next_billing_date = models.DateField(null=True, blank=True)
+    outstanding_bill_count = models.PositiveIntegerField(default=0)
+    outstanding_amount = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal('0.00'))
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return f"Loan {self.loan_id} for {self.user.name}"
 
+    def save(self, *args, **kwargs):
+        if self._state.adding and self.next_billing_date is None and self.disbursement_date:
+            self.next_billing_date = self.disbursement_date + timedelta(days=BILLING_CYCLE_DAYS) # first cycle
+        super().save(*args, **kwargs)
+
     class Meta:
         verbose_name = "Loan"
         verbose_name_plural = "Loans"
         ordering = ['-created_at']
+        indexes = [
+            # billing: active loans that still have a balance
+            models.Index(fields=['status', 'principal_balance'], name='loan_status_principal_idx'),
+            models.Index(fields=['next_billing_date'], name='loan_next_billing_date_idx'),
+        ]
 
 
 
@@ -73,6 +91,7 @@ class Bill(models.Model):
     interest_component = models.DecimalField(max_digits=10, decimal_places=2)
     min_due_amount = models.DecimalField(max_digits=10, decimal_places=2)
     amount_paid = models.DecimalField(max_digits=10, decimal_places=2, default=Decimal('0.00'))
+    late_fee = models.DecimalField(max_digits=10, decimal_places=2, default=Decimal('0.00')) # already included in min_due_amount
     status = models.CharField(max_length=20, choices=BILL_STATUS_CHOICES, default='Pending')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -84,6 +103,44 @@ class Bill(models.Model):
         verbose_name = "Bill"
         verbose_name_plural = "Bills"
         ordering = ['billing_date']
+        indexes = [
+            models.Index(fields=['loan', 'status'], name='bill_loan_status_idx'),
+            # payments: a loan's unpaid bills, oldest due first
+            models.Index(
+                fields=['loan', 'due_date'], name='bill_outstanding_due_date_idx',
+                condition=models.Q(status__in=['Pending', 'Partially Paid', 'Overdue'])
+            ),
+        ]
+        constraints = [
+            # also serves statements and billing (a loan's bills by billing date)
+            models.UniqueConstraint(fields=['loan', 'billing_date'], name='unique_bill_per_loan_per_billing_date'),
+        ]
+
+
+
+#installment model
+class Installment(models.Model):
+    loan = models.ForeignKey(Loan, on_delete=models.CASCADE, related_name='installments')
+    installment_number = models.PositiveIntegerField()
+    due_date = models.DateField()
+    amount_due = models.DecimalField(max_digits=10, decimal_places=2)
+    principal_component = models.DecimalField(max_digits=10, decimal_places=2)
+    interest_component = models.DecimalField(max_digits=10, decimal_places=2)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Installment {self.installment_number} for Loan {self.loan.loan_id} due {self.due_date}"
+
+    class Meta:
+        verbose_name = "Installment"
+        verbose_name_plural = "Installments"
+        ordering = ['due_date']
+        indexes = [
+            models.Index(fields=['loan', 'due_date'], name='installment_loan_due_date_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['loan', 'installment_number'], name='unique_installment_number_per_loan'),
+        ]
 
 
 
@@ -91,6 +148,7 @@ class Bill(models.Model):
 class Payment(models.Model):
     loan = models.ForeignKey(Loan, on_delete=models.CASCADE, related_name='payments')
     amount = models.DecimalField(max_digits=10, decimal_places=2)
+    idempotency_key = models.CharField(max_length=64, unique=True, null=True, blank=True) # client supplied, dedups retries
     payment_date = models.DateTimeField(auto_now_add=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
@@ -100,4 +158,52 @@ class Payment(models.Model):
     class Meta:
         verbose_name = "Payment"
         verbose_name_plural = "Payments"
-        ordering = ['-payment_date']
\ No newline at end of file
+        ordering = ['-payment_date']
+
+
+#transaction aggregate model
+class TransactionAggregate(models.Model):
+    aadhar_id = models.CharField(max_length=12, unique=True, db_index=True)
+    total_credit = models.DecimalField(max_digits=20, decimal_places=2, default=Decimal('0.00'))
+    total_debit = models.DecimalField(max_digits=20, decimal_places=2, default=Decimal('0.00'))
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Transactions for {self.aadhar_id}: +{self.total_credit} / -{self.total_debit}"
+
+    class Meta:
+        verbose_name = "Transaction Aggregate"
+        verbose_name_plural = "Transaction Aggregates"
+
+
+
+#transaction index state model
+class TransactionIndexState(models.Model):
+    source_path = models.CharField(max_length=500, unique=True)
+    file_size = models.BigIntegerField(default=0)
+    file_mtime_ns = models.BigIntegerField(default=0)
+    indexed_offset = models.BigIntegerField(default=0) # bytes of the csv already aggregated
+    offset_digest = models.CharField(max_length=40, blank=True, default='') # sha1 of the bytes just before indexed_offset
+    row_count = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Index of {self.source_path} at offset {self.indexed_offset}"
+
+    class Meta:
+        verbose_name = "Transaction Index State"
+        verbose_name_plural = "Transaction Index States"
+
+
+#score task outbox model
+class ScoreTaskOutbox(models.Model):
+    # users waiting to be handed to a credit score task (see credit_service.score_outbox), one row per user
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='+')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Credit score pending for user {self.user_id}"
+
+    class Meta:
+        verbose_name = "Score Task Outbox Entry"
+        verbose_name_plural = "Score Task Outbox"
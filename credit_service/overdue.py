@@ -0,0 +1,85 @@
+
+import logging
+import time
+from dataclasses import dataclass, field
+from decimal import Decimal
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, Max, Min, OuterRef, Subquery, Value
+from django.utils import timezone
+from .models import Loan, Bill
+
+logger = logging.getLogger(__name__)
+
+OVERDUE_CHUNK_SIZE = 50000 # bill ids per UPDATE
+LATE_FEE_AMOUNT = Decimal(getattr(settings, 'LATE_FEE_AMOUNT', '0.00'))
+
+UNPAID_BILL_STATUSES = [
+    Bill.BILL_STATUS_CHOICES[0][0], # pending
+    Bill.BILL_STATUS_CHOICES[2][0], # partially paid
+]
+
+
+@dataclass
+class SweepResult:
+    marked: int = 0
+    late_fees: Decimal = field(default_factory=lambda: Decimal('0.00'))
+    chunks: int = 0
+    seconds: float = 0.0
+
+
+def mark_overdue_bills(first_id: int, last_id: int, as_of, late_fee: Decimal = Decimal('0.00')) -> int:
+    """
+        marks the unpaid bills with first_id <= id < last_id that were due before `as_of` as Overdue, in one
+        transaction and without reading them into python. a late fee is added to each bill's min due and to its
+        loan's outstanding amount in the same pass. returns how many bills were marked.
+    """
+    now = timezone.now()
+    becoming_overdue = Bill.objects.filter(
+        id__gte=first_id, id__lt=last_id, status__in=UNPAID_BILL_STATUSES, due_date__lt=as_of
+    )
+
+    with transaction.atomic():
+        if late_fee:
+            # loans first: payments lock the loan before its bills, so do we
+            new_overdue_count = becoming_overdue.filter(loan=OuterRef('pk')).order_by().values('loan').annotate(
+                bills=Count('id')
+            ).values('bills')
+            Loan.objects.filter(id__in=becoming_overdue.values('loan_id')).update(
+                outstanding_amount=ExpressionWrapper(
+                    F('outstanding_amount') + Subquery(new_overdue_count) * Value(late_fee),
+                    output_field=DecimalField(max_digits=12, decimal_places=2)
+                )
+            )
+        return becoming_overdue.update(
+            status=Bill.BILL_STATUS_CHOICES[3][0], # overdue
+            late_fee=F('late_fee') + late_fee,
+            min_due_amount=F('min_due_amount') + late_fee,
+            updated_at=now
+        )
+
+
+def sweep_overdue_bills(as_of=None, late_fee: Decimal = None, chunk_size: int = OVERDUE_CHUNK_SIZE, progress=None) -> SweepResult:
+    """
+        overdue sweep over the whole bill table in bill-id ranges of `chunk_size`, one UPDATE (two with a late fee)
+        per range. safe to re-run: bills already marked are no longer unpaid and are left alone.
+    """
+    as_of = as_of or timezone.localdate()
+    late_fee = LATE_FEE_AMOUNT if late_fee is None else late_fee
+    result = SweepResult()
+    started = time.perf_counter()
+
+    id_range = Bill.objects.aggregate(first=Min('id'), last=Max('id')) # primary key ends, no scan
+    if id_range['first'] is not None:
+        for first_id in range(id_range['first'], id_range['last'] + 1, chunk_size):
+            marked = mark_overdue_bills(first_id, first_id + chunk_size, as_of, late_fee)
+            result.marked += marked
+            result.late_fees += marked * late_fee
+            result.chunks += 1
+            if progress:
+                progress(result, min(first_id + chunk_size - 1, id_range['last']), id_range['last'])
+
+    result.seconds = time.perf_counter() - started
+    logger.info(f"Overdue sweep as of {as_of}: {result.marked} bills marked overdue, late fees {result.late_fees} "
+                f"in {result.chunks} chunks ({result.seconds:.2f}s).")
+    return result
@@ -0,0 +1,272 @@
+
+import logging
+from decimal import Decimal
+from django.conf import settings
+from django.core.cache import caches
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from .models import Loan, Bill, Payment
+from .statement_cache import invalidate_statements
+
+logger = logging.getLogger(__name__)
+
+PAYMENT_CHUNK_SIZE = 200
+PAYMENT_INTERNAL_ERROR = "payment processing failed due to a internal error."
+IDEMPOTENCY_KEY_REUSED = "idempotency key was already used for a different payment."
+IDEMPOTENCY_CACHE_ALIAS = getattr(settings, 'IDEMPOTENCY_CACHE_ALIAS', 'idempotency')
+
+OUTSTANDING_BILL_STATUSES = [
+    Bill.BILL_STATUS_CHOICES[0][0], # pending
+    Bill.BILL_STATUS_CHOICES[2][0], # partially paid
+    Bill.BILL_STATUS_CHOICES[3][0], # overdue
+]
+
+
+class PaymentRejected(Exception):
+    """
+        the payment cannot be applied to this loan (not found, not active, nothing outstanding).
+    """
+    pass
+
+
+def allocate_payment(bills, payment_amount: Decimal):
+    """
+        in-memory waterfall: pays the bills in order (oldest due first) and returns (changed bills, remaining amount).
+    """
+    remaining_payment = payment_amount
+    changed_bills = []
+
+    for bill in bills:
+        if remaining_payment <= Decimal('0.00'):
+            break
+
+        amount_due_on_bill = bill.min_due_amount - bill.amount_paid
+        payment_for_this_bill = min(remaining_payment, amount_due_on_bill)
+
+        if payment_for_this_bill > Decimal('0.00'):
+            bill.amount_paid += payment_for_this_bill
+            if bill.amount_paid >= bill.min_due_amount:
+                bill.status = Bill.BILL_STATUS_CHOICES[1][0] # paid
+            else:
+                bill.status = Bill.BILL_STATUS_CHOICES[2][0] # partially paid
+            changed_bills.append(bill)
+            remaining_payment -= payment_for_this_bill
+
+    return changed_bills, remaining_payment
+
+
+def settle_payment(loan, bills, payment_amount: Decimal, now):
+    """
+        applies one payment to an already locked loan and its outstanding bills, in memory.
+        mutates `loan` (balance, status and bill summary) and `bills`, returns the bills that changed; raises PaymentRejected.
+    """
+    if loan.status != Loan.LOAN_STATUS_CHOICES[1][0]: # Active
+        raise PaymentRejected(f"loan is not active (Status: {loan.status}).")
+
+    outstanding_bills = [bill for bill in bills if bill.status != Bill.BILL_STATUS_CHOICES[1][0]]
+    if not outstanding_bills and loan.principal_balance <= Decimal('0.00'):
+        raise PaymentRejected("no outstanding amount or bills found for this loan.")
+
+    changed_bills, remaining_payment = allocate_payment(outstanding_bills, payment_amount)
+    for bill in changed_bills:
+        bill.updated_at = now
+
+    # the bill summary is recomputed from the locked rows: the stored counters are only a cache and are stale for
+    # loans written outside billing and payments (fixtures, bulk_create)
+    still_outstanding = [bill for bill in outstanding_bills if bill.status != Bill.BILL_STATUS_CHOICES[1][0]]
+    loan.outstanding_bill_count = len(still_outstanding)
+    loan.outstanding_amount = sum((bill.min_due_amount - bill.amount_paid for bill in still_outstanding), Decimal('0.00'))
+
+    if remaining_payment > Decimal('0.00') and loan.principal_balance > Decimal('0.00'):
+        loan.principal_balance -= min(remaining_payment, loan.principal_balance)
+
+    if loan.principal_balance <= Decimal('0.00') and not still_outstanding:
+        loan.status = Loan.LOAN_STATUS_CHOICES[2][0] # Closed
+
+    return changed_bills
+
+
+LOCKED_LOAN_FIELDS = ('id', 'loan_id', 'status', 'principal_balance', 'outstanding_bill_count', 'outstanding_amount')
+
+
+def _outstanding_bills(loan_pks):
+    if not loan_pks:
+        return []
+    return Bill.objects.select_for_update().filter(
+        loan_id__in=loan_pks, status__in=OUTSTANDING_BILL_STATUSES
+    ).order_by('due_date', 'id').only('id', 'loan_id', 'min_due_amount', 'amount_paid', 'status')
+
+
+def _idempotency_cache_key(idempotency_key: str) -> str:
+    return f"payment:idempotency:{idempotency_key}"
+
+
+def _remember_payments(recorded):
+    """
+        caches (idempotency_key, loan_id, amount) of recorded payments once the current transaction commits.
+    """
+    recorded = {key: (str(loan_id), str(amount)) for key, loan_id, amount in recorded if key}
+    if not recorded:
+        return
+
+    def remember():
+        try:
+            caches[IDEMPOTENCY_CACHE_ALIAS].set_many({_idempotency_cache_key(key): value for key, value in recorded.items()})
+        except Exception as e:
+            logger.warning(f"Failed to cache {len(recorded)} payment idempotency keys: {e}")
+
+    transaction.on_commit(remember)
+
+
+def _is_replay(recorded, loan_id, payment_amount: Decimal) -> bool:
+    # same key for the same payment is a retry, the same key for anything else is a client bug
+    recorded_loan_id, recorded_amount = recorded
+    if str(recorded_loan_id) != str(loan_id) or Decimal(recorded_amount) != payment_amount:
+        raise PaymentRejected(IDEMPOTENCY_KEY_REUSED)
+    return True
+
+
+def find_recorded_payment(loan_id, payment_amount: Decimal, idempotency_key: str) -> bool:
+    """
+        true if a payment with this idempotency key was already recorded (cache first, then the unique index),
+        without locking anything. raises PaymentRejected if the key belongs to a different payment.
+    """
+    if not idempotency_key:
+        return False
+
+    cache = caches[IDEMPOTENCY_CACHE_ALIAS]
+    try:
+        recorded = cache.get(_idempotency_cache_key(idempotency_key))
+    except Exception as e:
+        logger.warning(f"Idempotency cache unavailable, checking the database: {e}")
+        recorded = None
+
+    if recorded is None:
+        recorded = Payment.objects.filter(idempotency_key=idempotency_key).values_list('loan__loan_id', 'amount').first()
+        if recorded is None:
+            return False
+        try:
+            cache.set(_idempotency_cache_key(idempotency_key), (str(recorded[0]), str(recorded[1])))
+        except Exception:
+            pass
+
+    return _is_replay(recorded, loan_id, payment_amount)
+
+
+def apply_payment(loan_id, payment_amount: Decimal, idempotency_key: str = None) -> Payment:
+    """
+        applies a payment to a loan's outstanding bills, then to its principal, closing the loan once nothing is left.
+        takes the row locks once (loan, then its outstanding bills) and writes everything back in bulk.
+        returns the new Payment, or None when `idempotency_key` identifies a payment that was already recorded.
+    """
+    if find_recorded_payment(loan_id, payment_amount, idempotency_key):
+        return None
+
+    try:
+        with transaction.atomic():
+            try:
+                loan = Loan.objects.select_for_update().only(*LOCKED_LOAN_FIELDS).get(loan_id=loan_id)
+            except Loan.DoesNotExist:
+                raise PaymentRejected("loan not found.")
+
+            old_principal_balance, old_status = loan.principal_balance, loan.status
+            now = timezone.now()
+            bills = list(_outstanding_bills([loan.pk]))
+            changed_bills = settle_payment(loan, bills, payment_amount, now)
+            Bill.objects.bulk_update(changed_bills, ['amount_paid', 'status', 'updated_at'])
+
+            if changed_bills or loan.principal_balance != old_principal_balance or loan.status != old_status:
+                # the row is locked, so the balance we read is still current; the filter is a guard against that changing
+                updated = Loan.objects.filter(pk=loan.pk, principal_balance=old_principal_balance).update(
+                    principal_balance=loan.principal_balance, status=loan.status, outstanding_bill_count=loan.outstanding_bill_count,
+                    outstanding_amount=loan.outstanding_amount, updated_at=now
+                )
+                if updated != 1:
+                    raise RuntimeError(f"loan {loan.loan_id} changed while its payment was being applied.")
+
+            payment = Payment.objects.create(loan=loan, amount=payment_amount, idempotency_key=idempotency_key)
+            invalidate_statements([loan.loan_id])
+            _remember_payments([(idempotency_key, loan.loan_id, payment_amount)])
+    except IntegrityError:
+        # a concurrent retry with the same key committed first; everything above was rolled back
+        if find_recorded_payment(loan_id, payment_amount, idempotency_key):
+            return None
+        raise
+
+    return payment
+
+
+def apply_payment_batch(payments) -> list:
+    """
+        applies a chunk of (loan_id, amount, idempotency_key) payments in one transaction and returns one error
+        message (or None) per payment. payments are grouped by loan, so every loan and its bills are locked and
+        read once, and payments to the same loan are applied in their input order. rows whose idempotency key is
+        already recorded are treated as successful retries and not applied again.
+    """
+    results = [None] * len(payments)
+
+    with transaction.atomic():
+        # lock in pk order so that concurrent batches cannot deadlock on each other
+        loans = {
+            loan.loan_id: loan for loan in Loan.objects.select_for_update().filter(
+                loan_id__in={loan_id for loan_id, _, _ in payments}
+            ).order_by('id').only(*LOCKED_LOAN_FIELDS)
+        }
+        bills_by_loan = {loan.pk: [] for loan in loans.values()}
+        for bill in _outstanding_bills([loan.pk for loan in loans.values()]):
+            bills_by_loan[bill.loan_id].append(bill)
+        idempotency_keys = {key for _, _, key in payments if key}
+        recorded_keys = {
+            key: (loan_id, amount) for key, loan_id, amount in Payment.objects.filter(
+                idempotency_key__in=idempotency_keys
+            ).values_list('idempotency_key', 'loan__loan_id', 'amount')
+        } if idempotency_keys else {}
+
+        now = timezone.now()
+        summary = lambda loan: (loan.principal_balance, loan.status, loan.outstanding_bill_count, loan.outstanding_amount)
+        original_loans = {loan.pk: summary(loan) for loan in loans.values()}
+        changed_bills = {}
+        new_payments = []
+        for i, (loan_id, payment_amount, idempotency_key) in enumerate(payments):
+            loan = loans.get(loan_id)
+            try:
+                if idempotency_key in recorded_keys and _is_replay(recorded_keys[idempotency_key], loan_id, payment_amount):
+                    continue
+                if loan is None:
+                    raise PaymentRejected("loan not found.")
+                for bill in settle_payment(loan, bills_by_loan[loan.pk], payment_amount, now):
+                    changed_bills[bill.pk] = bill
+            except PaymentRejected as e:
+                results[i] = str(e)
+                continue
+            new_payments.append(Payment(loan=loan, amount=payment_amount, idempotency_key=idempotency_key))
+            if idempotency_key:
+                recorded_keys[idempotency_key] = (loan_id, payment_amount)
+
+        changed_loans = [loan for loan in loans.values() if summary(loan) != original_loans[loan.pk]]
+        for loan in changed_loans:
+            loan.updated_at = now
+
+        Bill.objects.bulk_update(changed_bills.values(), ['amount_paid', 'status', 'updated_at'])
+        Loan.objects.bulk_update(changed_loans, ['principal_balance', 'status', 'outstanding_bill_count', 'outstanding_amount', 'updated_at'])
+        Payment.objects.bulk_create(new_payments)
+        invalidate_statements({payment.loan.loan_id for payment in new_payments})
+        _remember_payments([(payment.idempotency_key, payment.loan.loan_id, payment.amount) for payment in new_payments])
+
+    return results
+
+
+def apply_payments(payments, chunk_size: int = PAYMENT_CHUNK_SIZE) -> list:
+    """
+        applies payments in consecutive chunks of `chunk_size`, one transaction each. a chunk that fails as a
+        whole is rolled back and reported as an internal error on each of its payments.
+    """
+    results = []
+    for i in range(0, len(payments), chunk_size):
+        chunk = payments[i:i + chunk_size]
+        try:
+            results.extend(apply_payment_batch(chunk))
+        except Exception as e:
+            logger.error(f"Error applying payments {i + 1}..{i + len(chunk)} of {len(payments)}: {e}", exc_info=True)
+            results.extend([PAYMENT_INTERNAL_ERROR] * len(chunk))
+    return results
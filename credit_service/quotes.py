@@ -0,0 +1,50 @@
+
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from django.conf import settings
+from .utils import calculate_emi_schedule_fast, EMICalculationError
+
+logger = logging.getLogger(__name__)
+
+# offers are priced in a process pool only when LOAN_QUOTE_WORKERS > 0 and the list is at least this long
+LOAN_QUOTE_WORKERS = getattr(settings, 'LOAN_QUOTE_WORKERS', 0)
+LOAN_QUOTE_POOL_MIN_OFFERS = getattr(settings, 'LOAN_QUOTE_POOL_MIN_OFFERS', 20)
+
+_pool = None
+
+
+def _get_pool():
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=LOAN_QUOTE_WORKERS)
+    return _pool
+
+
+def quote_offer(loan_amount, interest_rate, term_period, annual_income, disbursement_date):
+    """
+        prices one offer: returns ([(due_date, amount_due), ...], None) or ([], rejection reason).
+    """
+    try:
+        schedule = calculate_emi_schedule_fast(
+            loan_amount=loan_amount,
+            annual_interest_rate=interest_rate,
+            term_months=term_period,
+            annual_income=annual_income,
+            disbursement_date=disbursement_date
+        )
+    except EMICalculationError as e:
+        return [], str(e)
+    return [(item['due_date'], item['amount_due']) for item in schedule], None
+
+
+def quote_loan_offers(offers, annual_income, disbursement_date) -> list:
+    """
+        prices every offer for one user, in order. large lists go to a process pool if one is configured.
+    """
+    args = [
+        (offer['loan_amount'], offer['interest_rate'], offer['term_period'], annual_income, disbursement_date)
+        for offer in offers
+    ]
+    if LOAN_QUOTE_WORKERS > 0 and len(args) >= LOAN_QUOTE_POOL_MIN_OFFERS:
+        return list(_get_pool().map(quote_offer, *zip(*args), chunksize=max(1, len(args) // (LOAN_QUOTE_WORKERS * 4))))
+    return [quote_offer(*offer_args) for offer_args in args]
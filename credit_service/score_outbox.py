@@ -0,0 +1,78 @@
+
+import threading
+import time
+import logging
+from django.conf import settings
+from django.db import connection, transaction
+from .models import ScoreTaskOutbox
+from .tasks import bulk_update_credit_scores
+
+logger = logging.getLogger(__name__)
+
+SCORE_OUTBOX_BATCH_SIZE = getattr(settings, 'SCORE_OUTBOX_BATCH_SIZE', 500)
+
+
+def enqueue_credit_score(user_ids):
+    """
+        records, in the caller's transaction, that these users need a credit score. a user already waiting keeps
+        their single row, so repeated requests coalesce. the relay is woken once the transaction commits; the
+        request itself never talks to the broker.
+    """
+    ScoreTaskOutbox.objects.bulk_create([ScoreTaskOutbox(user_id=user_id) for user_id in user_ids], ignore_conflicts=True)
+    transaction.on_commit(wake_relay)
+
+
+def relay_score_outbox(batch_size: int = SCORE_OUTBOX_BATCH_SIZE) -> int:
+    """
+        hands waiting users to Celery, one bulk_update_credit_scores task per batch. a batch is read, published and
+        only then deleted in its own short transaction, so no write lock is held during the broker call. if the
+        broker call fails the rows stay for the next run; a batch read by two relays at once is published twice
+        (scoring twice is harmless). users whose task then fails are picked up by the pending scores sweep (beat).
+        returns the number of users relayed.
+    """
+    relayed = 0
+    while True:
+        rows = list(ScoreTaskOutbox.objects.order_by('id').values_list('id', 'user_id')[:batch_size])
+        if not rows:
+            break
+        bulk_update_credit_scores.delay(user_ids=[user_id for _, user_id in rows])
+        with transaction.atomic():
+            ScoreTaskOutbox.objects.filter(id__in=[row_id for row_id, _ in rows]).delete()
+        relayed += len(rows)
+        if len(rows) < batch_size:
+            break
+
+    if relayed:
+        logger.info(f"Relayed {relayed} users from the score task outbox.")
+    return relayed
+
+
+# in-process relay: one daemon thread per process, started on first use. it waits SCORE_OUTBOX_COALESCE_SECONDS
+# after a wake up so registrations arriving together share one task, then drains the outbox.
+_wake = threading.Event()
+_relay_thread = None
+_relay_lock = threading.Lock()
+
+
+def _relay_loop():
+    while True:
+        _wake.wait()
+        time.sleep(settings.SCORE_OUTBOX_COALESCE_SECONDS)
+        _wake.clear()
+        try:
+            relay_score_outbox()
+        except Exception as e:
+            logger.error(f"Score task outbox relay failed, rows are kept for the next run: {e}", exc_info=True)
+        finally:
+            connection.close() # this thread's own connection, not kept open while idle
+
+
+def wake_relay():
+    global _relay_thread
+    if not settings.SCORE_OUTBOX_RELAY_THREAD:
+        return # left to the periodic relay_score_outbox_task
+    with _relay_lock:
+        if _relay_thread is None or not _relay_thread.is_alive():
+            _relay_thread = threading.Thread(target=_relay_loop, name='score-outbox-relay', daemon=True)
+            _relay_thread.start()
+    _wake.set()
@@ -12,18 +12,12 @@ class UserRegistrationSerializer(serializers.Serializer):
     email_id = serializers.EmailField()
     annual_income = serializers.DecimalField(max_digits=15, decimal_places=2, min_value=Decimal('0.00'))
 
+    # uniqueness of aadhar_id and email_id is left to the database constraints, see RegisterUserView
     def validate_aadhar_id(self, value):
-        if not value.isdigit(): # AadharID already exists.
+        if not value.isdigit():
             raise serializers.ValidationError("Aadhar ID must contain only digits.")
-        if User.objects.filter(aadhar_id=value).exists():
-            raise serializers.ValidationError("User with this Aadhar ID already exists.")
         return value
 
-    def validate_email_id(self, value):
-        if User.objects.filter(email_id=value).exists():
-            raise serializers.ValidationError("User with this Email ID already exists.")
-        return value
-    
 
 class UserResponseSerializer(serializers.ModelSerializer):
     class Meta:
@@ -43,6 +37,21 @@ class LoanApplicationSerializer(serializers.Serializer):
     disbursement_date = serializers.DateField()
 
 
+#LoanQuoteRequestSerializer
+MAX_QUOTE_OFFERS = 100
+
+class LoanOfferSerializer(serializers.Serializer):
+    loan_amount = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=Decimal('0.01'), max_value=Decimal('5000.00'))
+    interest_rate = serializers.DecimalField(max_digits=5, decimal_places=2, min_value=Decimal('12.00')) # Min 12%
+    term_period = serializers.IntegerField(min_value=1) # minimum 1 month
+
+
+class LoanQuoteRequestSerializer(serializers.Serializer):
+    unique_user_id = serializers.UUIDField()
+    disbursement_date = serializers.DateField(required=False) # defaults to today
+    offers = LoanOfferSerializer(many=True, allow_empty=False, max_length=MAX_QUOTE_OFFERS)
+
+
 class EMIDetailSerializer(serializers.Serializer):
     Date = serializers.DateField(format="%Y-%m-%d") 
     Amount_due = serializers.DecimalField(max_digits=10, decimal_places=2)
@@ -57,6 +66,18 @@ class LoanResponseSerializer(serializers.Serializer):
 class MakePaymentSerializer(serializers.Serializer):
     loan_id = serializers.UUIDField()
     amount = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=Decimal('0.01')) 
+    idempotency_key = serializers.CharField(max_length=64, required=False, allow_null=True, allow_blank=True) # retries with the same key are recorded once
+
+    def validate_idempotency_key(self, value):
+        return value or None # empty CSV cells mean no key
+
+
+#MakePaymentsSerializer
+MAX_BATCH_PAYMENTS = 1000
+
+class MakePaymentsSerializer(serializers.Serializer):
+    # rows are validated one by one with MakePaymentSerializer, so one bad row does not reject the batch
+    payments = serializers.ListField(child=serializers.DictField(), allow_empty=False, max_length=MAX_BATCH_PAYMENTS)
 
 
 
@@ -72,3 +93,23 @@ class UpcomingTransactionSerializer(serializers.Serializer):
     Date = serializers.DateField(format="%Y-%m-%d") 
     Amount_due = serializers.DecimalField(max_digits=10, decimal_places=2)
 
+
+# Fast paths for the statement shapes above: plain functions over (date, Decimal...) tuples that produce
+# exactly what PastTransactionSerializer/UpcomingTransactionSerializer would, without per-field objects.
+def serialize_past_transactions(bills):
+    return [
+        {
+            "Date": billing_date.isoformat(),
+            "Principal": f"{principal:.2f}",
+            "Interest": f"{interest:.2f}",
+            "Amount_paid": f"{amount_paid:.2f}"
+        }
+        for billing_date, principal, interest, amount_paid in bills
+    ]
+
+
+def serialize_upcoming_transactions(transactions):
+    return [
+        {"Date": due_date.isoformat(), "Amount_due": f"{amount_due:.2f}"}
+        for due_date, amount_due in transactions
+    ]
@@ -0,0 +1,167 @@
+
+import logging
+import threading
+import uuid
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+from django.http import HttpResponse
+from rest_framework.renderers import JSONRenderer
+
+logger = logging.getLogger(__name__)
+
+STATEMENT_CACHE_ALIAS = getattr(settings, 'STATEMENT_CACHE_ALIAS', 'statements')
+
+_stats_lock = threading.Lock()
+_stats = {'hits': 0, 'misses': 0, 'stores': 0, 'invalidations': 0}
+
+
+def _count(name: str, amount: int = 1):
+    with _stats_lock:
+        _stats[name] += amount
+
+
+def statement_cache_stats() -> dict:
+    """
+        hit/miss/store/invalidation counters of this process, plus the hit ratio.
+    """
+    with _stats_lock:
+        stats = dict(_stats)
+    lookups = stats['hits'] + stats['misses']
+    stats['hit_ratio'] = stats['hits'] / lookups if lookups else 0.0
+    return stats
+
+
+def _cache():
+    return caches[STATEMENT_CACHE_ALIAS]
+
+
+def _version_key(loan_id) -> str:
+    return f"statement:version:{loan_id}"
+
+
+def _payload_key(loan_id, version: str) -> str:
+    return f"statement:{loan_id}:{version}"
+
+
+def statement_version(loan_id) -> str:
+    """
+        current version stamp of a loan's statement. must be read before the database so that a payload built from
+        data older than a concurrent write ends up under a stamp that the write has already replaced.
+    """
+    cache = _cache()
+    try:
+        version = cache.get(_version_key(loan_id))
+        if version is None:
+            cache.add(_version_key(loan_id), uuid.uuid4().hex, timeout=None)
+            version = cache.get(_version_key(loan_id))
+    except Exception as e:
+        logger.warning(f"Statement cache unavailable, serving loan {loan_id} uncached: {e}")
+        return None
+    return version
+
+
+def _in_process(cache) -> bool:
+    # local memory never blocks, so the async helpers call it directly instead of paying a thread hop per lookup
+    return isinstance(cache, (LocMemCache, DummyCache))
+
+
+async def astatement_version(loan_id) -> str:
+    """
+        statement_version() for async views: awaits the cache unless it lives in this process.
+    """
+    cache = _cache()
+    if _in_process(cache):
+        return statement_version(loan_id)
+    try:
+        version = await cache.aget(_version_key(loan_id))
+        if version is None:
+            await cache.aadd(_version_key(loan_id), uuid.uuid4().hex, timeout=None)
+            version = await cache.aget(_version_key(loan_id))
+    except Exception as e:
+        logger.warning(f"Statement cache unavailable, serving loan {loan_id} uncached: {e}")
+        return None
+    return version
+
+
+def get_cached_statement(loan_id, version: str):
+    """
+        returns the cached (status_code, json bytes) for this version of the statement, or None.
+    """
+    cached = None
+    if version is not None:
+        try:
+            cached = _cache().get(_payload_key(loan_id, version))
+        except Exception as e:
+            logger.warning(f"Statement cache unavailable, serving loan {loan_id} uncached: {e}")
+    _count('hits' if cached is not None else 'misses')
+    return cached
+
+
+async def aget_cached_statement(loan_id, version: str):
+    if _in_process(_cache()):
+        return get_cached_statement(loan_id, version)
+    cached = None
+    if version is not None:
+        try:
+            cached = await _cache().aget(_payload_key(loan_id, version))
+        except Exception as e:
+            logger.warning(f"Statement cache unavailable, serving loan {loan_id} uncached: {e}")
+    _count('hits' if cached is not None else 'misses')
+    return cached
+
+
+def store_statement(loan_id, version: str, status_code: int, payload: dict):
+    """
+        renders a statement payload once and caches the bytes under its version stamp.
+    """
+    cached = (status_code, JSONRenderer().render(payload))
+    if version is not None:
+        try:
+            _cache().set(_payload_key(loan_id, version), cached)
+        except Exception as e:
+            logger.warning(f"Failed to cache the statement of loan {loan_id}: {e}")
+        else:
+            _count('stores')
+    return cached
+
+
+async def astore_statement(loan_id, version: str, status_code: int, payload: dict):
+    if _in_process(_cache()):
+        return store_statement(loan_id, version, status_code, payload)
+    cached = (status_code, JSONRenderer().render(payload))
+    if version is not None:
+        try:
+            await _cache().aset(_payload_key(loan_id, version), cached)
+        except Exception as e:
+            logger.warning(f"Failed to cache the statement of loan {loan_id}: {e}")
+        else:
+            _count('stores')
+    return cached
+
+
+def invalidate_statements(loan_ids):
+    """
+        bumps the version stamp of the given loans once the current transaction commits, so every cached
+        statement of those loans becomes unreachable.
+    """
+    loan_ids = list(loan_ids)
+    if not loan_ids:
+        return
+
+    def bump():
+        try:
+            _cache().set_many({_version_key(loan_id): uuid.uuid4().hex for loan_id in loan_ids}, timeout=None)
+        except Exception as e:
+            logger.error(f"Failed to invalidate cached statements for {len(loan_ids)} loans: {e}", exc_info=True)
+            return
+        _count('invalidations', len(loan_ids))
+
+    transaction.on_commit(bump)
+
+
+def statement_response(cached) -> HttpResponse:
+    status_code, content = cached
+    return HttpResponse(content, status=status_code, content_type='application/json')
@@ -0,0 +1,126 @@
+
+import csv
+import random
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+from decimal import Decimal
+from django.db import transaction
+from .billing import calculate_bill_amounts, BILL_DUE_DAYS
+from .models import User, Loan, Bill, Payment, BILLING_CYCLE_DAYS
+
+SYNTHETIC_AADHAR_START = 900000000000 # synthetic users get consecutive AADHARIDs from here
+SYNTHETIC_EMAIL_DOMAIN = 'synthetic.invalid'
+SYNTHETIC_BATCH_SIZE = 1000 # users per transaction
+
+
+def synthetic_aadhar_ids(count: int, start: int = SYNTHETIC_AADHAR_START) -> list:
+    return [f"{start + i}" for i in range(count)]
+
+
+def write_transactions_csv(path: str, rows: int, aadhar_ids: list, seed: int = 0):
+    rng = random.Random(seed)
+    with open(path, mode='w', encoding='utf-8', newline='') as csvfile:
+        writer = csv.writer(csvfile)
+        writer.writerow(['AADHARID', 'Date', 'Amount', 'Transaction_type'])
+        for _ in range(rows):
+            writer.writerow([
+                rng.choice(aadhar_ids),
+                '2024-01-01',
+                f"{rng.randint(100, 5000000) / 100:.2f}",
+                'CREDIT' if rng.random() < 0.6 else 'DEBIT',
+            ])
+
+
+@dataclass
+class SyntheticData:
+    user_ids: list = field(default_factory=list) # unique_user_id
+    loan_ids: list = field(default_factory=list) # loan_id
+    bills: int = 0
+    payments: int = 0
+
+
+def synthetic_loan(user, rng, bills_per_loan: int, as_of: date):
+    """
+        an Active loan with `bills_per_loan` bills (all paid but the last) ending on or before `as_of`, so its next
+        cycle ends within the 30 days after `as_of`, and the summary fields they imply, all unsaved.
+    """
+    loan_amount = Decimal(rng.randrange(5000, 500000, 500))
+    interest_rate = Decimal(rng.choice(('12.00', '14.50', '16.00', '18.00', '21.00', '24.00')))
+    disbursement_date = as_of - timedelta(days=BILLING_CYCLE_DAYS * bills_per_loan + rng.randrange(BILLING_CYCLE_DAYS))
+    loan = Loan(user=user, loan_amount=loan_amount, interest_rate=interest_rate, term_period=bills_per_loan + rng.choice((12, 24, 36)),
+                disbursement_date=disbursement_date, status=Loan.LOAN_STATUS_CHOICES[1][0]) # Active
+
+    bills = []
+    principal_balance = loan_amount
+    for cycle in range(1, bills_per_loan + 1):
+        billing_date = disbursement_date + timedelta(days=BILLING_CYCLE_DAYS * cycle)
+        principal_component, interest_component, min_due = calculate_bill_amounts(principal_balance, interest_rate)
+        paid = cycle < bills_per_loan
+        bills.append(Bill(
+            loan=loan, billing_date=billing_date, due_date=billing_date + timedelta(days=BILL_DUE_DAYS),
+            principal_component=principal_component, interest_component=interest_component, min_due_amount=min_due,
+            amount_paid=min_due if paid else Decimal('0.00'),
+            status=Bill.BILL_STATUS_CHOICES[1][0] if paid else Bill.BILL_STATUS_CHOICES[0][0] # paid / pending
+        ))
+        if paid:
+            principal_balance -= principal_component
+
+    loan.principal_balance = principal_balance
+    loan.last_billing_date = bills[-1].billing_date if bills else None
+    loan.next_billing_date = (loan.last_billing_date or disbursement_date) + timedelta(days=BILLING_CYCLE_DAYS)
+    loan.outstanding_bill_count = 1 if bills else 0
+    loan.outstanding_amount = bills[-1].min_due_amount if bills else Decimal('0.00')
+    return loan, bills
+
+
+def generate_synthetic_data(users: int, loans_per_user: int = 1, bills_per_loan: int = 12, payments_per_loan: int = 3,
+                            as_of: date = None, seed: int = 0, aadhar_start: int = SYNTHETIC_AADHAR_START,
+                            batch_size: int = SYNTHETIC_BATCH_SIZE, progress=None) -> SyntheticData:
+    """
+        creates `users` users with their loans, bill history and payments, consistent with what billing and
+        payments would have written, in bulk inserts of `batch_size` users per transaction. the same seed always
+        gives a user the same data (apart from generated UUIDs and timestamps).
+    """
+    as_of = as_of or date.today()
+    aadhar_ids = synthetic_aadhar_ids(users, aadhar_start)
+    data = SyntheticData()
+
+    for i in range(0, users, batch_size):
+        with transaction.atomic():
+            # one random stream per user, so a user's data does not depend on the batch size or the scale
+            rngs = [random.Random(f"{seed}:{aadhar_id}") for aadhar_id in aadhar_ids[i:i + batch_size]]
+            new_users = User.objects.bulk_create(
+                User(aadhar_id=aadhar_id, name=f"Synthetic {aadhar_id}", email_id=f"{aadhar_id}@{SYNTHETIC_EMAIL_DOMAIN}",
+                     annual_income=Decimal(rng.randrange(150000, 3000000, 1000)), credit_score=rng.randrange(450, 901))
+                for aadhar_id, rng in zip(aadhar_ids[i:i + batch_size], rngs)
+            )
+
+            loans, bills = [], []
+            for user, rng in zip(new_users, rngs):
+                for _ in range(loans_per_user):
+                    loan, loan_bills = synthetic_loan(user, rng, bills_per_loan, as_of)
+                    loans.append(loan)
+                    bills.extend(loan_bills)
+            Loan.objects.bulk_create(loans)
+            for bill in bills:
+                bill.loan_id = bill.loan.pk
+            Bill.objects.bulk_create(bills, batch_size=batch_size)
+
+            paid_by_loan = {}
+            for bill in bills:
+                paid_by_loan[bill.loan_id] = paid_by_loan.get(bill.loan_id, Decimal('0.00')) + bill.amount_paid
+            payments = [
+                Payment(loan=loan, amount=(paid_by_loan[loan.pk] / payments_per_loan).quantize(Decimal('0.01')))
+                for loan in loans if paid_by_loan.get(loan.pk)
+                for _ in range(payments_per_loan)
+            ]
+            Payment.objects.bulk_create(payments, batch_size=batch_size)
+
+        data.user_ids.extend(user.unique_user_id for user in new_users)
+        data.loan_ids.extend(loan.loan_id for loan in loans)
+        data.bills += len(bills)
+        data.payments += len(payments)
+        if progress:
+            progress(min(i + batch_size, users), users)
+
+    return data
@@ -1,7 +1,15 @@
 from celery import shared_task
+from dataclasses import asdict
+from datetime import date
+from django.utils import timezone
+from .billing import run_billing_shard, BILLING_CHUNK_SIZE
 from .models import User
-from .utils import calculate_credit_score
+from .overdue import sweep_overdue_bills
+from .credit_data import credit_data_source, CreditDataError, CSVCreditDataSource
+from .utils import calculate_credit_score, CSV_FILE_PATH
+from .transaction_snapshot import snapshot_credit_scores
 import logging
+import os
 
 logger = logging.getLogger(__name__)
 
@@ -12,7 +20,13 @@ def update_user_credit_score(user_id):
         user = User.objects.get(id=user_id)
         logger.info(f"Calculating score for User: {user.email_id}, Aadhar: {user.aadhar_id}")
 
-        score = calculate_credit_score(user.aadhar_id)
+        try:
+            score = credit_data_source().credit_score(user.aadhar_id)
+        except CreditDataError as e:
+            if not os.path.exists(CSV_FILE_PATH):
+                raise
+            logger.warning(f"Credit data source unavailable ({e}), falling back to a CSV scan for user_id {user_id}.")
+            score = calculate_credit_score(user.aadhar_id)
 
         user.credit_score = score
         user.save(update_fields=['credit_score', 'updated_at']) 
@@ -25,4 +39,92 @@ def update_user_credit_score(user_id):
         return f"User {user_id} not found."
     except Exception as e:
         logger.error(f"Error calculating/updating credit score for user_id {user_id}: {e}", exc_info=True)
-        return f"Failed to update score for user {user_id}: {e}"
\ No newline at end of file
+        return f"Failed to update score for user {user_id}: {e}"
+
+
+SCORE_UPDATE_BATCH_SIZE = 1000
+
+
+def source_credit_scores(aadhar_ids: list) -> dict:
+    """
+        one batch lookup in the credit data source, falling back to a single scan of the csv when the source is
+        unavailable. raises CreditDataError when neither can answer.
+    """
+    try:
+        source = credit_data_source()
+        logger.info(f"Bulk credit score task: scoring {len(aadhar_ids)} users from the {source.name} credit data source.")
+        return source.credit_scores(aadhar_ids)
+    except CreditDataError as e:
+        if not os.path.exists(CSV_FILE_PATH):
+            raise
+        logger.warning(f"Credit data source unavailable ({e}), falling back to a CSV scan for {len(aadhar_ids)} users.")
+        return CSVCreditDataSource(CSV_FILE_PATH).credit_scores(aadhar_ids)
+
+
+@shared_task
+def bulk_update_credit_scores(user_ids=None, pending_only=True):
+    """
+        scores many users from the transaction snapshot when it is current, else from the credit data source (or
+        the csv when the source is down), and writes them back with bulk_update. nothing is written when neither can
+        answer: those users keep a NULL score until the pending scores sweep (beat) runs this task again.
+        with no user_ids it picks up every user still waiting for a score (or every user if pending_only is False).
+    """
+    users = User.objects.only('id', 'aadhar_id')
+    if user_ids is not None:
+        users = users.filter(id__in=user_ids)
+    elif pending_only:
+        users = users.filter(credit_score__isnull=True)
+    users = list(users.order_by('id'))
+
+    if not users:
+        logger.info("Bulk credit score task: no users to score.")
+        return "Scored 0 users."
+
+    scores = snapshot_credit_scores([user.aadhar_id for user in users])
+    if scores is not None:
+        logger.info(f"Bulk credit score task: scored {len(users)} users from the transaction snapshot.")
+    else:
+        try:
+            scores = source_credit_scores([user.aadhar_id for user in users])
+        except CreditDataError as e:
+            logger.error(f"Error reading transactions for bulk credit scoring: {e}", exc_info=True)
+            return f"Failed to score {len(users)} users: {e}"
+
+    now = timezone.now()
+    for user in users:
+        user.credit_score = scores.get(user.aadhar_id, 300)
+        user.updated_at = now
+    User.objects.bulk_update(users, ['credit_score', 'updated_at'], batch_size=SCORE_UPDATE_BATCH_SIZE)
+
+    logger.info(f"Bulk credit score task: updated {len(users)} users.")
+    return f"Scored {len(users)} users."
+
+
+
+@shared_task
+def run_billing_shard_task(billing_date, shard, shards, chunk_size=BILLING_CHUNK_SIZE):
+    """
+        bills one shard of the loans due on `billing_date` (iso format) and returns its billed/skipped/error counts.
+    """
+    result = run_billing_shard(date.fromisoformat(billing_date), shard, shards, chunk_size=chunk_size)
+    return asdict(result)
+
+
+
+@shared_task
+def sweep_overdue_bills_task(as_of=None):
+    """
+        daily overdue sweep (celery beat), returns the marked/late fee/chunk counts and the duration.
+    """
+    result = sweep_overdue_bills(date.fromisoformat(as_of) if as_of else None)
+    return {**asdict(result), 'late_fees': str(result.late_fees)}
+
+
+
+@shared_task
+def relay_score_outbox_task():
+    """
+        periodic safety net (celery beat) for the score task outbox: relays users the web processes did not.
+    """
+    from .score_outbox import relay_score_outbox # score_outbox imports this module
+    return relay_score_outbox()
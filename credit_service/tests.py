@@ -1,3 +1,1081 @@
-from django.test import TestCase
+import importlib.util
+import json
+import os
+import random
+import re
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import StringIO
+from unittest import skipUnless
+from unittest.mock import patch
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, sync_to_async
+
+from django.core.cache import caches
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test import AsyncRequestFactory, TestCase, TransactionTestCase, skipUnlessDBFeature
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from . import quotes
+from .billing import run_billing, run_backfill, bill_loans
+from .credit_data import (
+    CachedCreditDataSource, CircuitBreaker, CreditDataSource, CreditDataUnavailable, CSVCreditDataSource, HTTPCreditDataSource, TableCreditDataSource
+)
+from .installments import backfill_installments
+from .overdue import sweep_overdue_bills
+from .metrics import finish_task, render_prometheus, reset_metrics, start_task
+from .loan_summaries import check_loan_summaries, refresh_loan_summaries, SUMMARY_FIELDS
+from .models import User, Loan, Bill, Payment, ScoreTaskOutbox, TransactionAggregate, TransactionIndexState
+from .payments import apply_payment, apply_payment_batch, PaymentRejected
+from .score_outbox import enqueue_credit_score, relay_score_outbox
+from .serializers import (
+    PastTransactionSerializer, UpcomingTransactionSerializer, serialize_past_transactions, serialize_upcoming_transactions
+)
+from .statement_cache import statement_cache_stats
+from .synthetic import generate_synthetic_data
+from .tasks import bulk_update_credit_scores
+from .transaction_csv import read_transaction_totals, CSVScanStats
+from .transaction_snapshot import build_transaction_snapshot, snapshot_credit_scores, TransactionSnapshot
+from .transaction_index import (
+    refresh_transaction_index, get_transaction_totals, indexed_credit_score
+)
+from .utils import (
+    calculate_credit_score, calculate_emi_schedule, calculate_emi_schedule_fast, emi_schedule_cache_info, EMICalculationError
+)
+from .views import AsyncGetStatementView
+
+
+class TransactionIndexTests(TestCase):
+    def setUp(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.csv_path = os.path.join(tmpdir.name, 'transactions.csv')
+        self.write_rows([
+            'AADHARID,Date,Amount,Transaction_type',
+            '111111111111,2024-01-01,300000.00,CREDIT',
+            '111111111111,2024-01-02,50000.50,DEBIT',
+            '222222222222,2024-01-03,1200000,credit',
+            '222222222222,2024-01-04,not-a-number,DEBIT',
+        ], mode='w')
+
+    def write_rows(self, lines, mode='a'):
+        with open(self.csv_path, mode=mode, encoding='utf-8', newline='') as csvfile:
+            csvfile.write(''.join(f"{line}\n" for line in lines))
+
+    def test_build_matches_csv_scan(self):
+        state = refresh_transaction_index(self.csv_path)
+
+        self.assertEqual(state.row_count, 3)
+        self.assertEqual(get_transaction_totals('111111111111'), (Decimal('300000.00'), Decimal('50000.50')))
+        self.assertEqual(get_transaction_totals('999999999999'), (Decimal('0.00'), Decimal('0.00')))
+        for aadhar_id in ('111111111111', '222222222222', '999999999999'):
+            self.assertEqual(indexed_credit_score(aadhar_id), calculate_credit_score(aadhar_id, self.csv_path))
+
+    def test_index_and_csv_reader_apply_the_same_rules(self):
+        self.write_rows(['"111111111111",2024-01-05,"10.00",CREDIT', '111111111111,2024-01-06,99.00,REFUND', '111111111111'])
+
+        state = refresh_transaction_index(self.csv_path)
+        totals, stats = read_transaction_totals(self.csv_path, None)
+
+        self.assertEqual((state.row_count, state.indexed_offset), (stats.matched, os.path.getsize(self.csv_path)))
+        for aadhar_id, (credit, debit) in totals.items():
+            self.assertEqual(get_transaction_totals(aadhar_id), (credit, debit))
+
+    def test_appended_rows_are_indexed_incrementally(self):
+        first = refresh_transaction_index(self.csv_path)
+        self.write_rows(['111111111111,2024-02-01,100000.00,CREDIT', '333333333333,2024-02-02,10.00,DEBIT'])
+
+        second = refresh_transaction_index(self.csv_path)
+
+        self.assertGreater(second.indexed_offset, first.indexed_offset)
+        self.assertEqual(second.row_count, 5)
+        self.assertEqual(get_transaction_totals('111111111111'), (Decimal('400000.00'), Decimal('50000.50')))
+        self.assertEqual(get_transaction_totals('333333333333'), (Decimal('0.00'), Decimal('10.00')))
+
+    def test_row_appended_in_two_writes_is_indexed_once_complete(self):
+        refresh_transaction_index(self.csv_path)
+        with open(self.csv_path, mode='ab') as csvfile:
+            csvfile.write(b'111111111111,2024-02-01,1000')
+
+        state = refresh_transaction_index(self.csv_path)
+        self.assertEqual(state.row_count, 3)
+        self.assertEqual(get_transaction_totals('111111111111'), (Decimal('300000.00'), Decimal('50000.50')))
+
+        with open(self.csv_path, mode='ab') as csvfile:
+            csvfile.write(b'00.00,CREDIT\n')
+        state = refresh_transaction_index(self.csv_path)
+        self.assertEqual(state.row_count, 4)
+        self.assertEqual(get_transaction_totals('111111111111'), (Decimal('400000.00'), Decimal('50000.50')))
+
+    def test_indexing_another_csv_does_not_clobber_the_default_one(self):
+        other_path = f"{self.csv_path}.other"
+        with open(other_path, mode='w', encoding='utf-8', newline='') as csvfile:
+            csvfile.write('AADHARID,Date,Amount,Transaction_type\n333333333333,2024-01-01,5.00,CREDIT\n')
+        refresh_transaction_index(self.csv_path)
+        refresh_transaction_index(other_path)
+
+        refresh_transaction_index(self.csv_path) # must rebuild, the table now holds the other file
+        self.assertEqual(get_transaction_totals('111111111111'), (Decimal('300000.00'), Decimal('50000.50')))
+        self.assertEqual(get_transaction_totals('333333333333'), (Decimal('0.00'), Decimal('0.00')))
+        self.assertEqual(list(TransactionIndexState.objects.values_list('source_path', flat=True)), [self.csv_path])
+
+    def test_rewritten_file_triggers_full_rebuild(self):
+        refresh_transaction_index(self.csv_path)
+        self.write_rows([
+            'AADHARID,Date,Amount,Transaction_type',
+            '444444444444,2024-03-01,5.00,CREDIT',
+            '444444444444,2024-03-02,1.00,CREDIT',
+            '444444444444,2024-03-03,1.00,CREDIT',
+            '444444444444,2024-03-04,1.00,CREDIT',
+            '444444444444,2024-03-05,1.00,CREDIT',
+            '444444444444,2024-03-06,1.00,CREDIT',
+        ], mode='w')
+
+        refresh_transaction_index(self.csv_path)
+
+        self.assertEqual(list(TransactionAggregate.objects.values_list('aadhar_id', flat=True)), ['444444444444'])
+        self.assertEqual(get_transaction_totals('444444444444'), (Decimal('10.00'), Decimal('0.00')))
+
+
+class BulkCreditScoreTests(TestCase):
+    def setUp(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.csv_path = os.path.join(tmpdir.name, 'transactions.csv')
+        with open(self.csv_path, mode='w', encoding='utf-8', newline='') as csvfile:
+            csvfile.write('AADHARID,Date,Amount,Transaction_type\n'
+                          '111111111111,2024-01-01,400000.00,CREDIT\n'
+                          '222222222222,2024-01-01,2000000.00,CREDIT\n'
+                          '222222222222,2024-01-02,500.00,DEBIT\n')
+
+    def test_task_updates_only_pending_users(self):
+        pending = User.objects.create(aadhar_id='111111111111', name='A', email_id='a@example.com', annual_income=Decimal('200000'))
+        scored = User.objects.create(aadhar_id='222222222222', name='B', email_id='b@example.com', annual_income=Decimal('200000'), credit_score=450)
+
+        with patch('credit_service.tasks.credit_data_source', lambda: CSVCreditDataSource(self.csv_path)):
+            bulk_update_credit_scores()
+
+        pending.refresh_from_db()
+        scored.refresh_from_db()
+        self.assertEqual(pending.credit_score, 500)
+        self.assertEqual(scored.credit_score, 450)
+
+    def test_unavailable_source_falls_back_to_csv_or_leaves_users_pending(self):
+        class DownSource(CreditDataSource):
+            name = 'down'
+
+            def fetch_balances(self, aadhar_ids):
+                raise CreditDataUnavailable('bureau down')
+
+        pending = User.objects.create(aadhar_id='111111111111', name='A', email_id='a@example.com', annual_income=Decimal('200000'))
+        with patch('credit_service.tasks.credit_data_source', DownSource), patch('credit_service.tasks.snapshot_credit_scores', lambda aadhar_ids: None):
+            with patch('credit_service.tasks.CSV_FILE_PATH', self.csv_path):
+                self.assertEqual(bulk_update_credit_scores(user_ids=[pending.id]), "Scored 1 users.")
+            pending.refresh_from_db()
+            self.assertEqual(pending.credit_score, 500)
+
+            User.objects.filter(pk=pending.pk).update(credit_score=None)
+            with patch('credit_service.tasks.CSV_FILE_PATH', self.csv_path + '.missing'):
+                self.assertIn("Failed to score 1 users", bulk_update_credit_scores(user_ids=[pending.id]))
+            pending.refresh_from_db()
+            self.assertIsNone(pending.credit_score)
+
+        # the pending scores sweep (beat) picks the user up once the source is back
+        with patch('credit_service.tasks.credit_data_source', lambda: CSVCreditDataSource(self.csv_path)), \
+                patch('credit_service.tasks.snapshot_credit_scores', lambda aadhar_ids: None):
+            bulk_update_credit_scores(pending_only=True)
+        pending.refresh_from_db()
+        self.assertEqual(pending.credit_score, 500)
+
+
+class TransactionCSVReaderTests(TestCase):
+    def setUp(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.csv_path = os.path.join(tmpdir.name, 'transactions.csv')
+        with open(self.csv_path, mode='w', encoding='utf-8', newline='') as csvfile:
+            csvfile.write('Date,AADHARID,Transaction_type,Amount\n'
+                          '2024-01-01,111111111111,CREDIT,400000.00\n'
+                          '2024-01-02,"111111111111",debit,"250.50"\n'
+                          '2024-01-03,111111111111,DEBIT,n/a\n'
+                          '2024-01-04,111111111111,REFUND,10.00\n'
+                          '2024-01-05,111111111111\n'
+                          '2024-01-06,222222222222,CREDIT,5.00\n')
+
+    def test_buffered_and_mmap_paths_agree(self):
+        for use_mmap in (False, True):
+            with self.subTest(use_mmap=use_mmap):
+                totals, stats = read_transaction_totals(self.csv_path, ['111111111111'], use_mmap=use_mmap)
+                self.assertEqual(totals, {'111111111111': [Decimal('400000.00'), Decimal('250.50')]})
+                self.assertEqual(stats, CSVScanStats(rows=6, matched=2, malformed=2)) # the REFUND row is ignored, not malformed
+
+        totals, _ = read_transaction_totals(self.csv_path, ['111111111111', '222222222222'])
+        self.assertEqual(totals['222222222222'], [Decimal('5.00'), Decimal('0.00')])
+
+    def test_unreadable_csv_scores_minimum(self):
+        self.assertEqual(calculate_credit_score('111111111111', self.csv_path), 490)
+        self.assertEqual(calculate_credit_score('111111111111', self.csv_path + '.missing'), 300)
+
+
+@skipUnless(importlib.util.find_spec('numpy'), 'NumPy is not installed')
+class TransactionSnapshotTests(TestCase):
+    def setUp(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.csv_path = os.path.join(tmpdir.name, 'transactions.csv')
+        self.snapshot_path = os.path.join(tmpdir.name, 'transactions.snapshot')
+        with open(self.csv_path, mode='w', encoding='utf-8', newline='') as csvfile:
+            csvfile.write('AADHARID,Date,Amount,Transaction_type\n'
+                          '333333333333,2024-01-01,100000.01,CREDIT\n'
+                          '111111111111,2024-01-01,400000.00,CREDIT\n'
+                          '222222222222,2024-01-02,1000000,credit\n'
+                          '111111111111,2024-01-03,250.50,DEBIT\n'
+                          '444444444444,2024-01-04,100000.00,CREDIT\n'
+                          '111111111111,2024-01-05,oops,DEBIT\n'
+                          '333333333333,2024-01-06,0.01,DEBIT\n'
+                          '555555555555,2024-01-07,10.00,DEBIT\n')
+        self.aadhar_ids = ['111111111111', '222222222222', '333333333333', '444444444444', '555555555555']
+
+    def test_snapshot_matches_csv_scan(self):
+        result = build_transaction_snapshot(self.csv_path, self.snapshot_path)
+        self.assertEqual((result.aadhar_ids, result.rows, result.malformed), (5, 7, 1))
+
+        snapshot = TransactionSnapshot(self.snapshot_path)
+        csv_totals, _ = read_transaction_totals(self.csv_path, self.aadhar_ids)
+        expected = {aadhar_id: calculate_credit_score(aadhar_id, self.csv_path) for aadhar_id in self.aadhar_ids}
+        for aadhar_id in self.aadhar_ids:
+            self.assertEqual(list(snapshot.totals(aadhar_id)), csv_totals[aadhar_id])
+        self.assertEqual(snapshot.credit_scores(), expected)
+        self.assertEqual(snapshot.credit_scores(['111111111111', '999999999999', '1111111111111']),
+                         {'111111111111': 490, '999999999999': 300, '1111111111111': 300})
+        self.assertEqual(snapshot.totals('999999999999'), (Decimal('0.00'), Decimal('0.00')))
+        self.assertTrue(snapshot.is_current(self.csv_path))
+
+    def test_bulk_task_uses_current_snapshot_only(self):
+        user = User.objects.create(aadhar_id='222222222222', name='A', email_id='a@example.com', annual_income=Decimal('200000'))
+        build_transaction_snapshot(self.csv_path, self.snapshot_path)
+
+        with patch('credit_service.tasks.snapshot_credit_scores', lambda ids: snapshot_credit_scores(ids, self.csv_path, self.snapshot_path)), \
+                patch('credit_service.tasks.credit_data_source') as source:
+            bulk_update_credit_scores()
+            source.assert_not_called()
+            user.refresh_from_db()
+            self.assertEqual(user.credit_score, 900)
+
+            os.utime(self.csv_path, ns=(0, 0))
+            source.return_value.credit_scores.return_value = {'222222222222': 310}
+            bulk_update_credit_scores(pending_only=False)
+            source.return_value.credit_scores.assert_called_once()
+            user.refresh_from_db()
+            self.assertEqual(user.credit_score, 310)
+
+
+class CreditDataSourceTests(TestCase):
+    def setUp(self):
+        caches['credit_data'].clear()
+        self.requests = []
+        self.responses = {'111111111111': (200, {'total_credit': '400000.00', 'total_debit': '250.50'})}
+        responses, requests = self.responses, self.requests
+
+        class BureauStub(BaseHTTPRequestHandler):
+            def do_GET(self):
+                aadhar_id = self.path.rsplit('/', 1)[-1]
+                requests.append(aadhar_id)
+                status, payload = responses.get(aadhar_id, (404, {}))
+                if status == 'slow':
+                    time.sleep(payload)
+                    status, payload = 200, {'total_credit': '0', 'total_debit': '0'}
+                try:
+                    self.send_response(status)
+                    self.send_header('Content-Type', 'application/json')
+                    self.end_headers()
+                    self.wfile.write(json.dumps(payload).encode())
+                except (BrokenPipeError, ConnectionResetError):
+                    pass # the client gave up (timeout tests)
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer(('127.0.0.1', 0), BureauStub)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        self.base_url = f"http://127.0.0.1:{server.server_port}/transactions"
+
+    def test_http_source_is_cached_including_misses(self):
+        source = CachedCreditDataSource(HTTPCreditDataSource(self.base_url, timeout=2), ttl=60, negative_ttl=60)
+
+        for _ in range(2):
+            self.assertEqual(source.credit_scores(['111111111111', '999999999999']), {'111111111111': 490, '999999999999': 300})
+        self.assertEqual(sorted(self.requests), ['111111111111', '999999999999'])
+
+    def test_failing_cache_reads_through_to_the_source(self):
+        source = CachedCreditDataSource(HTTPCreditDataSource(self.base_url, timeout=2), ttl=60, negative_ttl=60)
+        cache = caches['credit_data']
+
+        with patch.object(cache, 'get_many', side_effect=ConnectionError('cache down')), \
+                patch.object(cache, 'set_many', side_effect=ConnectionError('cache down')), \
+                self.assertLogs('credit_service.credit_data', 'WARNING') as logs:
+            self.assertEqual(source.credit_scores(['111111111111', '999999999999']), {'111111111111': 490, '999999999999': 300})
+        self.assertEqual(len(logs.records), 2) # one for the read, one for the write
+        self.assertEqual(sorted(self.requests), ['111111111111', '999999999999'])
+        with self.assertRaises(TypeError):
+            CreditDataSource() # abstract
+
+    def test_failures_open_the_circuit(self):
+        self.responses['111111111111'] = (500, {})
+        source = HTTPCreditDataSource(self.base_url, timeout=2, breaker=CircuitBreaker(2, 60))
+
+        for _ in range(3):
+            with self.assertRaises(CreditDataUnavailable):
+                source.credit_score('111111111111')
+        self.assertEqual(len(self.requests), 2) # the third call failed fast
+
+    def test_slow_source_times_out(self):
+        self.responses['222222222222'] = ('slow', 1.0)
+        source = HTTPCreditDataSource(self.base_url, timeout=0.2, batch_timeout=0.5, workers=4)
+
+        started = time.perf_counter()
+        with self.assertRaises(CreditDataUnavailable):
+            source.credit_scores(['111111111111', '222222222222'])
+        self.assertLess(time.perf_counter() - started, 0.9)
+
+    def test_local_sources_agree(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            csv_path = os.path.join(tmpdir, 'transactions.csv')
+            with open(csv_path, mode='w', encoding='utf-8', newline='') as csvfile:
+                csvfile.write('AADHARID,Date,Amount,Transaction_type\n'
+                              '111111111111,2024-01-01,400000.00,CREDIT\n'
+                              '111111111111,2024-01-02,250.50,DEBIT\n')
+            aadhar_ids = ['111111111111', '999999999999']
+
+            self.assertEqual(CSVCreditDataSource(csv_path).credit_scores(aadhar_ids), {'111111111111': 490, '999999999999': 300})
+            self.assertEqual(TableCreditDataSource(csv_path).credit_scores(aadhar_ids), {'111111111111': 490, '999999999999': 300})
+
+
+class RegistrationTests(TestCase):
+    def register(self, aadhar_id, email_id):
+        return self.client.post(reverse('register-user'), {
+            'aadhar_id': aadhar_id, 'name': 'Reg', 'email_id': email_id, 'annual_income': '600000'
+        }, content_type='application/json')
+
+    def test_registration_queues_score_without_calling_the_broker(self):
+        with patch('credit_service.score_outbox.wake_relay') as wake, \
+                patch('credit_service.score_outbox.bulk_update_credit_scores.delay') as delay, \
+                self.captureOnCommitCallbacks(execute=True), CaptureQueriesContext(connection) as queries:
+            response = self.register('123456789012', 'reg@example.com')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse([query['sql'] for query in queries if query['sql'].startswith('SELECT')]) # inserts only
+        user = User.objects.get(aadhar_id='123456789012')
+        self.assertEqual(list(ScoreTaskOutbox.objects.values_list('user_id', flat=True)), [user.id])
+        wake.assert_called_once()
+        delay.assert_not_called()
+
+    def test_duplicates_are_rejected_by_the_constraints(self):
+        with patch('credit_service.score_outbox.wake_relay'):
+            self.register('123456789012', 'reg@example.com')
+            same_aadhar = self.register('123456789012', 'other@example.com')
+            same_both = self.register('123456789012', 'reg@example.com')
+
+        self.assertEqual(same_aadhar.status_code, 400)
+        self.assertEqual(same_aadhar.json()['Error'], "Validation Failed: aadhar_id: User with this Aadhar ID already exists.")
+        self.assertIn("email_id: User with this Email ID already exists.", same_both.json()['Error'])
+        self.assertEqual((User.objects.count(), ScoreTaskOutbox.objects.count()), (1, 1))
+
+    def test_relay_coalesces_users_into_batches(self):
+        users = [User.objects.create(aadhar_id=f"55555555555{i}", name='R', email_id=f"r{i}@example.com", annual_income=Decimal('1')) for i in range(3)]
+        with patch('credit_service.score_outbox.wake_relay'):
+            enqueue_credit_score([user.id for user in users])
+            enqueue_credit_score([users[0].id, users[0].id]) # already waiting
+
+        with patch('credit_service.score_outbox.bulk_update_credit_scores.delay', side_effect=OSError('broker down')):
+            with self.assertRaises(OSError):
+                relay_score_outbox(batch_size=2)
+        self.assertEqual(ScoreTaskOutbox.objects.count(), 3)
+
+        depth = len(connection.atomic_blocks)
+        with patch('credit_service.score_outbox.bulk_update_credit_scores.delay') as delay:
+            delay.side_effect = lambda **kwargs: self.assertEqual(len(connection.atomic_blocks), depth) # published outside a transaction
+            self.assertEqual(relay_score_outbox(batch_size=2), 3)
+        self.assertEqual([call.kwargs['user_ids'] for call in delay.call_args_list], [[users[0].id, users[1].id], [users[2].id]])
+        self.assertFalse(ScoreTaskOutbox.objects.exists())
+
+
+class BillingEngineTests(TestCase):
+    billing_date = date(2025, 5, 31)
+
+    def setUp(self):
+        self.user = User.objects.create(aadhar_id='555555555555', name='Billing', email_id='billing@example.com', annual_income=Decimal('300000'), credit_score=700)
+
+    def create_loan(self, disbursement_date, principal_balance=Decimal('4000.00'), status='Active'):
+        return Loan.objects.create(
+            user=self.user, loan_amount=Decimal('5000.00'), interest_rate=Decimal('18.00'), term_period=12,
+            disbursement_date=disbursement_date, principal_balance=principal_balance, status=status
+        )
+
+    def create_bill(self, loan, billing_date):
+        bill = Bill.objects.create(
+            loan=loan, billing_date=billing_date, due_date=billing_date + timedelta(days=15),
+            principal_component=Decimal('1.00'), interest_component=Decimal('1.00'), min_due_amount=Decimal('2.00')
+        )
+        refresh_loan_summaries([loan.id])
+        return bill
+
+    def test_bills_only_loans_due_today(self):
+        cycle_start = self.billing_date - timedelta(days=30)
+        first_cycle = self.create_loan(cycle_start)
+        billed_before = self.create_loan(cycle_start - timedelta(days=30))
+        self.create_bill(billed_before, cycle_start)
+        not_due = self.create_loan(cycle_start - timedelta(days=30))
+        self.create_bill(not_due, cycle_start - timedelta(days=1))
+        self.create_loan(cycle_start, status='Closed')
+        self.create_loan(cycle_start, principal_balance=Decimal('0.00'))
+
+        result = run_billing(self.billing_date, chunk_size=1)
+
+        self.assertEqual((result.billed, result.skipped, result.errors), (2, 0, 0))
+        self.assertEqual(
+            set(Bill.objects.filter(billing_date=self.billing_date).values_list('loan_id', flat=True)),
+            {first_cycle.id, billed_before.id}
+        )
+        bill = Bill.objects.get(loan=first_cycle, billing_date=self.billing_date)
+        self.assertEqual(bill.due_date, self.billing_date + timedelta(days=15))
+        self.assertEqual(bill.principal_component, Decimal('120.00'))
+        self.assertEqual(bill.interest_component, Decimal('59.18'))
+        self.assertEqual(bill.min_due_amount, Decimal('179.18'))
+
+    def test_shards_partition_due_loans_and_reruns_are_idempotent(self):
+        cycle_start = self.billing_date - timedelta(days=30)
+        loans = [self.create_loan(cycle_start) for _ in range(7)]
+
+        billed = sum(run_billing(self.billing_date, shard=shard, shards=3).billed for shard in range(3))
+        rerun = bill_loans([loan.id for loan in loans], self.billing_date)
+
+        self.assertEqual(billed, 7)
+        self.assertEqual((rerun.billed, rerun.skipped), (0, 7))
+        self.assertEqual(Bill.objects.filter(billing_date=self.billing_date).count(), 7)
+
+    def test_backfill_creates_missed_cycles_once(self):
+        never_billed = self.create_loan(self.billing_date - timedelta(days=100))
+        billed_once = self.create_loan(self.billing_date - timedelta(days=100))
+        self.create_bill(billed_once, self.billing_date - timedelta(days=70))
+        start_date = self.billing_date - timedelta(days=50)
+
+        dry_run = run_backfill(start_date, self.billing_date, dry_run=True)
+        result = run_backfill(start_date, self.billing_date, chunk_size=1)
+        rerun = run_backfill(start_date, self.billing_date)
+
+        self.assertEqual(dry_run.billed, 4)
+        self.assertEqual(result.billed, 4)
+        self.assertEqual(rerun.billed, 0)
+        self.assertEqual(
+            list(never_billed.bills.values_list('billing_date', flat=True)),
+            [self.billing_date - timedelta(days=days) for days in (40, 10)]
+        )
+        self.assertEqual(
+            list(billed_once.bills.values_list('billing_date', flat=True)),
+            [self.billing_date - timedelta(days=days) for days in (70, 40, 10)]
+        )
+
+
+class StatementCacheTests(TestCase):
+    def setUp(self):
+        caches['statements'].clear()
+        user = User.objects.create(aadhar_id='666666666666', name='Statement', email_id='statement@example.com', annual_income=Decimal('300000'), credit_score=700)
+        self.loan = Loan.objects.create(
+            user=user, loan_amount=Decimal('5000.00'), interest_rate=Decimal('18.00'), term_period=12,
+            disbursement_date=date(2025, 1, 1), principal_balance=Decimal('5000.00'), status='Active'
+        )
+        Bill.objects.create(
+            loan=self.loan, billing_date=date(2025, 1, 31), due_date=date(2025, 2, 15), principal_component=Decimal('150.00'),
+            interest_component=Decimal('73.97'), min_due_amount=Decimal('223.97')
+        )
+        refresh_loan_summaries([self.loan.id])
+        self.url = reverse('get-statement', kwargs={'loan_id': self.loan.loan_id})
+
+    def test_repeat_reads_are_served_from_cache(self):
+        first = self.client.get(self.url)
+        hits_before = statement_cache_stats()['hits']
+        with self.assertNumQueries(0):
+            second = self.client.get(self.url)
+
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(second.content, first.content)
+        self.assertEqual(first.json()['Past_transactions'], [{"Date": "2025-01-31", "Principal": "150.00", "Interest": "73.97", "Amount_paid": "0.00"}])
+        self.assertEqual(statement_cache_stats()['hits'], hits_before + 1)
+
+    def test_payment_invalidates_cached_statement(self):
+        self.client.get(self.url)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('make-payment'), {'loan_id': str(self.loan.loan_id), 'amount': '100.00'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.client.get(self.url).json()['Past_transactions'][0]['Amount_paid'], "100.00")
+
+    def test_statement_is_one_query_and_matches_drf_serializers(self):
+        with self.assertNumQueries(1):
+            payload = self.client.get(self.url).json()
+
+        bills = [(date(2025, 1, 31), Decimal('150.00'), Decimal('73.97'), Decimal('0.00'))]
+        upcoming = [(date(2025, 3, 2), Decimal('223.97')), (date(2025, 4, 1), Decimal('217.25'))]
+        self.assertEqual(payload['Past_transactions'], serialize_past_transactions(bills))
+        self.assertEqual(payload['Upcoming_transactions'][:2], serialize_upcoming_transactions(upcoming))
+        self.assertEqual(serialize_past_transactions(bills), PastTransactionSerializer(
+            [dict(zip(('Date', 'Principal', 'Interest', 'Amount_paid'), bill)) for bill in bills], many=True).data)
+        self.assertEqual(serialize_upcoming_transactions(upcoming), UpcomingTransactionSerializer(
+            [dict(zip(('Date', 'Amount_due'), item)) for item in upcoming], many=True).data)
+
+
+    def test_failing_cache_backend_serves_uncached(self):
+        class BrokenPayloadCache:
+            # version stamps work, payload reads and writes fail (e.g. a Redis node going away mid-request)
+            def get(self, key, default=None):
+                if key.startswith('statement:version:'):
+                    return 'v1'
+                raise ConnectionError('cache down')
+
+            def set(self, *args, **kwargs):
+                raise ConnectionError('cache down')
+
+            async def aget(self, key, default=None):
+                return self.get(key, default)
+
+            async def aset(self, *args, **kwargs):
+                self.set()
+
+        expected = self.client.get(self.url).content
+        with patch('credit_service.statement_cache._cache', BrokenPayloadCache), self.assertLogs('credit_service.statement_cache', 'WARNING'):
+            response = self.client.get(self.url)
+            async_response = async_to_sync(AsyncGetStatementView.as_view())(
+                AsyncRequestFactory().get(self.url), loan_id=self.loan.loan_id)
+
+        self.assertEqual((response.status_code, response.content), (200, expected))
+        self.assertEqual((async_response.status_code, async_response.content), (200, expected))
+
+    async def test_async_view_matches_sync_view(self):
+        view = AsyncGetStatementView.as_view()
+        missing_loan_id = '00000000-0000-0000-0000-000000000000'
+        for loan_id in (self.loan.loan_id, missing_loan_id):
+            request = AsyncRequestFactory().get(f"/api/get-statement/{loan_id}/")
+            await caches['statements'].aclear()
+            expected = await sync_to_async(self.client.get)(reverse('get-statement', kwargs={'loan_id': loan_id}))
+            await caches['statements'].aclear()
+            uncached = await view(request, loan_id=loan_id)
+            cached = await view(request, loan_id=loan_id)
+
+            self.assertEqual((uncached.status_code, uncached.content), (expected.status_code, expected.content))
+            self.assertEqual((cached.status_code, cached.content), (expected.status_code, expected.content))
+
+
+class EMIScheduleEngineTests(TestCase):
+    def run_engine(self, engine, *args):
+        try:
+            return engine(*args)
+        except EMICalculationError as e:
+            return f"rejected: {e}"
+
+    def test_fast_engine_matches_reference_on_random_inputs(self):
+        rng = random.Random(20250501)
+        for _ in range(500):
+            args = (
+                Decimal(rng.randint(1, 500000)) / 100,
+                Decimal(rng.randint(1200, 6000)) / 100,
+                rng.randint(1, 360),
+                Decimal(rng.randint(0, 10 ** 9)) / 100,
+                date(2024, 1, 1) + timedelta(days=rng.randint(0, 730)),
+            )
+            with self.subTest(args=args):
+                # repr also compares the Decimal exponents, i.e. the rounding is bit-for-bit identical
+                self.assertEqual(
+                    repr(self.run_engine(calculate_emi_schedule_fast, *args)),
+                    repr(self.run_engine(calculate_emi_schedule, *args))
+                )
+
+    def test_memoized_template_is_reused_across_dates_and_incomes(self):
+        calculate_emi_schedule_fast(Decimal('4000.00'), Decimal('21.00'), 24, Decimal('10000000'), date(2025, 1, 10))
+        hits = emi_schedule_cache_info()['hits']
+
+        for income, disbursement_date in ((Decimal('10000000'), date(2025, 3, 31)), (Decimal('200000'), date(2024, 12, 1))):
+            args = (Decimal('4000'), Decimal('21'), 24, income, disbursement_date)
+            self.assertEqual(repr(self.run_engine(calculate_emi_schedule_fast, *args)), repr(self.run_engine(calculate_emi_schedule, *args)))
+
+        self.assertEqual(emi_schedule_cache_info()['hits'], hits + 2)
+
+    def test_month_end_due_dates_match_relativedelta(self):
+        args = (Decimal('5000.00'), Decimal('24.00'), 14, Decimal('10000000'), date(2024, 1, 31))
+
+        fast = calculate_emi_schedule_fast(*args)
+
+        self.assertEqual(fast, calculate_emi_schedule(*args))
+        self.assertEqual([item['due_date'] for item in fast[:3]], [date(2024, 2, 29), date(2024, 3, 29), date(2024, 4, 29)])
+
+
+class QuoteLoansTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(aadhar_id='777777777777', name='Quote', email_id='quote@example.com', annual_income=Decimal('200000'), credit_score=600)
+        self.offers = [
+            {'loan_amount': '5000.00', 'interest_rate': '18.00', 'term_period': 12},
+            {'loan_amount': '5000.00', 'interest_rate': '18.00', 'term_period': 1},
+            {'loan_amount': '1000.00', 'interest_rate': '12.00', 'term_period': 6},
+        ]
+
+    def post(self, offers):
+        return self.client.post(reverse('quote-loans'), {
+            'unique_user_id': str(self.user.unique_user_id), 'disbursement_date': '2025-01-15', 'offers': offers
+        }, content_type='application/json')
+
+    def test_quotes_each_offer_without_creating_loans(self):
+        response = self.post(self.offers)
+
+        quotes = response.json()['Quotes']
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(quotes[0]['Due_dates']), 12)
+        self.assertEqual(quotes[0]['Due_dates'][0]['Date'], '2025-02-15')
+        self.assertIsNone(quotes[0]['Error'])
+        self.assertIn('crosses 20% of monthly income', quotes[1]['Error'])
+        self.assertIn('must be greater than 50', quotes[2]['Error'])
+        self.assertFalse(Loan.objects.exists())
+
+    def test_process_pool_gives_the_same_quotes(self):
+        inline = self.post(self.offers).json()
+        with patch.object(quotes, 'LOAN_QUOTE_WORKERS', 2), patch.object(quotes, 'LOAN_QUOTE_POOL_MIN_OFFERS', 1):
+            pooled = self.post(self.offers).json()
+            quotes._get_pool().shutdown()
+            quotes._pool = None
+
+        self.assertEqual(pooled, inline)
+
+    def test_invalid_offer_is_reported_with_its_position(self):
+        response = self.post([self.offers[0], {'loan_amount': '9000.00', 'interest_rate': '18.00', 'term_period': 12}])
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('offers[1].loan_amount:', response.json()['Error'])
+
+
+class InstallmentTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(aadhar_id='888888888888', name='Installments', email_id='installments@example.com', annual_income=Decimal('1000000'), credit_score=700)
+
+    def test_apply_loan_persists_the_returned_schedule(self):
+        response = self.client.post(reverse('apply-loan'), {
+            'unique_user_id': str(self.user.unique_user_id), 'loan_amount': '5000.00', 'interest_rate': '18.00',
+            'term_period': 6, 'disbursement_date': '2025-01-31'
+        })
+
+        self.assertEqual(response.status_code, 200)
+        loan = Loan.objects.get(loan_id=response.json()['Loan_id'])
+        self.assertEqual(
+            [{"Date": due_date.isoformat(), "Amount_due": f"{amount_due:.2f}"} for due_date, amount_due in
+             loan.installments.values_list('due_date', 'amount_due')],
+            response.json()['Due_dates']
+        )
+        self.assertEqual(list(loan.installments.values_list('installment_number', flat=True)), [1, 2, 3, 4, 5, 6])
+
+    def test_backfill_writes_missing_schedules_once(self):
+        loans = [
+            Loan.objects.create(user=self.user, loan_amount=Decimal('5000.00'), interest_rate=Decimal('18.00'), term_period=term,
+                                disbursement_date=date(2025, 1, 1), principal_balance=Decimal('5000.00'), status='Active')
+            for term in (3, 12)
+        ]
+
+        self.assertEqual(backfill_installments(chunk_size=1), (2, 15, 0))
+        self.assertEqual(backfill_installments(), (0, 0, 0))
+        self.assertEqual(
+            list(loans[0].installments.values_list('amount_due', flat=True)),
+            [item['amount_due'] for item in calculate_emi_schedule(Decimal('5000.00'), Decimal('18.00'), 3, Decimal('1000000'), date(2025, 1, 1))]
+        )
+
+
+class PaymentTests(TestCase):
+    def setUp(self):
+        user = User.objects.create(aadhar_id='777777777777', name='Payments', email_id='payments@example.com', annual_income=Decimal('1000000'), credit_score=700)
+        self.loan = Loan.objects.create(user=user, loan_amount=Decimal('5000.00'), interest_rate=Decimal('18.00'), term_period=12,
+                                        disbursement_date=date(2025, 1, 1), principal_balance=Decimal('300.00'), status='Active')
+        self.bills = [
+            Bill.objects.create(loan=self.loan, billing_date=date(2025, 1, 31) + timedelta(days=30 * i),
+                                due_date=date(2025, 2, 15) + timedelta(days=30 * i), principal_component=Decimal('90.00'),
+                                interest_component=Decimal('10.00'), min_due_amount=Decimal('100.00'), status='Pending')
+            for i in range(2)
+        ]
+        refresh_loan_summaries([self.loan.id])
+        caches['idempotency'].clear()
+
+    def test_payment_fills_bills_in_due_date_order(self):
+        response = self.client.post(reverse('make-payment'), {'loan_id': str(self.loan.loan_id), 'amount': '150.00'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [(bill.amount_paid, bill.status) for bill in Bill.objects.filter(loan=self.loan).order_by('due_date')],
+            [(Decimal('100.00'), 'Paid'), (Decimal('50.00'), 'Partially Paid')]
+        )
+        self.loan.refresh_from_db()
+        self.assertEqual((self.loan.principal_balance, self.loan.status), (Decimal('300.00'), 'Active'))
+
+    def test_overpayment_reduces_principal_and_closes_loan(self):
+        with self.assertNumQueries(7):
+            apply_payment(self.loan.loan_id, Decimal('500.00'))
+
+        self.loan.refresh_from_db()
+        self.assertEqual((self.loan.principal_balance, self.loan.status), (Decimal('0.00'), 'Closed'))
+        self.assertEqual(Payment.objects.filter(loan=self.loan).count(), 1)
+        with self.assertRaisesMessage(PaymentRejected, "loan is not active (Status: Closed)."):
+            apply_payment(self.loan.loan_id, Decimal('1.00'))
+
+
+    def test_batch_endpoint_applies_rows_in_order_and_reports_each(self):
+        response = self.client.post(reverse('make-payments'), {'payments': [
+            {'loan_id': str(self.loan.loan_id), 'amount': '150.00'},
+            {'loan_id': str(self.loan.loan_id), 'amount': 'abc'},
+            {'loan_id': '00000000-0000-0000-0000-000000000000', 'amount': '10.00'},
+            {'loan_id': str(self.loan.loan_id), 'amount': '400.00'},
+            {'loan_id': str(self.loan.loan_id), 'amount': '1.00'},
+        ]}, content_type='application/json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([row['Error'] for row in response.json()['Results']], [
+            None, 'Validation Failed: amount: A valid number is required.', 'loan not found.', None,
+            'loan is not active (Status: Closed).'
+        ])
+        self.loan.refresh_from_db()
+        self.assertEqual((self.loan.principal_balance, self.loan.status), (Decimal('0.00'), 'Closed'))
+        self.assertEqual(Payment.objects.filter(loan=self.loan).count(), 2)
+
+    def test_idempotency_key_replays_without_locking(self):
+        payload = {'loan_id': str(self.loan.loan_id), 'amount': '60.00', 'idempotency_key': 'retry-1'}
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.client.post(reverse('make-payment'), payload).status_code, 200)
+
+        with self.assertNumQueries(0):
+            response = self.client.post(reverse('make-payment'), payload)
+        self.assertEqual(response.json(), {"Error": None})
+        self.assertEqual(Payment.objects.filter(loan=self.loan).count(), 1)
+
+        caches['idempotency'].clear()
+        self.assertIsNone(apply_payment(self.loan.loan_id, Decimal('60.00'), 'retry-1')) # unique index fallback
+        response = self.client.post(reverse('make-payment'), dict(payload, amount='61.00'))
+        self.assertEqual(response.json(), {"Error": "idempotency key was already used for a different payment."})
+
+        response = self.client.post(reverse('make-payments'), {'payments': [
+            {'loan_id': str(self.loan.loan_id), 'amount': '10.00', 'idempotency_key': 'batch-1'},
+            {'loan_id': str(self.loan.loan_id), 'amount': '10.00', 'idempotency_key': 'batch-1'},
+            {'loan_id': str(self.loan.loan_id), 'amount': '60.00', 'idempotency_key': 'retry-1'},
+        ]}, content_type='application/json')
+        self.assertEqual([row['Error'] for row in response.json()['Results']], [None, None, None])
+        self.assertEqual(Payment.objects.filter(loan=self.loan).count(), 2)
+        self.assertEqual(Bill.objects.filter(loan=self.loan).order_by('due_date').first().amount_paid, Decimal('70.00'))
+
+    def test_import_payments_resumes_from_offset(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, 'settlement.csv')
+            with open(path, mode='w', encoding='utf-8', newline='') as paymentfile:
+                paymentfile.write('loan_id,amount\n')
+                paymentfile.write(f'{self.loan.loan_id},60.00\n')
+                resume_offset = paymentfile.tell()
+                paymentfile.write(f'{self.loan.loan_id},60.00\nnot-a-uuid,5.00\n')
+
+            out = StringIO()
+            call_command('import_payments', path, '--chunk-size', '1', stdout=out)
+            self.assertIn(f'Committed through offset {resume_offset}.', out.getvalue())
+            self.assertIn('Applied: 2, Rejected: 1', out.getvalue())
+
+            call_command('import_payments', path, '--offset', str(resume_offset), stdout=StringIO())
+
+        self.assertEqual(
+            [(bill.amount_paid, bill.status) for bill in Bill.objects.filter(loan=self.loan).order_by('due_date')],
+            [(Decimal('100.00'), 'Paid'), (Decimal('80.00'), 'Partially Paid')]
+        )
+
+
+
+def full_table_scans(queries) -> list:
+    """
+        (table, sql) for every captured SELECT whose plan reads a whole credit_service table instead of an index range.
+    """
+    scans = []
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute("SET LOCAL enable_seqscan = off") # tiny test tables: a seq scan now means no usable index
+        for query in queries:
+            sql = query['sql']
+            if not sql.lstrip().upper().startswith('SELECT'):
+                continue
+            if connection.vendor == 'postgresql':
+                cursor.execute(f"EXPLAIN {sql}")
+                plan = [row[0] for row in cursor.fetchall()]
+                tables = [re.search(r'Seq Scan on (credit_service_\w+)', line) for line in plan]
+            else:
+                cursor.execute(f"EXPLAIN QUERY PLAN {sql}")
+                plan = [row[-1] for row in cursor.fetchall()]
+                tables = [re.match(r'SCAN (credit_service_\w+)', line) for line in plan]
+            scans.extend((table.group(1), sql) for table in tables if table)
+    return scans
+
+
+class QueryPlanTests(TestCase):
+    """
+        query counts and plans of the hot paths; a hot query that stops using an index fails here.
+    """
+    def setUp(self):
+        caches['statements'].clear()
+        caches['idempotency'].clear()
+        self.user = User.objects.create(aadhar_id='555555555555', name='Plans', email_id='plans@example.com', annual_income=Decimal('1000000'), credit_score=700)
+        self.loan = Loan.objects.create(user=self.user, loan_amount=Decimal('5000.00'), interest_rate=Decimal('18.00'), term_period=12,
+                                        disbursement_date=date(2025, 1, 1), principal_balance=Decimal('4000.00'), status='Active')
+        for i in range(3):
+            Bill.objects.create(loan=self.loan, billing_date=date(2025, 1, 31) + timedelta(days=30 * i),
+                                due_date=date(2025, 2, 15) + timedelta(days=30 * i), principal_component=Decimal('120.00'),
+                                interest_component=Decimal('59.18'), min_due_amount=Decimal('179.18'), status='Paid' if i == 0 else 'Pending')
+        refresh_loan_summaries([self.loan.id])
+
+    def assert_plans_use_indexes(self, expected_queries, func):
+        with CaptureQueriesContext(connection) as queries:
+            response = func()
+        self.assertEqual(len(queries), expected_queries, [query['sql'] for query in queries])
+        self.assertEqual(full_table_scans(queries), [])
+        return response
+
+    def test_apply_loan(self):
+        response = self.assert_plans_use_indexes(5, lambda: self.client.post(reverse('apply-loan'), {
+            'unique_user_id': str(self.user.unique_user_id), 'loan_amount': '5000.00', 'interest_rate': '18.00',
+            'term_period': 6, 'disbursement_date': '2025-01-31'
+        }))
+        self.assertEqual(response.status_code, 200, response.content)
+
+    def test_make_payment(self):
+        response = self.assert_plans_use_indexes(8, lambda: self.client.post(reverse('make-payment'), {
+            'loan_id': str(self.loan.loan_id), 'amount': '200.00', 'idempotency_key': 'plans-1'
+        }))
+        self.assertEqual(response.status_code, 200)
+
+    def test_make_payments(self):
+        response = self.assert_plans_use_indexes(8, lambda: self.client.post(reverse('make-payments'), {'payments': [
+            {'loan_id': str(self.loan.loan_id), 'amount': '100.00', 'idempotency_key': 'plans-2'},
+            {'loan_id': str(self.loan.loan_id), 'amount': '100.00'},
+        ]}, content_type='application/json'))
+        self.assertEqual(response.status_code, 200)
+
+    def test_get_statement(self):
+        response = self.assert_plans_use_indexes(1, lambda: self.client.get(reverse('get-statement', kwargs={'loan_id': self.loan.loan_id})))
+        self.assertEqual(response.status_code, 200)
+
+    def test_billing_run(self):
+        result = self.assert_plans_use_indexes(8, lambda: run_billing(date(2025, 5, 1)))
+        self.assertEqual(result.billed, 1)
+
+
+class LoanSummaryTests(TestCase):
+    def setUp(self):
+        user = User.objects.create(aadhar_id='444444444444', name='Summary', email_id='summary@example.com', annual_income=Decimal('1000000'), credit_score=700)
+        self.loan = Loan.objects.create(user=user, loan_amount=Decimal('5000.00'), interest_rate=Decimal('18.00'), term_period=12,
+                                        disbursement_date=date(2025, 1, 1), principal_balance=Decimal('4000.00'), status='Active')
+
+    def test_billing_and_payments_keep_summary_in_sync(self):
+        self.assertEqual(self.loan.next_billing_date, date(2025, 1, 31))
+
+        run_billing(date(2025, 1, 31))
+        run_backfill(date(2025, 2, 1), date(2025, 4, 1))
+        apply_payment(self.loan.loan_id, Decimal('200.00'))
+        apply_payment_batch([(self.loan.loan_id, Decimal('50.00'), None)])
+
+        self.loan.refresh_from_db()
+        self.assertEqual((self.loan.last_billing_date, self.loan.next_billing_date), (date(2025, 4, 1), date(2025, 5, 1)))
+        self.assertEqual((self.loan.outstanding_bill_count, self.loan.outstanding_amount), (2, Decimal('287.54')))
+        self.assertEqual(check_loan_summaries(), (1, 0, dict.fromkeys(SUMMARY_FIELDS, 0)))
+
+    def test_checker_reports_and_fixes_drift(self):
+        Bill.objects.create(loan=self.loan, billing_date=date(2025, 1, 31), due_date=date(2025, 2, 15), principal_component=Decimal('90.00'),
+                            interest_component=Decimal('10.00'), min_due_amount=Decimal('100.00'))
+
+        out = StringIO()
+        call_command('check_loan_summaries', stdout=out)
+        self.assertIn('Checked: 1, Drifted: 1', out.getvalue())
+        self.assertIn('outstanding_amount: 1 loans', out.getvalue())
+
+        self.assertEqual(check_loan_summaries(fix=True)[1], 1)
+        self.assertEqual(check_loan_summaries()[1], 0)
+        self.loan.refresh_from_db()
+        self.assertEqual((self.loan.next_billing_date, self.loan.outstanding_amount), (date(2025, 3, 2), Decimal('100.00')))
+
+
+class FixtureLoanTests(TestCase):
+    # loaddata writes loans without their bill summary (count 0, next_billing_date NULL)
+    fixtures = ['test_billing_data.json']
+
+    def test_payment_reads_bills_despite_missing_summary(self):
+        apply_payment(Loan.objects.get(pk=104).loan_id, Decimal('1300.00'))
+
+        loan = Loan.objects.get(pk=104)
+        self.assertEqual(Bill.objects.get(pk=205).status, 'Paid')
+        self.assertEqual((loan.status, loan.principal_balance), ('Active', Decimal('132.04')))
+        self.assertEqual((loan.outstanding_bill_count, loan.outstanding_amount), (0, Decimal('0.00')))
+
+    def test_billing_fills_in_missing_summaries(self):
+        self.assertEqual(run_billing(date(2025, 5, 15)).billed, 1) # loan 104, 30 days after its last bill
+
+        self.assertTrue(Bill.objects.filter(loan_id=104, billing_date=date(2025, 5, 15)).exists())
+        self.assertFalse(Loan.objects.filter(next_billing_date__isnull=True).exists())
+        self.assertEqual(check_loan_summaries()[1], 0)
+
+
+class OverdueSweepTests(TestCase):
+    def setUp(self):
+        user = User.objects.create(aadhar_id='333333333333', name='Overdue', email_id='overdue@example.com', annual_income=Decimal('1000000'), credit_score=700)
+        self.loan = Loan.objects.create(user=user, loan_amount=Decimal('5000.00'), interest_rate=Decimal('18.00'), term_period=12,
+                                        disbursement_date=date(2025, 1, 1), principal_balance=Decimal('4000.00'), status='Active')
+        self.bills = [
+            Bill.objects.create(loan=self.loan, billing_date=date(2025, 1, 31) + timedelta(days=30 * i),
+                                due_date=date(2025, 2, 15) + timedelta(days=30 * i), principal_component=Decimal('90.00'),
+                                interest_component=Decimal('10.00'), min_due_amount=Decimal('100.00'), amount_paid=amount_paid, status=status)
+            for i, (amount_paid, status) in enumerate([
+                (Decimal('100.00'), 'Paid'), (Decimal('40.00'), 'Partially Paid'), (Decimal('0.00'), 'Pending'), (Decimal('0.00'), 'Pending')
+            ])
+        ]
+        refresh_loan_summaries([self.loan.id])
+
+    def test_marks_unpaid_past_due_bills_with_late_fee(self):
+        with self.assertNumQueries(5): # id range, then per chunk: savepoint, loan update, bill update, release
+            result = sweep_overdue_bills(as_of=date(2025, 4, 17), late_fee=Decimal('25.00'), chunk_size=100)
+
+        self.assertEqual((result.marked, result.late_fees, result.chunks), (2, Decimal('50.00'), 1))
+        self.assertEqual(
+            [(bill.status, bill.late_fee, bill.min_due_amount) for bill in Bill.objects.filter(loan=self.loan).order_by('due_date')],
+            [('Paid', Decimal('0.00'), Decimal('100.00')), ('Overdue', Decimal('25.00'), Decimal('125.00')),
+             ('Overdue', Decimal('25.00'), Decimal('125.00')), ('Pending', Decimal('0.00'), Decimal('100.00'))]
+        )
+        self.assertEqual(check_loan_summaries()[1], 0)
+
+        self.assertEqual(sweep_overdue_bills(as_of=date(2025, 4, 17), late_fee=Decimal('25.00'), chunk_size=1).marked, 0)
+        apply_payment(self.loan.loan_id, Decimal('85.00'))
+        self.assertEqual(Bill.objects.get(pk=self.bills[1].pk).status, 'Paid')
+
+
+class MetricsTests(TestCase):
+    def setUp(self):
+        reset_metrics()
+        user = User.objects.create(aadhar_id='222222222222', name='Metrics', email_id='metrics@example.com', annual_income=Decimal('1000000'), credit_score=700)
+        self.loan = Loan.objects.create(user=user, loan_amount=Decimal('5000.00'), interest_rate=Decimal('18.00'), term_period=12,
+                                        disbursement_date=date(2025, 1, 1), principal_balance=Decimal('4000.00'), status='Active')
+
+    def test_sampled_request_counts_queries_and_is_exported(self):
+        caches['statements'].clear()
+        with patch('credit_service.metrics.METRICS_SAMPLE_RATE', 1.0), self.assertLogs('credit_service.metrics', 'INFO') as logs:
+            self.client.get(reverse('get-statement', kwargs={'loan_id': self.loan.loan_id}))
+        line = json.loads(logs.records[0].getMessage())
+        self.assertEqual((line['event'], line['name'], line['status'], line['queries']), ('request', 'get-statement', 200, 1))
+
+        with patch('credit_service.metrics.METRICS_SAMPLE_RATE', 0.0):
+            self.client.get(reverse('get-statement', kwargs={'loan_id': self.loan.loan_id}))
+            with self.settings(METRICS_TOKEN='scrape-secret'):
+                metrics = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer scrape-secret').content.decode()
+
+        self.assertIn('credit_service_requests_total{method="GET",status="200",view="get-statement"} 2', metrics)
+        self.assertIn('credit_service_request_seconds_count{view="get-statement"} 2', metrics)
+        self.assertIn('credit_service_request_queries_bucket{view="get-statement",le="1"} 1', metrics) # only the sampled one
+        self.assertIn('# TYPE credit_service_request_seconds histogram', metrics)
+
+    def test_metrics_endpoint_needs_token_or_allowed_ip(self):
+        url = reverse('metrics')
+        with self.settings(METRICS_TOKEN='', METRICS_ALLOWED_IPS=[]):
+            self.assertEqual(self.client.get(url, REMOTE_ADDR='127.0.0.1').status_code, 403) # a proxy's address too
+        with self.settings(METRICS_TOKEN='scrape-secret', METRICS_ALLOWED_IPS=[]):
+            self.assertEqual(self.client.get(url, HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+            self.assertEqual(self.client.get(url, HTTP_AUTHORIZATION='Bearer scrape-secret').status_code, 200)
+        with self.settings(METRICS_TOKEN='', METRICS_ALLOWED_IPS=['10.1.2.3']):
+            self.assertEqual(self.client.get(url, REMOTE_ADDR='10.1.2.4').status_code, 403)
+            self.assertEqual(self.client.get(url, REMOTE_ADDR='10.1.2.3').status_code, 200)
+
+    def test_tasks_and_hot_functions_are_timed(self):
+        start_task('task-1', 'credit_service.tasks.update_user_credit_score')
+        list(User.objects.all())
+        with self.assertLogs('credit_service.metrics', 'INFO') as logs:
+            finish_task('task-1', 'credit_service.tasks.update_user_credit_score', 'SUCCESS')
+        self.assertEqual(json.loads(logs.records[0].getMessage())['queries'], 1)
+
+        with patch('credit_service.metrics.METRICS_SAMPLE_RATE', 1.0):
+            calculate_emi_schedule_fast(Decimal('5000.00'), Decimal('18.00'), 12, Decimal('1000000'), date(2025, 1, 31))
+        metrics = render_prometheus()
+        self.assertIn('credit_service_tasks_total{state="SUCCESS",task="credit_service.tasks.update_user_credit_score"} 1', metrics)
+        self.assertIn('credit_service_function_seconds_count{function="calculate_emi_schedule_fast"} 1', metrics)
+
+
+class SyntheticDataTests(TestCase):
+    def test_generated_data_is_consistent_and_reproducible(self):
+        out = StringIO()
+        call_command('generate_data', users=3, loans_per_user=2, bills_per_loan=4, payments_per_loan=2, as_of=date(2025, 6, 1),
+                     chunk_size=2, stdout=out)
+        self.assertIn('Created 3 users, 6 loans, 24 bills and 12 payments', out.getvalue())
+        self.assertEqual(check_loan_summaries()[1], 0)
+        self.assertEqual(Bill.objects.filter(status='Pending').count(), 6)
+        loan = Loan.objects.order_by('id').first()
+        self.assertEqual(
+            loan.principal_balance,
+            loan.loan_amount - sum(bill.principal_component for bill in loan.bills.filter(status='Paid'))
+        )
+
+        first = [(loan.loan_amount, loan.disbursement_date) for loan in Loan.objects.order_by('id')]
+        Loan.objects.all().delete()
+        User.objects.all().delete()
+        generate_synthetic_data(3, loans_per_user=2, bills_per_loan=4, as_of=date(2025, 6, 1))
+        self.assertEqual([(loan.loan_amount, loan.disbursement_date) for loan in Loan.objects.order_by('id')], first)
+
+        with self.assertRaisesMessage(CommandError, 'overlap existing users'):
+            call_command('generate_data', users=1, stdout=out)
+
+    def test_benchmark_reports_every_endpoint_to_json(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            json_path = os.path.join(tmpdir, 'benchmark.json')
+            call_command('benchmark', 'all', users=5, rows=50, requests=3, sample=1, json_path=json_path, stdout=StringIO())
+            with open(json_path, encoding='utf-8') as f:
+                report = json.load(f)
+
+        self.assertEqual(set(report['results']), {
+            'credit_score.csv_scan', 'emi_schedule.reference', 'emi_schedule.fast', 'statement.simulation', 'register-user',
+            'apply-loan', 'make-payment', 'get-statement.uncached', 'get-statement.cached', 'metrics.overhead', 'run_billing'
+        })
+        self.assertEqual(report['results']['metrics.overhead']['without_metrics']['n'], 3 * 3)
+        self.assertEqual(report['results']['get-statement.uncached']['queries_per_op'], 1.0)
+        self.assertEqual(report['results']['get-statement.cached']['queries_per_op'], 0.0)
+        self.assertEqual(report['results']['run_billing']['n'], 5 + 3) # generated loans and the ones apply-loan created
+        self.assertFalse(User.objects.exists())
+
+
+@skipUnlessDBFeature('has_select_for_update')
+class ConcurrentPaymentTests(TransactionTestCase):
+    def test_concurrent_payments_lose_no_updates(self):
+        user = User.objects.create(aadhar_id='666666666666', name='Concurrent', email_id='concurrent@example.com', annual_income=Decimal('1000000'), credit_score=700)
+        loan = Loan.objects.create(user=user, loan_amount=Decimal('5000.00'), interest_rate=Decimal('18.00'), term_period=12,
+                                   disbursement_date=date(2025, 1, 1), principal_balance=Decimal('1000.00'), status='Active')
+        Bill.objects.create(loan=loan, billing_date=date(2025, 1, 31), due_date=date(2025, 2, 15), principal_component=Decimal('90.00'),
+                            interest_component=Decimal('10.00'), min_due_amount=Decimal('100.00'), status='Pending')
+        refresh_loan_summaries([loan.id])
+        errors = []
+
+        def pay():
+            try:
+                apply_payment(loan.loan_id, Decimal('10.00'))
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=pay) for _ in range(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        loan.refresh_from_db()
+        bill = loan.bills.get()
+        self.assertEqual((bill.amount_paid, bill.status), (Decimal('100.00'), 'Paid'))
+        self.assertEqual(loan.principal_balance, Decimal('900.00'))
+        self.assertEqual(Payment.objects.filter(loan=loan).count(), 20)
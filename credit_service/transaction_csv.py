@@ -0,0 +1,133 @@
+
+import csv
+import mmap
+import os
+from dataclasses import dataclass, field
+from decimal import Decimal, InvalidOperation
+
+REQUIRED_COLUMNS = ('AADHARID', 'Amount', 'Transaction_type')
+
+
+class TransactionCSVError(Exception):
+    pass
+
+
+@dataclass
+class CSVScanStats:
+    rows: int = 0 # data lines read
+    matched: int = 0 # rows aggregated into the totals
+    malformed: int = 0 # rows that failed to parse: missing columns, bad encoding or amount
+    offset: int = field(default=0, compare=False) # byte offset just after the last line read
+
+
+def header_columns(header_line: bytes) -> tuple:
+    """
+        (AADHARID, Amount, Transaction_type) column indexes of a csv header line.
+    """
+    try:
+        header = next(csv.reader([header_line.decode('utf-8-sig')]), [])
+    except UnicodeDecodeError as e:
+        raise TransactionCSVError(f"CSV header is not valid UTF-8: {e}")
+    try:
+        return tuple(header.index(name) for name in REQUIRED_COLUMNS)
+    except ValueError:
+        raise TransactionCSVError(f"CSV header must contain {', '.join(REQUIRED_COLUMNS)} (found: {header}).")
+
+
+def split_row(line: bytes) -> list:
+    # plain rows are split directly, only quoted ones need the csv module
+    text = line.decode('utf-8')
+    if '"' in text:
+        return next(csv.reader([text]), [])
+    return text.rstrip('\r\n').split(',')
+
+
+def _lines_in_range(lines, offset: int, end_offset, complete_lines: bool, stats: CSVScanStats):
+    # the lines starting before end_offset, stopping at a last line without its newline when complete_lines.
+    # stats.offset stays just after the last line yielded.
+    stats.offset = offset
+    for line in lines:
+        if (end_offset is not None and offset >= end_offset) or (complete_lines and not line.endswith(b'\n')):
+            return
+        offset += len(line)
+        stats.offset = offset
+        yield line
+
+
+def iter_transactions(csv_path: str, aadhar_ids=None, stats: CSVScanStats = None, use_mmap: bool = False,
+                      start_offset: int = 0, end_offset: int = None, complete_lines: bool = False):
+    """
+        streams the csv and yields (aadhar_id, is_credit, amount) for every valid row, or only for the rows of
+        `aadhar_ids`. lines are only parsed when they can belong to one of them (a byte search first, when looking up
+        a single AADHARID) and amounts are only converted once the AADHARID column matched. rows of other transaction
+        types are ignored, rows that fail to parse are counted in `stats`. rows spanning several lines (quoted
+        newlines) are not supported.
+        only the lines starting in [start_offset, end_offset) are read, and with `complete_lines` a last line without
+        its newline (still being written) is left out. the offset reached is reported in `stats.offset`.
+    """
+    wanted = set(aadhar_ids) if aadhar_ids is not None else None
+    needle = next(iter(wanted)).encode('utf-8') if wanted is not None and len(wanted) == 1 else None
+    stats = stats if stats is not None else CSVScanStats()
+
+    with open(csv_path, mode='rb') as csvfile:
+        source = csvfile
+        if use_mmap and os.fstat(csvfile.fileno()).st_size: # mmap cannot map an empty file
+            source = mmap.mmap(csvfile.fileno(), 0, access=mmap.ACCESS_READ)
+        bounded = end_offset is not None or complete_lines
+        try:
+            header_line = source.readline()
+            aadhar_col, amount_col, type_col = header_columns(header_line)
+            width = max(aadhar_col, amount_col, type_col)
+            source.seek(max(start_offset, len(header_line)))
+            lines = iter(source) if source is csvfile else iter(source.readline, b'')
+            if bounded:
+                lines = _lines_in_range(lines, source.tell(), end_offset, complete_lines, stats)
+
+            for line in lines:
+                stats.rows += 1
+                if needle is not None and needle not in line:
+                    continue
+                try:
+                    row = split_row(line)
+                except (UnicodeDecodeError, csv.Error):
+                    stats.malformed += 1
+                    continue
+                if len(row) <= width:
+                    if line.strip():
+                        stats.malformed += 1
+                    continue
+
+                aadhar_id = row[aadhar_col]
+                if wanted is not None and aadhar_id not in wanted:
+                    continue
+                transaction_type = row[type_col].upper()
+                if transaction_type not in ('CREDIT', 'DEBIT'):
+                    continue # other transaction types (refunds, reversals...) do not count towards the score
+                try:
+                    amount = Decimal(row[amount_col])
+                except (InvalidOperation, ValueError, TypeError):
+                    stats.malformed += 1
+                    continue
+
+                stats.matched += 1
+                yield aadhar_id, transaction_type == 'CREDIT', amount
+        finally:
+            if not bounded:
+                stats.offset = source.tell() # no per-line bookkeeping on the plain scan
+            if source is not csvfile:
+                source.close()
+
+
+def read_transaction_totals(csv_path: str, aadhar_ids, use_mmap: bool = False, **scan_range):
+    """
+        returns ({aadhar_id: [total_credit, total_debit]}, CSVScanStats) for `aadhar_ids` (every AADHARID when None)
+        from one pass over the csv. `scan_range` (start_offset, end_offset, complete_lines) goes to iter_transactions.
+    """
+    totals = {}
+    stats = CSVScanStats()
+    for aadhar_id, is_credit, amount in iter_transactions(csv_path, aadhar_ids, stats, use_mmap=use_mmap, **scan_range):
+        entry = totals.get(aadhar_id)
+        if entry is None:
+            entry = totals[aadhar_id] = [Decimal('0.00'), Decimal('0.00')]
+        entry[0 if is_credit else 1] += amount
+    return totals, stats
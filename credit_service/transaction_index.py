@@ -0,0 +1,134 @@
+
+import hashlib
+import os
+import logging
+from decimal import Decimal
+from django.db import transaction
+from .models import TransactionAggregate, TransactionIndexState
+from .transaction_csv import read_transaction_totals, TransactionCSVError
+from .utils import CSV_FILE_PATH, credit_score_from_balance
+
+logger = logging.getLogger(__name__)
+
+WRITE_BATCH_SIZE = 500
+DIGEST_WINDOW_BYTES = 64 * 1024
+
+
+class TransactionIndexError(Exception):
+    pass
+
+
+def _offset_digest(csvfile, offset: int) -> str:
+    """
+        sha1 of the bytes just before `offset`, used to tell a plain append apart from a rewritten file.
+    """
+    start = max(0, offset - DIGEST_WINDOW_BYTES)
+    csvfile.seek(start)
+    return hashlib.sha1(csvfile.read(offset - start)).hexdigest()
+
+
+def scan_transactions(csv_path: str, start_offset: int, end_offset: int):
+    """
+        aggregates credit/debit totals per AADHARID for the complete rows between two byte offsets of the csv, with
+        the rules of transaction_csv.iter_transactions. returns (totals, end offset actually reached, rows aggregated).
+    """
+    try:
+        totals, stats = read_transaction_totals(csv_path, None, start_offset=start_offset, end_offset=end_offset, complete_lines=True)
+    except TransactionCSVError as e:
+        raise TransactionIndexError(str(e))
+    return totals, stats.offset, stats.matched
+
+
+def _write_totals(totals: dict, replace: bool):
+    if replace:
+        TransactionAggregate.objects.all().delete()
+
+    aadhar_ids = list(totals)
+    for i in range(0, len(aadhar_ids), WRITE_BATCH_SIZE):
+        chunk = aadhar_ids[i:i + WRITE_BATCH_SIZE]
+        existing = {} if replace else {
+            aggregate.aadhar_id: aggregate
+            for aggregate in TransactionAggregate.objects.filter(aadhar_id__in=chunk)
+        }
+
+        to_create = []
+        to_update = []
+        for aadhar_id in chunk:
+            credit, debit = totals[aadhar_id]
+            aggregate = existing.get(aadhar_id)
+            if aggregate is None:
+                to_create.append(TransactionAggregate(aadhar_id=aadhar_id, total_credit=credit, total_debit=debit))
+            else:
+                aggregate.total_credit += credit
+                aggregate.total_debit += debit
+                to_update.append(aggregate)
+
+        TransactionAggregate.objects.bulk_create(to_create)
+        TransactionAggregate.objects.bulk_update(to_update, ['total_credit', 'total_debit', 'updated_at'])
+
+
+def refresh_transaction_index(csv_path: str = CSV_FILE_PATH, force_rebuild: bool = False) -> TransactionIndexState:
+    """
+        brings the per-AADHARID aggregates up to date with the csv. unchanged files cost one stat() and one query,
+        appended rows are aggregated from the last indexed offset, anything else triggers a full rebuild. the
+        aggregates hold one csv at a time: indexing another file rebuilds them for that file.
+        a last row without its newline yet is not indexed until it is complete.
+    """
+    source_path = str(csv_path)
+    file_stat = os.stat(source_path)
+    state = TransactionIndexState.objects.filter(source_path=source_path).first()
+
+    if (state and not force_rebuild
+            and state.file_size == file_stat.st_size and state.file_mtime_ns == file_stat.st_mtime_ns):
+        return state
+
+    with open(source_path, mode='rb') as csvfile:
+        incremental = (
+            state is not None and not force_rebuild
+            and 0 < state.indexed_offset <= file_stat.st_size
+            and _offset_digest(csvfile, state.indexed_offset) == state.offset_digest
+        )
+        start_offset = state.indexed_offset if incremental else 0
+        totals, end_offset, row_count = scan_transactions(source_path, start_offset, file_stat.st_size)
+        digest = _offset_digest(csvfile, end_offset)
+
+    with transaction.atomic():
+        locked_state, _ = TransactionIndexState.objects.select_for_update().get_or_create(source_path=source_path)
+        if incremental and locked_state.indexed_offset != start_offset:
+            # another worker refreshed the index while we were scanning
+            logger.info(f"Transaction index for {source_path} was refreshed concurrently, skipping.")
+            return locked_state
+
+        if not incremental:
+            # the aggregates hold a single csv: drop the state of any other source so that its next refresh rebuilds
+            # instead of trusting totals this rebuild is about to replace
+            TransactionIndexState.objects.exclude(source_path=source_path).delete()
+        _write_totals(totals, replace=not incremental)
+
+        locked_state.file_size = file_stat.st_size
+        locked_state.file_mtime_ns = file_stat.st_mtime_ns
+        locked_state.indexed_offset = end_offset
+        locked_state.offset_digest = digest
+        locked_state.row_count = (locked_state.row_count if incremental else 0) + row_count
+        locked_state.save()
+
+    logger.info(
+        f"{'Updated' if incremental else 'Rebuilt'} transaction index for {source_path}: "
+        f"{row_count} rows, {len(totals)} AADHARIDs, offset {start_offset} -> {end_offset}."
+    )
+    return locked_state
+
+
+def get_transaction_totals(aadhar_id: str):
+    """
+        returns (total_credit, total_debit) for an AADHARID from the index, zeros if it has no transactions.
+    """
+    totals = TransactionAggregate.objects.filter(aadhar_id=aadhar_id).values_list('total_credit', 'total_debit').first()
+    if totals is None:
+        return Decimal('0.00'), Decimal('0.00')
+    return totals
+
+
+def indexed_credit_score(aadhar_id: str) -> int:
+    total_credit, total_debit = get_transaction_totals(aadhar_id)
+    return credit_score_from_balance(total_credit - total_debit)
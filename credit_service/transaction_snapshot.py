@@ -0,0 +1,248 @@
+
+import json
+import os
+import struct
+import logging
+from array import array
+from dataclasses import dataclass
+from decimal import Decimal, ROUND_HALF_UP
+from django.conf import settings
+from .transaction_csv import iter_transactions, CSVScanStats
+from .utils import (
+    CSV_FILE_PATH, credit_score_from_balance,
+    LOWER_BOUND_BALANCE, UPPER_BOUND_BALANCE, BALANCE_STEP, SCORE_STEP, MIN_CREDIT_SCORE, MAX_CREDIT_SCORE
+)
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_MAGIC = b'CSTXSNP1'
+SNAPSHOT_ALIGNMENT = 64
+PAISE = Decimal('0.01')
+
+# file layout: magic, uint32 header length, json header, then each column at an aligned offset:
+#   ids       S<id_width>  distinct AADHARIDs, sorted
+#   offsets   int64        first row of each AADHARID (n_ids + 1 entries, rows are grouped by AADHARID)
+#   amounts   int64        amount in paise
+#   is_credit uint8        one bit per row (little bit order), 1 = CREDIT, 0 = DEBIT
+
+
+class TransactionSnapshotError(Exception):
+    pass
+
+
+def _numpy():
+    try:
+        import numpy
+    except ImportError:
+        raise TransactionSnapshotError("Transaction snapshots need NumPy (pip install numpy).")
+    return numpy
+
+
+def _aligned(offset: int) -> int:
+    return -(-offset // SNAPSHOT_ALIGNMENT) * SNAPSHOT_ALIGNMENT
+
+
+def _source_signature(csv_path: str) -> dict:
+    file_stat = os.stat(csv_path)
+    return {'source_size': file_stat.st_size, 'source_mtime_ns': file_stat.st_mtime_ns}
+
+
+@dataclass
+class SnapshotBuildResult:
+    path: str
+    aadhar_ids: int
+    rows: int
+    malformed: int
+
+
+def build_transaction_snapshot(csv_path: str = CSV_FILE_PATH, snapshot_path: str = None) -> SnapshotBuildResult:
+    """
+        converts the transactions csv into a columnar snapshot grouped by AADHARID (see the layout above).
+        amounts are stored in paise, rounded half up. the file is written next to its target and moved into place,
+        so readers never see a partial snapshot.
+    """
+    np = _numpy()
+    snapshot_path = snapshot_path or settings.TRANSACTION_SNAPSHOT_PATH
+    signature = _source_signature(csv_path)
+
+    # one pass over the csv into compact arrays, AADHARIDs as codes in order of appearance
+    codes_by_id = {}
+    codes, amounts, is_credit = array('i'), array('q'), array('b')
+    stats = CSVScanStats()
+    for aadhar_id, credit, amount in iter_transactions(csv_path, stats=stats):
+        code = codes_by_id.get(aadhar_id)
+        if code is None:
+            code = codes_by_id[aadhar_id] = len(codes_by_id)
+        codes.append(code)
+        amounts.append(int(amount.quantize(PAISE, rounding=ROUND_HALF_UP) * 100))
+        is_credit.append(credit)
+
+    id_width = max((len(aadhar_id.encode('utf-8')) for aadhar_id in codes_by_id), default=1)
+    ids = np.array(list(codes_by_id), dtype=f'S{id_width}')
+    id_order = np.argsort(ids, kind='stable')
+    rank_of_code = np.empty(len(ids), dtype=np.int64)
+    rank_of_code[id_order] = np.arange(len(ids))
+
+    ranks = rank_of_code[np.frombuffer(codes, dtype=np.int32)] if len(codes) else np.empty(0, dtype=np.int64)
+    row_order = np.argsort(ranks, kind='stable')
+    columns = {
+        'ids': ids[id_order],
+        'offsets': np.concatenate(([0], np.cumsum(np.bincount(ranks, minlength=len(ids))))).astype('<i8'),
+        'amounts': np.frombuffer(amounts, dtype=np.int64)[row_order].astype('<i8') if len(amounts) else np.empty(0, '<i8'),
+        'is_credit': np.packbits(np.frombuffer(is_credit, dtype=np.int8)[row_order].astype(bool), bitorder='little'),
+    }
+
+    header = {'id_width': id_width, 'aadhar_ids': len(ids), 'rows': len(amounts), 'columns': {}, **signature}
+    offset = 0
+    for name, column in columns.items():
+        header['columns'][name] = offset
+        offset = _aligned(offset + column.nbytes)
+    header_bytes = json.dumps(header).encode('utf-8')
+    data_start = _aligned(len(SNAPSHOT_MAGIC) + 4 + len(header_bytes))
+
+    tmp_path = f"{snapshot_path}.tmp{os.getpid()}"
+    try:
+        with open(tmp_path, mode='wb') as snapshot:
+            snapshot.write(SNAPSHOT_MAGIC + struct.pack('<I', len(header_bytes)) + header_bytes)
+            for name, column in columns.items():
+                snapshot.seek(data_start + header['columns'][name])
+                snapshot.write(column.tobytes())
+            snapshot.truncate(data_start + offset)
+        os.replace(tmp_path, snapshot_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    logger.info(f"Wrote transaction snapshot {snapshot_path}: {len(amounts)} rows, {len(ids)} AADHARIDs, {stats.malformed} malformed rows skipped.")
+    return SnapshotBuildResult(snapshot_path, len(ids), len(amounts), stats.malformed)
+
+
+class TransactionSnapshot:
+    """
+        read-only view of a snapshot file. the columns are numpy memmaps, so opening it reads only the header
+        and lookups only touch the pages they need.
+    """
+    def __init__(self, snapshot_path: str = None):
+        np = self.np = _numpy()
+        self.path = snapshot_path or settings.TRANSACTION_SNAPSHOT_PATH
+        with open(self.path, mode='rb') as snapshot:
+            prefix = snapshot.read(len(SNAPSHOT_MAGIC) + 4)
+            if len(prefix) < len(SNAPSHOT_MAGIC) + 4 or not prefix.startswith(SNAPSHOT_MAGIC):
+                raise TransactionSnapshotError(f"{self.path} is not a transaction snapshot.")
+            header_length, = struct.unpack('<I', prefix[len(SNAPSHOT_MAGIC):])
+            self.header = json.loads(snapshot.read(header_length))
+
+        data_start = _aligned(len(SNAPSHOT_MAGIC) + 4 + header_length)
+        n_ids, n_rows = self.header['aadhar_ids'], self.header['rows']
+
+        def column(name, dtype, length):
+            if not length:
+                return np.empty(0, dtype=dtype)
+            return np.memmap(self.path, dtype=dtype, mode='r', offset=data_start + self.header['columns'][name], shape=(length,))
+
+        self.ids = column('ids', f"S{self.header['id_width']}", n_ids)
+        self.offsets = column('offsets', '<i8', n_ids + 1)
+        self.amounts = column('amounts', '<i8', n_rows)
+        self.is_credit = column('is_credit', np.uint8, (n_rows + 7) // 8)
+
+    def is_current(self, csv_path: str = CSV_FILE_PATH) -> bool:
+        """
+            whether the csv is unchanged (size and mtime) since the snapshot was built from it.
+        """
+        try:
+            signature = _source_signature(csv_path)
+        except OSError:
+            return False
+        return all(self.header.get(key) == value for key, value in signature.items())
+
+    def _positions(self, aadhar_ids: list):
+        # index of each AADHARID in self.ids, -1 when it has no transactions
+        np = self.np
+        positions = np.full(len(aadhar_ids), -1, dtype=np.int64)
+        if not len(self.ids) or not aadhar_ids:
+            return positions
+        encoded = [aadhar_id.encode('utf-8') for aadhar_id in aadhar_ids]
+        fits = np.fromiter((len(value) <= self.ids.itemsize for value in encoded), dtype=bool, count=len(encoded))
+        queries = np.array(encoded, dtype=self.ids.dtype) # longer ids are truncated, `fits` drops them
+        found = np.minimum(np.searchsorted(self.ids, queries), len(self.ids) - 1)
+        matched = fits & (self.ids[found] == queries)
+        positions[matched] = found[matched]
+        return positions
+
+    def _credit_bits(self, start: int, stop: int):
+        np = self.np
+        bits = np.unpackbits(self.is_credit[start // 8:(stop + 7) // 8], bitorder='little')
+        return bits[start % 8:start % 8 + (stop - start)].astype(bool)
+
+    def totals(self, aadhar_id: str):
+        """
+            returns (total_credit, total_debit) for an AADHARID, zeros if it has no transactions.
+        """
+        position = int(self._positions([aadhar_id])[0])
+        if position < 0:
+            return Decimal('0.00'), Decimal('0.00')
+        start, stop = int(self.offsets[position]), int(self.offsets[position + 1])
+        amounts, credit = self.amounts[start:stop], self._credit_bits(start, stop)
+        return Decimal(int(amounts[credit].sum())) / 100, Decimal(int(amounts[~credit].sum())) / 100
+
+    def credit_score(self, aadhar_id: str) -> int:
+        total_credit, total_debit = self.totals(aadhar_id)
+        return credit_score_from_balance(total_credit - total_debit)
+
+    def balances(self):
+        """
+            credit - debit in paise for every AADHARID of self.ids, in one vectorized pass over the rows.
+        """
+        np = self.np
+        if not len(self.ids):
+            return np.empty(0, dtype=np.int64)
+        credit = self._credit_bits(0, len(self.amounts))
+        signed = np.where(credit, self.amounts, -self.amounts)
+        return np.add.reduceat(signed, self.offsets[:-1])
+
+    def credit_scores(self, aadhar_ids=None) -> dict:
+        """
+            scores many AADHARIDs (every AADHARID of the snapshot by default) at once, with the banding rules of
+            credit_score_from_balance applied to whole arrays. returns {aadhar_id: score}.
+        """
+        np = self.np
+        scores = scores_from_balances(np, self.balances())
+        if aadhar_ids is None:
+            return dict(zip((value.decode('utf-8') for value in self.ids.tolist()), scores.tolist()))
+
+        aadhar_ids = list(aadhar_ids)
+        positions = self._positions(aadhar_ids)
+        picked = np.where(positions >= 0, scores[np.maximum(positions, 0)] if len(scores) else MIN_CREDIT_SCORE, MIN_CREDIT_SCORE)
+        return dict(zip(aadhar_ids, picked.tolist()))
+
+
+def scores_from_balances(np, balances):
+    """
+        credit_score_from_balance for an int64 array of balances in paise.
+    """
+    lower, upper, step = (int(value * 100) for value in (LOWER_BOUND_BALANCE, UPPER_BOUND_BALANCE, BALANCE_STEP))
+    steps = np.maximum(balances - lower, 0) // step
+    scores = np.minimum(MIN_CREDIT_SCORE + steps * SCORE_STEP, MAX_CREDIT_SCORE)
+    scores[balances <= lower] = MIN_CREDIT_SCORE
+    scores[balances >= upper] = MAX_CREDIT_SCORE
+    return scores.astype(np.int64)
+
+
+def snapshot_credit_scores(aadhar_ids, csv_path: str = CSV_FILE_PATH, snapshot_path: str = None):
+    """
+        {aadhar_id: score} from the snapshot when one exists and the csv has not changed since it was built,
+        else None (the caller falls back to scanning the csv).
+    """
+    snapshot_path = snapshot_path or settings.TRANSACTION_SNAPSHOT_PATH
+    if not os.path.exists(snapshot_path):
+        return None
+    try:
+        snapshot = TransactionSnapshot(snapshot_path)
+    except (OSError, ValueError, TransactionSnapshotError) as e:
+        logger.warning(f"Transaction snapshot {snapshot_path} unusable ({e}), scanning the CSV instead.")
+        return None
+    if not snapshot.is_current(csv_path):
+        logger.info(f"Transaction snapshot {snapshot_path} is older than {csv_path}, scanning the CSV instead.")
+        return None
+    return snapshot.credit_scores(aadhar_ids)
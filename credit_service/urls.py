@@ -1,11 +1,19 @@
+from django.conf import settings
 from django.urls import path
 from .views import (
-    RegisterUserView, ApplyLoanView, MakePaymentView, GetStatementView
+    RegisterUserView, ApplyLoanView, QuoteLoansView, MakePaymentView, MakePaymentsView, GetStatementView,
+    AsyncGetStatementView, MetricsView
 )
 
+# read endpoints get their native async views only with ASYNC_READ_VIEWS=1 (off by default, also under ASGI)
+StatementView = AsyncGetStatementView if settings.ASYNC_READ_VIEWS else GetStatementView
+
 urlpatterns = [
     path('register-user/', RegisterUserView.as_view(), name='register-user'),
     path('apply-loan/', ApplyLoanView.as_view(), name='apply-loan'),
+    path('quote-loans/', QuoteLoansView.as_view(), name='quote-loans'),
     path('make-payment/', MakePaymentView.as_view(), name='make-payment'),
-    path('get-statement/<uuid:loan_id>/', GetStatementView.as_view(), name='get-statement'),
+    path('make-payments/', MakePaymentsView.as_view(), name='make-payments'),
+    path('get-statement/<uuid:loan_id>/', StatementView.as_view(), name='get-statement'),
+    path('metrics/', MetricsView.as_view(), name='metrics'),
 ]
\ No newline at end of file
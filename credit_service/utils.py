@@ -1,60 +1,61 @@
 
-import csv
+import calendar
 import os
 import logging
-from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+from functools import lru_cache
+from decimal import Decimal, ROUND_HALF_UP
 from django.conf import settings
 from dateutil.relativedelta import relativedelta
+from .metrics import timed
+from .transaction_csv import read_transaction_totals, TransactionCSVError
 
 logger = logging.getLogger(__name__)
 
 CSV_FILE_PATH = os.path.join(settings.BASE_DIR, 'data', 'transactions.csv')
 
-def calculate_credit_score(aadhar_id: str) -> int:
+@timed('calculate_credit_score')
+def calculate_credit_score(aadhar_id: str, csv_path: str = CSV_FILE_PATH) -> int:
     """
         makes a user's credit score (b/w 300 to 900) based on their transactions, else returns 300 if it can't be calculated.
     """
-    total_credit = Decimal('0.00')
-    total_debit = Decimal('0.00')
-
     try:
-        with open(CSV_FILE_PATH, mode='r', encoding='utf-8') as csvfile:
-            reader = csv.DictReader(csvfile)
-            for row in reader:
-                if row.get('AADHARID') == aadhar_id:
-                    try:
-                        amount = Decimal(row.get('Amount', '0'))
-                        transaction_type = row.get('Transaction_type', '').upper()
-
-                        if transaction_type == 'CREDIT':
-                            total_credit += amount
-                        elif transaction_type == 'DEBIT':
-                            total_debit += amount
-                    except (InvalidOperation, ValueError, TypeError) as e:
-                        continue
-    except Exception as e:
+        totals, stats = read_transaction_totals(csv_path, [aadhar_id], use_mmap=settings.CREDIT_SCORE_CSV_MMAP)
+    except (OSError, TransactionCSVError) as e:
         logger.error(f"Error in reading CSV for Aadhar {aadhar_id}: {e}", exc_info=True)
         return 300
 
+    if stats.malformed:
+        logger.warning(f"Skipped {stats.malformed} malformed transaction rows while scoring Aadhar {aadhar_id}.")
+
+    total_credit, total_debit = totals.get(aadhar_id, (Decimal('0.00'), Decimal('0.00')))
     account_balance = total_credit - total_debit #total balance
 
-    lower_bound_balance = Decimal('100000')
-    upper_bound_balance = Decimal('1000000')
-    balance_step = Decimal('15000')
-    score_step = 10
-    min_score = 300
-    max_score = 900
-
-    if account_balance >= upper_bound_balance:
-        score = max_score
-    elif account_balance <= lower_bound_balance:
-        score = min_score
+    return credit_score_from_balance(account_balance)
+
+
+# credit score bands: 300 up to a 100000 balance, +10 per 15000 above it, 900 from 1000000
+LOWER_BOUND_BALANCE = Decimal('100000')
+UPPER_BOUND_BALANCE = Decimal('1000000')
+BALANCE_STEP = Decimal('15000')
+SCORE_STEP = 10
+MIN_CREDIT_SCORE = 300
+MAX_CREDIT_SCORE = 900
+
+
+def credit_score_from_balance(account_balance: Decimal) -> int:
+    """
+        maps an account balance (total credit - total debit) onto the 300 to 900 credit score bands.
+    """
+    if account_balance >= UPPER_BOUND_BALANCE:
+        score = MAX_CREDIT_SCORE
+    elif account_balance <= LOWER_BOUND_BALANCE:
+        score = MIN_CREDIT_SCORE
     else:
-        steps = int((account_balance - lower_bound_balance) // balance_step)
-        score = min_score + (steps * score_step)
-        score = min(score, max_score)
+        steps = int((account_balance - LOWER_BOUND_BALANCE) // BALANCE_STEP)
+        score = MIN_CREDIT_SCORE + (steps * SCORE_STEP)
+        score = min(score, MAX_CREDIT_SCORE)
 
-    score = max(min_score, min(score, max_score))
+    score = max(MIN_CREDIT_SCORE, min(score, MAX_CREDIT_SCORE))
 
     return int(score)
 
@@ -62,12 +63,9 @@ def calculate_credit_score(aadhar_id: str) -> int:
 class EMICalculationError(ValueError):
     pass
 
-def calculate_emi_schedule(loan_amount: Decimal, annual_interest_rate: Decimal,
-                           term_months: int, annual_income: Decimal,
-                           disbursement_date) -> list:
+def _emi_amount(loan_amount: Decimal, annual_interest_rate: Decimal, term_months: int):
     """
-        this function calculates the EMI schedule based on loan details and checks constraints
-        and returns a list of EMI payments or raises an error.
+        checks the income-independent loan constraints and returns (monthly_rate, emi_amount), or raises EMICalculationError.
     """
     if term_months <= 0:
         raise EMICalculationError("Term period must be greater than 0 months.")
@@ -89,11 +87,35 @@ def calculate_emi_schedule(loan_amount: Decimal, annual_interest_rate: Decimal,
     else:
         emi_amount = (loan_amount / Decimal(term_months)).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
 
+    return monthly_rate, emi_amount
+
+
+def _check_emi_affordable(emi_amount: Decimal, annual_income: Decimal):
     monthly_income = annual_income / Decimal('12')
     max_allowed_emi = (monthly_income * Decimal('0.20')).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
     if emi_amount > max_allowed_emi:
         raise EMICalculationError(f"calculated EMI (Rs. {emi_amount:.2f}) crosses 20% of monthly income (Max Allowed: Rs. {max_allowed_emi:.2f}).")
 
+
+def _emi_terms(loan_amount: Decimal, annual_interest_rate: Decimal, term_months: int, annual_income: Decimal):
+    """
+        checks the loan constraints and returns (monthly_rate, emi_amount), or raises EMICalculationError.
+    """
+    monthly_rate, emi_amount = _emi_amount(loan_amount, annual_interest_rate, term_months)
+    _check_emi_affordable(emi_amount, annual_income)
+    return monthly_rate, emi_amount
+
+
+@timed('calculate_emi_schedule')
+def calculate_emi_schedule(loan_amount: Decimal, annual_interest_rate: Decimal,
+                           term_months: int, annual_income: Decimal,
+                           disbursement_date) -> list:
+    """
+        this function calculates the EMI schedule based on loan details and checks constraints
+        and returns a list of EMI payments or raises an error.
+    """
+    monthly_rate, emi_amount = _emi_terms(loan_amount, annual_interest_rate, term_months, annual_income)
+
     schedule = []
     current_balance = loan_amount
     first_due_date = disbursement_date + relativedelta(months=1)
@@ -129,4 +151,95 @@ def calculate_emi_schedule(loan_amount: Decimal, annual_interest_rate: Decimal,
     if abs(current_balance) > Decimal('0.01'):
         pass 
 
-    return schedule
\ No newline at end of file
+    return schedule
+
+
+TWOPLACES = Decimal('0.01')
+EMI_TEMPLATE_CACHE_SIZE = getattr(settings, 'EMI_TEMPLATE_CACHE_SIZE', 256)
+
+
+def add_months(start_date, months: int):
+    """
+        same result as start_date + relativedelta(months=months): day clamped to the end of the target month.
+    """
+    month_index = start_date.month - 1 + months
+    year, month = start_date.year + month_index // 12, month_index % 12 + 1
+    return start_date.replace(year=year, month=month, day=min(start_date.day, calendar.monthrange(year, month)[1]))
+
+
+@lru_cache(maxsize=EMI_TEMPLATE_CACHE_SIZE)
+def _emi_schedule_template(loan_amount: Decimal, annual_interest_rate: Decimal, term_months: int):
+    """
+        date-independent part of a schedule: (emi_amount, ((amount_due, principal, interest), ...)) per month index.
+        memoized since amounts are capped at 5000 and rates/terms cluster on a few products.
+    """
+    monthly_rate, emi_amount = _emi_amount(loan_amount, annual_interest_rate, term_months)
+
+    zero = Decimal('0.00')
+    last_month = term_months - 1
+    current_balance = loan_amount
+    rows = []
+
+    for i in range(term_months):
+        interest_component = (current_balance * monthly_rate).quantize(TWOPLACES, rounding=ROUND_HALF_UP)
+
+        if i == last_month or emi_amount - interest_component > current_balance:
+            principal_component = current_balance
+            actual_emi_for_month = principal_component + interest_component
+        else:
+            principal_component = emi_amount - interest_component
+            actual_emi_for_month = emi_amount
+
+        current_balance -= principal_component
+        rows.append((actual_emi_for_month, principal_component, interest_component))
+
+        if current_balance < zero and i < last_month:
+            current_balance = zero
+
+    return emi_amount, tuple(rows)
+
+
+def emi_schedule_cache_info() -> dict:
+    """
+        hits/misses/maxsize/currsize of the schedule template cache, for tuning EMI_TEMPLATE_CACHE_SIZE.
+    """
+    return _emi_schedule_template.cache_info()._asdict()
+
+
+@timed('calculate_emi_schedule_fast')
+def calculate_emi_schedule_fast(loan_amount: Decimal, annual_interest_rate: Decimal,
+                                term_months: int, annual_income: Decimal,
+                                disbursement_date) -> list:
+    """
+        faster engine producing exactly the same schedule (values and rounding) as calculate_emi_schedule.
+        with a 2-decimal loan amount every component stays at 2 places, so the amounts only depend on
+        (amount, rate, term) and come from a memoized template; the income check and the due dates
+        (plain month arithmetic instead of a relativedelta per row) are applied per call.
+    """
+    if loan_amount != loan_amount.quantize(TWOPLACES):
+        return calculate_emi_schedule(loan_amount, annual_interest_rate, term_months, annual_income, disbursement_date)
+
+    emi_amount, rows = _emi_schedule_template(loan_amount.quantize(TWOPLACES), annual_interest_rate, term_months)
+    _check_emi_affordable(emi_amount, annual_income)
+    return _dated_schedule(rows, disbursement_date)
+
+
+def build_emi_schedule(loan_amount: Decimal, annual_interest_rate: Decimal, term_months: int, disbursement_date) -> list:
+    """
+        schedule of an already approved loan: same rows as calculate_emi_schedule_fast but without the income check.
+    """
+    emi_amount, rows = _emi_schedule_template(loan_amount.quantize(TWOPLACES), annual_interest_rate, term_months)
+    return _dated_schedule(rows, disbursement_date)
+
+
+def _dated_schedule(rows, disbursement_date) -> list:
+    first_due_date = add_months(disbursement_date, 1)
+    return [
+        {
+            'due_date': add_months(first_due_date, i),
+            'amount_due': amount_due,
+            'principal_component': principal_component,
+            'interest_component': interest_component
+        }
+        for i, (amount_due, principal_component, interest_component) in enumerate(rows)
+    ]
@@ -1,36 +1,43 @@
 
+import hmac
 import logging # Keep logging import for logger.error
-from decimal import Decimal, ROUND_HALF_UP
+from datetime import timedelta
+from decimal import Decimal
 
 # Django & DRF Imports
-from django.db import transaction
-from django.db.models import F
+from django.db import IntegrityError, transaction
 from django.utils import timezone
-from django.http import Http404
+from django.conf import settings
+from django.http import Http404, HttpResponse
+from django.views import View
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
-from dateutil.relativedelta import relativedelta
-from .models import User, Loan, Bill, Payment
+from rest_framework.renderers import JSONRenderer
+from .models import User, Loan, Installment
 
 from .serializers import (
     UserRegistrationSerializer, UserResponseSerializer,
     LoanApplicationSerializer, LoanResponseSerializer,
-    MakePaymentSerializer, PastTransactionSerializer, UpcomingTransactionSerializer
+    LoanQuoteRequestSerializer, MakePaymentSerializer, MakePaymentsSerializer,
+    serialize_past_transactions, serialize_upcoming_transactions
 )
 
-from .tasks import update_user_credit_score
-from .utils import calculate_emi_schedule, EMICalculationError
+from .score_outbox import enqueue_credit_score
+from .utils import calculate_emi_schedule_fast, EMICalculationError
+from .quotes import quote_loan_offers
+from .installments import installments_from_schedule
+from .payments import apply_payment, apply_payments, PaymentRejected, PAYMENT_INTERNAL_ERROR
+from .billing import calculate_bill_amounts, BILLING_CYCLE_DAYS
+from .metrics import render_prometheus
+from .statement_cache import (
+    statement_version, get_cached_statement, store_statement, statement_response,
+    astatement_version, aget_cached_statement, astore_statement
+)
 
 
 logger = logging.getLogger(__name__)
 
-# Constants for GetStatementView
-TWOPLACES = Decimal('0.01')
-DAYS_IN_YEAR = Decimal('365')
-PRINCIPAL_PERCENTAGE = Decimal('0.03')
-BILLING_CYCLE_DAYS = 30
-
 
 # User registration
 class RegisterUserView(APIView):
@@ -39,14 +46,16 @@ class RegisterUserView(APIView):
 
         if serializer.is_valid():
             try:
-                user = User.objects.create(
-                    aadhar_id=serializer.validated_data['aadhar_id'],
-                    name=serializer.validated_data['name'],
-                    email_id=serializer.validated_data['email_id'],
-                    annual_income=serializer.validated_data['annual_income']
-                )
-
-                task_result = update_user_credit_score.delay(user.id)
+                # no exists() pre-checks: the unique constraints reject duplicates, and the score task is queued
+                # in the same transaction (relayed to Celery after commit, see score_outbox)
+                with transaction.atomic():
+                    user = User.objects.create(
+                        aadhar_id=serializer.validated_data['aadhar_id'],
+                        name=serializer.validated_data['name'],
+                        email_id=serializer.validated_data['email_id'],
+                        annual_income=serializer.validated_data['annual_income']
+                    )
+                    enqueue_credit_score([user.id])
 
                 response_serializer = UserResponseSerializer(user)
                 return Response({
@@ -54,6 +63,12 @@ class RegisterUserView(APIView):
                     **response_serializer.data
                 }, status=status.HTTP_200_OK)
 
+            except IntegrityError as e:
+                conflicts = registration_conflicts(serializer.validated_data)
+                if not conflicts:
+                    logger.error(f"Error at user registration: {e}", exc_info=True)
+                    return Response({"Error": "An internal error occurred"}, status=status.HTTP_400_BAD_REQUEST)
+                return Response({"Error": f"Validation Failed: {'; '.join(conflicts)}"}, status=status.HTTP_400_BAD_REQUEST)
             except Exception as e:
                 logger.error(f"Error at user registration: {e}", exc_info=True)
                 return Response({"Error": "An internal error occurred"}, status=status.HTTP_400_BAD_REQUEST)
@@ -63,6 +78,46 @@ class RegisterUserView(APIView):
 
 
 
+def registration_conflicts(data) -> list:
+    """
+        names the unique fields a failed registration collided with, in the serializer's error format.
+        only runs after an IntegrityError, so successful registrations skip these lookups.
+    """
+    conflicts = []
+    if User.objects.filter(aadhar_id=data['aadhar_id']).exists():
+        conflicts.append("aadhar_id: User with this Aadhar ID already exists.")
+    if User.objects.filter(email_id=data['email_id']).exists():
+        conflicts.append("email_id: User with this Email ID already exists.")
+    return conflicts
+
+
+def flatten_errors(errors, prefix=''):
+    """
+        turns nested serializer errors (e.g. from a list of offers) into "offers[1].loan_amount: message" strings.
+    """
+    if isinstance(errors, dict):
+        for field, errs in errors.items():
+            yield from flatten_errors(errs, f"{prefix}.{field}" if prefix else field)
+    elif errors and all(isinstance(err, str) for err in errors):
+        yield f"{prefix}: {' '.join(errors)}"
+    else:
+        for i, errs in enumerate(errors):
+            yield from flatten_errors(errs, f"{prefix}[{i}]")
+
+
+def loan_eligibility_error(user):
+    """
+        returns why a user may not take a loan at all, or None if they are eligible.
+    """
+    if user.credit_score is None:
+        return "User credit score not found."
+    if user.credit_score < 450:
+        return f"Credit score ({user.credit_score}) is below required minimum (450)."
+    if user.annual_income < Decimal('150000.00'):
+        return f"Annual income ({user.annual_income}) is below required minimum (150000)."
+    return None
+
+
 # Loan application
 class ApplyLoanView(APIView):
     def post(self, request, *args, **kwargs):
@@ -79,15 +134,12 @@ class ApplyLoanView(APIView):
             return Response({"Error": "User not found."}, status=status.HTTP_400_BAD_REQUEST)
 
 
-        if user.credit_score is None:
-            return Response({"Error": "User credit score not found."}, status=status.HTTP_400_BAD_REQUEST)
-        if user.credit_score < 450:
-            return Response({"Error": f"Credit score ({user.credit_score}) is below required minimum (450)."}, status=status.HTTP_400_BAD_REQUEST)
-        if user.annual_income < Decimal('150000.00'):
-            return Response({"Error": f"Annual income ({user.annual_income}) is below required minimum (150000)."}, status=status.HTTP_400_BAD_REQUEST)
+        eligibility_error = loan_eligibility_error(user)
+        if eligibility_error:
+            return Response({"Error": eligibility_error}, status=status.HTTP_400_BAD_REQUEST)
 
         try:
-            emi_schedule_details = calculate_emi_schedule(
+            emi_schedule_details = calculate_emi_schedule_fast(
                 loan_amount=validated_data['loan_amount'],
                 annual_interest_rate=validated_data['interest_rate'],
                 term_months=validated_data['term_period'],
@@ -113,6 +165,7 @@ class ApplyLoanView(APIView):
                     principal_balance=validated_data['loan_amount'],
                     status='Active'
                 )
+                Installment.objects.bulk_create(installments_from_schedule(loan, emi_schedule_details))
 
         except Exception as e:
             logger.error(f"failed to save loan record for user {user.id}: {e}", exc_info=True)
@@ -139,6 +192,48 @@ class ApplyLoanView(APIView):
 
 
 
+# loan quotes
+class QuoteLoansView(APIView):
+    def post(self, request, *args, **kwargs):
+        serializer = LoanQuoteRequestSerializer(data=request.data)
+        if not serializer.is_valid():
+            error_string = "; ".join(flatten_errors(serializer.errors))
+            return Response({"Error": f"Validation Failed: {error_string}"}, status=status.HTTP_400_BAD_REQUEST)
+
+        validated_data = serializer.validated_data
+
+        try:
+            user = User.objects.get(unique_user_id=validated_data['unique_user_id'])
+        except User.DoesNotExist:
+            return Response({"Error": "User not found."}, status=status.HTTP_400_BAD_REQUEST)
+
+        eligibility_error = loan_eligibility_error(user)
+        if eligibility_error:
+            return Response({"Error": eligibility_error}, status=status.HTTP_400_BAD_REQUEST)
+
+        disbursement_date = validated_data.get('disbursement_date') or timezone.localdate()
+        try:
+            quotes = quote_loan_offers(validated_data['offers'], user.annual_income, disbursement_date)
+        except Exception as e:
+            logger.error(f"error at quoting {len(validated_data['offers'])} offers for user {user.id}: {e}", exc_info=True)
+            return Response({"Error": "Failed to calculate EMI schedules beacuse of internal error."}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({
+            "Error": None,
+            "Quotes": [
+                {
+                    "Loan_amount": f"{offer['loan_amount']:.2f}",
+                    "Interest_rate": f"{offer['interest_rate']:.2f}",
+                    "Term_period": offer['term_period'],
+                    "Error": f"Loan rejected: {rejection}" if rejection else None,
+                    "Due_dates": serialize_upcoming_transactions(schedule)
+                }
+                for offer, (schedule, rejection) in zip(validated_data['offers'], quotes)
+            ]
+        }, status=status.HTTP_200_OK)
+
+
+
 # make Payment
 class MakePaymentView(APIView):
     def post(self, request, *args, **kwargs):
@@ -149,158 +244,161 @@ class MakePaymentView(APIView):
 
         validated_data = serializer.validated_data
         loan_id = validated_data['loan_id']
-        payment_amount = validated_data['amount']
-        payment_timestamp = timezone.now()
-
 
         try:
-            with transaction.atomic():
-                try:
-                    loan = Loan.objects.select_for_update().get(loan_id=loan_id)
-                except Loan.DoesNotExist:
-                    return Response({"Error": "loan not found."}, status=status.HTTP_400_BAD_REQUEST)
-
-                if loan.status != 'Active':
-                     return Response({"Error": f"loan is not active (Status: {loan.status})."}, status=status.HTTP_400_BAD_REQUEST)
-
-                outstanding_bills = Bill.objects.select_for_update().filter(
-                    loan=loan,
-                    status__in=[
-                        Bill.BILL_STATUS_CHOICES[0][0],
-                        Bill.BILL_STATUS_CHOICES[2][0],
-                        Bill.BILL_STATUS_CHOICES[3][0]
-                    ]
-                ).order_by('due_date', 'id')
-
-                if not outstanding_bills.exists() and loan.principal_balance <= Decimal('0.00'):
-                    return Response({"Error": "no outstanding amount or bills found for this loan."}, status=status.HTTP_400_BAD_REQUEST)
-
-                remaining_payment = payment_amount
-                principal_reduction_total = Decimal('0.00')
-
-                for bill in outstanding_bills:
-                    if remaining_payment <= Decimal('0.00'):
-                        break
-
-                    amount_due_on_bill = bill.min_due_amount - bill.amount_paid
-                    payment_for_this_bill = min(remaining_payment, amount_due_on_bill)
-
-                    if payment_for_this_bill > Decimal('0.00'):
-                        current_numeric_amount_paid = bill.amount_paid
-                        if current_numeric_amount_paid + payment_for_this_bill >= bill.min_due_amount:
-                             new_status = Bill.BILL_STATUS_CHOICES[1][0] # paid
-                        else:
-                             new_status = Bill.BILL_STATUS_CHOICES[2][0] # partially paid
-
-                        bill.amount_paid = F('amount_paid') + payment_for_this_bill
-                        bill.status = new_status
-                        bill.save(update_fields=['amount_paid', 'status', 'updated_at'])
-                        remaining_payment -= payment_for_this_bill
-
-                if remaining_payment > Decimal('0.00') and loan.principal_balance > Decimal('0.00'):
-                    principal_reduction = min(remaining_payment, loan.principal_balance)
-                    loan.principal_balance = F('principal_balance') - principal_reduction
-                    principal_reduction_total = principal_reduction
-                    loan.save(update_fields=['principal_balance', 'updated_at'])
-                    loan.refresh_from_db()
-
-                Payment.objects.create(
-                    loan=loan,
-                    amount=payment_amount,
-                    payment_date=payment_timestamp
-                )
+            apply_payment(loan_id, validated_data['amount'], validated_data.get('idempotency_key'))
+        except PaymentRejected as e:
+            return Response({"Error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        except Exception as e:
+            logger.error(f"error processing payment for ID {loan_id}: {e}", exc_info=True)
+            return Response({"Error": PAYMENT_INTERNAL_ERROR}, status=status.HTTP_400_BAD_REQUEST)
 
-                has_outstanding_bills = Bill.objects.filter(
-                    loan=loan,
-                    status__in=[
-                        Bill.BILL_STATUS_CHOICES[0][0],
-                        Bill.BILL_STATUS_CHOICES[2][0],
-                        Bill.BILL_STATUS_CHOICES[3][0]
-                    ]
-                ).exists()
+        return Response({"Error": None}, status=status.HTTP_200_OK)
 
-                if loan.principal_balance <= Decimal('0.00') and not has_outstanding_bills:
-                    loan.status = Loan.LOAN_STATUS_CHOICES[2][0] # Closed
-                    loan.save(update_fields=['status', 'updated_at'])
 
-            return Response({"Error": None}, status=status.HTTP_200_OK)
 
-        except Exception as e:
-            logger.error(f"error processing payment for ID {loan_id}: {e}", exc_info=True)
-            return Response({"Error": "payment processing failed due to a internal error."}, status=status.HTTP_400_BAD_REQUEST)
+# make Payments (batch)
+class MakePaymentsView(APIView):
+    def post(self, request, *args, **kwargs):
+        serializer = MakePaymentsSerializer(data=request.data)
+        if not serializer.is_valid():
+            error_string = "; ".join(flatten_errors(serializer.errors))
+            return Response({"Error": f"Validation Failed: {error_string}"}, status=status.HTTP_400_BAD_REQUEST)
+
+        results = []
+        payments = []
+        for row in serializer.validated_data['payments']:
+            row_serializer = MakePaymentSerializer(data=row)
+            if row_serializer.is_valid():
+                payments.append((len(results), row_serializer.validated_data))
+                results.append({"Loan_id": str(row_serializer.validated_data['loan_id']), "Error": None})
+            else:
+                error_string = "; ".join([f"{field}: {' '.join(errs)}" for field, errs in row_serializer.errors.items()])
+                results.append({"Loan_id": str(row.get('loan_id', '')), "Error": f"Validation Failed: {error_string}"})
+
+        errors = apply_payments([
+            (payment['loan_id'], payment['amount'], payment.get('idempotency_key')) for _, payment in payments
+        ])
+        for (i, _), error in zip(payments, errors):
+            results[i]["Error"] = error
+
+        return Response({"Error": None, "Results": results}, status=status.HTTP_200_OK)
 
 
 
 #get statement
-class GetStatementView(APIView):
-    def get(self, request, loan_id, *args, **kwargs):
-        try:
-            loan = Loan.objects.filter(loan_id=loan_id).first()
+STATEMENT_COLUMNS = (
+    'status', 'principal_balance', 'interest_rate', 'term_period', 'disbursement_date',
+    'bills__billing_date', 'bills__principal_component', 'bills__interest_component', 'bills__amount_paid'
+)
 
-            if not loan:
-                return Response({"Error": "loan do not exist."}, status=status.HTTP_404_NOT_FOUND)
 
-            if loan.status == Loan.LOAN_STATUS_CHOICES[2][0]: # Closed
-                 return Response({"Error": "loan is closed."}, status=status.HTTP_400_BAD_REQUEST)
+def statement_rows(loan_id):
+    # loan and its whole bill history in one LEFT JOIN, projected to the columns the statement needs
+    return Loan.objects.filter(loan_id=loan_id).order_by('bills__billing_date').values_list(*STATEMENT_COLUMNS)
 
-            past_transactions_data = []
-            past_bills = Bill.objects.filter(loan=loan).order_by('billing_date')
 
-            for bill in past_bills:
-                past_transactions_data.append({
-                    "Date": bill.billing_date,
-                    "Principal": bill.principal_component,
-                    "Interest": bill.interest_component,
-                    "Amount_paid": bill.amount_paid
-                })
-            past_serializer = PastTransactionSerializer(past_transactions_data, many=True)
+def build_statement(rows):
+    """
+        (status_code, payload) of a statement from its statement_rows(); shared by the sync and async views.
+    """
+    if not rows:
+        return status.HTTP_404_NOT_FOUND, {"Error": "loan do not exist."}
 
-            upcoming_transactions_data = []
-            current_principal = loan.principal_balance
-            daily_rate = loan.interest_rate / (DAYS_IN_YEAR * 100)
+    loan_status, principal_balance, interest_rate, term_period, disbursement_date = rows[0][:5]
 
-            if past_bills.exists():
-                last_known_billing_date = past_bills.last().billing_date
-            else:
-                last_known_billing_date = loan.disbursement_date
+    if loan_status == Loan.LOAN_STATUS_CHOICES[2][0]: # Closed
+        return status.HTTP_400_BAD_REQUEST, {"Error": "loan is closed."}
 
-            cycles_billed = past_bills.count()
-            cycles_remaining = loan.term_period - cycles_billed
-            cycles_to_simulate = max(0, min(cycles_remaining, 24))
-            simulated_billing_date = last_known_billing_date
+    past_bills = [row[5:] for row in rows if row[5] is not None]
 
-            for i in range(cycles_to_simulate):
-                if current_principal <= Decimal('0.00'):
-                    break
+    if past_bills:
+        last_known_billing_date = past_bills[-1][0]
+    else:
+        last_known_billing_date = disbursement_date
 
-                next_billing_date = simulated_billing_date + relativedelta(days=BILLING_CYCLE_DAYS)
-                interest_for_cycle = (current_principal * daily_rate * BILLING_CYCLE_DAYS).quantize(TWOPLACES, rounding=ROUND_HALF_UP)
-                principal_component_raw = current_principal * PRINCIPAL_PERCENTAGE
+    upcoming_transactions = []
+    current_principal = principal_balance
+    cycles_billed = len(past_bills)
+    cycles_remaining = term_period - cycles_billed
+    cycles_to_simulate = max(0, min(cycles_remaining, 24))
+    simulated_billing_date = last_known_billing_date
 
-                if principal_component_raw >= current_principal:
-                    principal_component = current_principal
-                else:
-                    principal_component = principal_component_raw.quantize(TWOPLACES, rounding=ROUND_HALF_UP)
+    for i in range(cycles_to_simulate):
+        if current_principal <= Decimal('0.00'):
+            break
 
-                expected_min_due = (principal_component + interest_for_cycle).quantize(TWOPLACES, rounding=ROUND_HALF_UP)
+        next_billing_date = simulated_billing_date + timedelta(days=BILLING_CYCLE_DAYS)
+        principal_component, interest_for_cycle, expected_min_due = calculate_bill_amounts(current_principal, interest_rate)
+        upcoming_transactions.append((next_billing_date, expected_min_due))
 
-                upcoming_transactions_data.append({
-                    "Date": next_billing_date,
-                    "Amount_due": expected_min_due
-                })
+        current_principal -= principal_component
+        simulated_billing_date = next_billing_date
 
-                current_principal -= principal_component
-                simulated_billing_date = next_billing_date
+    return status.HTTP_200_OK, {
+        "Error": None,
+        "Past_transactions": serialize_past_transactions(past_bills),
+        "Upcoming_transactions": serialize_upcoming_transactions(upcoming_transactions)
+    }
 
-            upcoming_serializer = UpcomingTransactionSerializer(upcoming_transactions_data, many=True)
 
-            response_payload = {
-                "Error": None,
-                "Past_transactions": past_serializer.data,
-                "Upcoming_transactions": upcoming_serializer.data
-            }
-            return Response(response_payload, status=status.HTTP_200_OK)
+STATEMENT_INTERNAL_ERROR = {"Error": "failed to generate statement due to internal error."}
+
+
+class GetStatementView(APIView):
+    def get(self, request, loan_id, *args, **kwargs):
+        try:
+            version = statement_version(loan_id)
+            cached = get_cached_statement(loan_id, version)
+            if cached is not None:
+                return statement_response(cached)
+
+            status_code, payload = build_statement(list(statement_rows(loan_id)))
+            if status_code == status.HTTP_404_NOT_FOUND:
+                return Response(payload, status=status_code)
+            return statement_response(store_statement(loan_id, version, status_code, payload))
+
+        except Exception as e:
+            logger.error(f"Error in generating statement for Loan ID {loan_id}: {e}", exc_info=True)
+            return Response(STATEMENT_INTERNAL_ERROR, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+# async get statement, served under ASGI when ASYNC_READ_VIEWS is set: same responses as GetStatementView, but the
+# cache and the database are awaited, so one worker can keep many statement reads in flight.
+class AsyncGetStatementView(View):
+    http_method_names = ['get', 'options']
+
+    async def get(self, request, loan_id, *args, **kwargs):
+        try:
+            version = await astatement_version(loan_id)
+            cached = await aget_cached_statement(loan_id, version)
+            if cached is not None:
+                return statement_response(cached)
+
+            status_code, payload = build_statement([row async for row in statement_rows(loan_id)])
+            if status_code == status.HTTP_404_NOT_FOUND:
+                return statement_response((status_code, JSONRenderer().render(payload)))
+            return statement_response(await astore_statement(loan_id, version, status_code, payload))
 
         except Exception as e:
             logger.error(f"Error in generating statement for Loan ID {loan_id}: {e}", exc_info=True)
-            return Response({"Error": "failed to generate statement due to internal error."}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
\ No newline at end of file
+            return statement_response((status.HTTP_500_INTERNAL_SERVER_ERROR, JSONRenderer().render(STATEMENT_INTERNAL_ERROR)))
+
+
+# metrics of this process in Prometheus text format, for a scraper holding METRICS_TOKEN or connecting directly
+# from METRICS_ALLOWED_IPS. closed when neither is configured.
+class MetricsView(View):
+    http_method_names = ['get']
+
+    def allowed(self, request) -> bool:
+        if settings.METRICS_TOKEN:
+            expected = f"Bearer {settings.METRICS_TOKEN}".encode()
+            if hmac.compare_digest(request.META.get('HTTP_AUTHORIZATION', '').encode(), expected):
+                return True
+        # REMOTE_ADDR is the proxy's address behind a reverse proxy: only list addresses of direct clients
+        return request.META.get('REMOTE_ADDR') in settings.METRICS_ALLOWED_IPS
+
+    def get(self, request, *args, **kwargs):
+        if not self.allowed(request):
+            return HttpResponse(status=status.HTTP_403_FORBIDDEN)
+        return HttpResponse(render_prometheus(), content_type='text/plain; version=0.0.4; charset=utf-8')